@@ -1,68 +1,158 @@
 import os
 import sys
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from platform import system
-from random import uniform
+from functools import partial
+from itertools import count
 from textwrap import dedent
-from time import sleep
-from typing import Dict, List
+from threading import Lock, local
+from typing import Dict, Iterator, List, Tuple
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import (NoSuchElementException,
+                                        TimeoutException)
 from selenium.webdriver.common.alert import Alert
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.select import Select
-from selenium.webdriver.support.ui import WebDriverWait
 
 from lib.ambiente_inicial import config_smtp
-from controle.matricula_processada import inserir_processada
+from controle.diario_execucao import (ETAPA_CONCLUIDA, ETAPA_CONSULTADA,
+                                      ETAPA_ENVIADA, ETAPA_REGISTRADA,
+                                      finalizar_execucao, iniciar_execucao,
+                                      registrar_etapa, retornar_etapas)
+from controle.matricula_processada import importar_yaml, inserir_processada
+from lib.caixa_saida import CaixaSaida
+from lib.configuracao import (Configuracao, ConfiguracaoInvalida,
+                              configuracao)
 from lib.elemento_web import ArquivoDownload, BuscarElementos
-from lib.envio_email import Email
-from lib.log import logger
-from lib.mineracao import pegar_cadastro_prestadora
+from lib.emissao import ContaBaixada, ControleEmissao
+from lib.envio_email import criar_conexao_smtp
+from lib.espera import (ESTADO_ALERTA, ESTADO_INDEFINIDO, ESTADO_SEM_CONTAS,
+                        ESTADO_VENCIMENTOS,
+                        ESTATISTICA_ESPERA, Disjuntor, EstadoConsulta, Ritmo,
+                        esperar)
+from lib.log import (ROTACAO_DIARIA, ROTACAO_TAMANHO, configurar_log,
+                     definir_contexto, logger)
+from lib.metricas import METRICAS
+from lib.mineracao import (Cadastro, gerar_cadastro_prestadora,
+                           pegar_cadastro_prestadora)
+from lib.perfil_navegador import comparar_perfis, criar_driver
+from lib.pipeline import Estagio, Pipeline
+from lib.pool_navegador import PoolNavegadores, exibir_resumo_execucao
+from lib.segunda_via_http import SegundaViaHttp
 from lib.secret import Criptografia
-from lib.util import ArquivoConfig, SiteOn
+from lib.supervisor_navegador import SupervisorNavegador
+from lib.util import SiteOn
+from lib.vencimento import JanelaVencimento, Vencimento, extrair_tabela
+
+URL_SEGUNDA_VIA = 'https://seguro.cedae.com.br/segunda_via_web/pages/SegundaVia/ENTRADA.aspx'
+# Tentativas de uma matrícula com o navegador reiniciado após a queda da sessão
+TENTATIVAS_SESSAO = 2
+
+
+def criar_caixa_saida(config: Configuracao, workers: int = 2) -> CaixaSaida:
+    """
+    Cria a caixa de saída dos e-mails com a configuração SMTP da execução (envio agrupado e limite
+    de anexos). A entrega de cada conta é registrada no controle (ver confirmar_entrega()).
+    :args
+        {config} [Configuracao] - Configuração da execução.
+        {workers} [int] - Quantidade de envios simultâneos (padrão: 2).
+    :returns
+        CaixaSaida ainda não iniciada.
+    """
+    return CaixaSaida(
+        fabrica_conexao=partial(criar_conexao_smtp, config.smtp),
+        ao_entregar=BotAguaSegundaVia.confirmar_entrega,
+        workers=workers,
+        corpo_html=config.corpo_html,
+        agrupar=config.smtp.agrupar,
+        limite_anexos=config.smtp.limite_anexos,
+        assunto_lote=BotAguaSegundaVia.assunto_lote
+    )
 
 
 class BotAguaSegundaVia(object):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        dir_download: str = '',
+        id_worker: int = 0,
+        motor: str = 'selenium',
+        caixa_saida: CaixaSaida = None,
+        planilha: str = 'AGUA.xlsx',
+        janela: JanelaVencimento = None,
+        ritmo: Ritmo = None,
+        servidor: bool = False,
+        reciclar_a_cada: int = 50,
+        execucao: str = None,
+        config: Configuracao = None,
+        disjuntor: Disjuntor = None,
+        emissao: ControleEmissao = None
+    ) -> None:
         """
         Classe para emissão de segunda via de contas da Companhia Estadual de Água e Esgoto (CEDAE/RJ).
+        :args
+            {dir_download} [str] - Diretório de download do navegador (padrão: ~/Downloads/).
+            {id_worker} [int] - Identificação do worker quando executado em pool (padrão: 0).
+            {motor} [str] - 'selenium' (navegador) ou 'http' (requisições diretas ao formulário).
+                No motor 'http', as matrículas que falharem são reprocessadas pelo navegador.
+            {caixa_saida} [CaixaSaida] - Caixa de saída compartilhada para o envio dos e-mails.
+                Se não informada, o bot cria a sua e aguarda os envios ao encerrar.
+            {planilha} [str] - Arquivo de cadastro: .xlsx, .csv ou .parquet (padrão: AGUA.xlsx).
+            {janela} [JanelaVencimento] - Janela de vencimentos a emitir (padrão: mês corrente).
+            {ritmo} [Ritmo] - Limitador de requisições ao portal, compartilhado no pool (padrão: 0,5 req/s).
+            {servidor} [bool] - Navegador sem janela e sem imagens, fontes e CSS (padrão: False).
+            {reciclar_a_cada} [int] - Matrículas por sessão do navegador antes de reciclá-lo (padrão: 50).
+            {execucao} [str] - Execução do diário em que as etapas são registradas (ver iniciar_execucao()).
+                Se não informada, o bot inicia e finaliza a sua.
+            {config} [Configuracao] - Configuração da execução (padrão: carregada de config/).
+                Uma configuração inválida lança ConfiguracaoInvalida antes de o navegador iniciar.
+            {disjuntor} [Disjuntor] - Disjuntor do portal, compartilhado no pool: suspende as consultas
+                enquanto o portal estiver instável (padrão: um disjuntor próprio).
+            {emissao} [ControleEmissao] - Controle das contas e resultados, compartilhado com o
+                pipeline; já carregado por quem o informa (padrão: um controle próprio).
         :methods
             baixar_segunda_via()
+            processar_matricula()
             verificar_conteudo_pagina()
             processar_vencimento()
+            encerrar()
         """
-        self.__dir_download: str = os.path.expanduser(
+        self.__dir_download: str = dir_download or os.path.expanduser(
             '~') + os.sep + 'Downloads' + os.sep
-
-        # Definição do Browser
-        config_chrome: webdriver = webdriver.ChromeOptions()
-
-        preferencias_chrome: dict = {
-            'download.default_directory': self.dir_download,
-            # 'directory_upgrade': True,
-            # 'safebrowsing, enable': True
-        }
-
-        config_chrome.add_experimental_option('prefs', preferencias_chrome)
-        # Define o path do driver de acordo com sistema operacional
-        if system() == 'Linux':
-            path_driver: object = Service(
-                os.getcwd()+os.sep+'chromedriver_linux')
-        elif system() == 'Windows':
-            path_driver: object = Service(
-                os.getcwd()+os.sep+'chromedriver_win.exe')
-
-        logger.info(f'Sistema operacional: {system()}')
-        self.__driver: object = webdriver.Chrome(
-            service=path_driver,
-            options=config_chrome
+        self.__id_worker: int = id_worker
+        self.__motor: str = motor
+        self.__planilha: str = planilha
+        self.__janela: JanelaVencimento = janela or JanelaVencimento()
+        self.__ritmo: Ritmo = ritmo or Ritmo()
+        self.__servidor: bool = servidor
+        self.__execucao_propria: bool = execucao is None
+        self.__config: Configuracao = config or configuracao()
+        self.__disjuntor: Disjuntor = disjuntor or Disjuntor()
+        self.__emissao_propria: bool = emissao is None
+        self.__emissao: ControleEmissao = emissao or ControleEmissao(
+            dir_download=self.__dir_download,
+            janela=self.__janela,
+            remetente=self.__config.remetente,
+            execucao=execucao
+        )
+        # Tabela de vencimentos extraída do portal, por matrícula
+        self.__tabela_vencimentos: Dict[str, List[Vencimento]] = dict()
+        self.__supervisor = SupervisorNavegador(
+            fabrica=self.__iniciar_navegador,
+            reciclar_a_cada=reciclar_a_cada
         )
+        self.__caixa_propria: bool = caixa_saida is None
+        self.__caixa_saida: CaixaSaida = caixa_saida
+        self.__cadastro: Cadastro = None
+        # No motor HTTP o navegador só é iniciado se alguma matrícula precisar do fallback
+        if self.motor == 'selenium':
+            self.__supervisor.driver
 
-        self.driver.maximize_window()
+    def __iniciar_navegador(self):
+        """ Inicia o WebDriver do Chrome configurado para o diretório de download do bot. """
+        return criar_driver(
+            self.dir_download, servidor=self.servidor, id_worker=self.id_worker)
 
     @property
     def dir_download(self):
@@ -70,9 +160,75 @@ class BotAguaSegundaVia(object):
 
     @property
     def driver(self):
-        return self.__driver
+        return self.__supervisor.driver
+
+    @property
+    def motor(self):
+        return self.__motor
+
+    @property
+    def planilha(self):
+        return self.__planilha
+
+    @property
+    def janela(self):
+        return self.__janela
+
+    @property
+    def ritmo(self):
+        return self.__ritmo
 
-    def baixar_segunda_via(self, url: str) -> bool:
+    @property
+    def servidor(self):
+        return self.__servidor
+
+    @property
+    def execucao(self):
+        return self.__emissao.execucao
+
+    @property
+    def config(self):
+        return self.__config
+
+    @property
+    def disjuntor(self):
+        return self.__disjuntor
+
+    @property
+    def cadastro(self):
+        return self.__cadastro
+
+    @cadastro.setter
+    def cadastro(self, cadastro: Cadastro) -> None:
+        """ Matrícula corrente do bot, também gravada no contexto do log da thread. """
+        self.__cadastro = cadastro
+        definir_contexto(matricula=cadastro.matricula if cadastro else None)
+
+    @property
+    def tabela_vencimentos(self):
+        return self.__tabela_vencimentos
+
+    @property
+    def caixa_saida(self):
+        """ Caixa de saída dos e-mails, iniciada na primeira conta baixada quando o bot é o dono. """
+        if self.__caixa_saida is None:
+            self.__caixa_saida = criar_caixa_saida(self.config)
+            self.__caixa_saida.iniciar()
+        return self.__caixa_saida
+
+    @property
+    def id_worker(self):
+        return self.__id_worker
+
+    @property
+    def resultados(self):
+        return self.__emissao.resultados
+
+    def baixar_segunda_via(
+        self,
+        url: str,
+        cadastro_clientes: List[Cadastro] = None
+    ) -> bool:
         """
         Abre o navegador na página de emissão de segunda via da prestadora,
         baixa a segunda via da conta, renomeia o arquivo com o padrão:
@@ -80,6 +236,8 @@ class BotAguaSegundaVia(object):
         e registra o processamento no controle para não haver repetição de envio.
         :args
             {url} [str] - Endereço da URL para testar se o serviço está respondendo.
+            {cadastro_clientes} [list] - Cadastro já carregado (usado pelo pool de workers).
+                Se não informado, é carregado da planilha do bot (padrão: AGUA.xlsx).
         :returns
             Booleano [bool] se obteve sucesso na emissão.
         """
@@ -87,265 +245,402 @@ class BotAguaSegundaVia(object):
         if not SiteOn(url).verificar():
             logger.critical(
                 'Erro ao carregar a URL. 1) ela pode ter mudado ou 2) o serviço pode estar momentâneamente indisponível.')
-            self.driver.quit()
+            self.encerrar()
             return False
-        logger.info('Carregando dados da planilha de cadastro...')
-        # Retorna, da planilha, o cadastro dos clientes na prestadora
-        cadastro_clientes: List[Dict[str, str]
-                                ] = pegar_cadastro_prestadora(arquivo='AGUA.xlsx')
+        if cadastro_clientes is None:
+            logger.info('Carregando dados da planilha de cadastro...')
+            # Retorna, da planilha, o cadastro dos clientes na prestadora
+            cadastro_clientes = pegar_cadastro_prestadora(
+                arquivo=self.planilha, usar_cache=True)
         if not cadastro_clientes:
-            self.driver.quit()
+            self.encerrar()
             return False
+        if self.__emissao_propria:
+            self.__emissao.carregar()
+        if self.__execucao_propria:
+            self.__emissao.execucao = iniciar_execucao()
+        definir_contexto(execucao=self.execucao, worker=self.id_worker)
+        cadastro_clientes = self.__retomar_execucao(cadastro_clientes)
+        if self.motor == 'http':
+            cadastro_clientes = self.__processar_http(url, cadastro_clientes)
+            if cadastro_clientes:
+                logger.warning(
+                    f'{len(cadastro_clientes)} matrícula(s) serão reprocessadas pelo navegador.')
+        for cadastro in cadastro_clientes:
+            self.processar_matricula(url, cadastro)
+        self.encerrar()
+        if self.__execucao_propria:
+            finalizar_execucao(self.execucao)
+        return True
+
+    def processar_matricula(self, url: str, cadastro: Cadastro) -> None:
+        """
+        Processa uma matrícula pelo navegador, se o disjuntor do portal liberar a consulta.
+        :args
+            {url} [str] - Endereço da página de emissão da segunda via.
+            {cadastro} [Cadastro] - Matrícula a processar.
+        :returns
+            Nenhum.
+        """
+        self.cadastro = cadastro
+        if not self.disjuntor.liberar(url):
+            self.__registrar_resultado(status='FALHA! Portal indisponível.')
+            return
+        logger.info(
+            f'Processando matrícula de {self.cadastro.cliente}...')
+        self.__processar_supervisionado(url)
+
+    def __retomar_execucao(self, cadastro_clientes: List[Cadastro]) -> List[Cadastro]:
+        """
+        Retoma a execução do diário: descarta as matrículas concluídas e entrega as contas
+        já baixadas, sem acessar o portal. As contas já na caixa de saída ficam com ela.
+        :args
+            {cadastro_clientes} [list] - Cadastro dos clientes.
+        :returns
+            Cadastro das matrículas ainda não concluídas na execução.
+        """
+        diario = retornar_etapas(self.execucao)
+        if not diario:
+            return cadastro_clientes
+        # Recarrega os envios pendentes da execução interrompida
+        self.caixa_saida
+        pendentes: List[Cadastro] = list()
         for self.cadastro in cadastro_clientes:
+            etapas = diario.get(self.cadastro.matricula, dict())
+            for conta in self.__emissao.retomar(self.cadastro, etapas):
+                self.__emissao.entregar(conta, self.caixa_saida)
+            if etapas.get('', ('',))[0] != ETAPA_CONCLUIDA:
+                pendentes.append(self.cadastro)
+        logger.info(
+            f'Retomada: {len(cadastro_clientes) - len(pendentes)} matrícula(s) já concluída(s) nesta execução.')
+        return pendentes
+
+    def __registrar_etapa(self, etapa: str, vencimento: str = '', arquivo: str = None) -> None:
+        """ Registra no diário a etapa da matrícula corrente ou de uma de suas contas. """
+        registrar_etapa(
+            self.execucao, self.cadastro.matricula, etapa,
+            vencimento=vencimento, arquivo=arquivo)
+
+    def encerrar(self) -> None:
+        """
+        Fecha o navegador, se ele tiver sido iniciado, e aguarda os envios da caixa de saída própria.
+        """
+        if self.__supervisor.ativo:
+            self.__supervisor.encerrar()
+            ESTATISTICA_ESPERA.salvar()
+        if self.__caixa_propria and self.__caixa_saida is not None:
+            logger.info('Aguardando o envio dos e-mails pendentes...')
+            self.resultados.extend(self.__caixa_saida.aguardar())
+
+    def __processar_http(
+        self,
+        url: str,
+        cadastro_clientes: List[Cadastro]
+    ) -> List[Cadastro]:
+        """
+        Processa as matrículas pelo motor HTTP, sem navegador.
+        :args
+            {url} [str] - Endereço da página de emissão da segunda via.
+            {cadastro_clientes} [list] - Cadastro dos clientes.
+        :returns
+            Lista das matrículas que falharam e devem ser reprocessadas pelo navegador.
+        """
+        motor_http = SegundaViaHttp(url)
+        fallback: List[Cadastro] = list()
+        for self.cadastro in cadastro_clientes:
+            if not self.disjuntor.liberar(url):
+                self.__registrar_resultado(status='FALHA! Portal indisponível.')
+                continue
             logger.info(
-                f'Processando matrícula de {self.cadastro["cliente"]}...')
-            # O site não é a página principal por ser um iFrame. Trabalhar direto na página de emissão é mais produtivo.
-            self.driver.get(url)
-            """
-            Além da documentação oficial, o site
-            http://pythonclub.com.br/selenium-parte-4.html
-            é uma boa consulta sobre função de espera.
-            """
-            # Elemento MATRICULA
+                f'Processando matrícula de {self.cadastro.cliente} (HTTP)...')
             try:
-                matricula = BuscarElementos(
-                    driver=self.driver,
-                    locator=(By.ID, 'MATRICULA')
-                ).buscar()
-            except:
-                pass
-            else:
-                matricula.send_keys(self.cadastro['matricula'])
-            # Elemento DOCUMENTO
-            if self.cadastro['documento']:
-                try:
-                    documento = BuscarElementos(
-                        driver=self.driver,
-                        locator=(By.ID, 'FC01_CPF')
-                    ).buscar()
-                except:
-                    pass
-                else:
-                    documento.send_keys(self.cadastro['documento'])
-            # Elemento BOTÃO SOLICITAR
+                # Cada conta é entregue à caixa de saída assim que baixada
+                if not self.__emissao.buscar_http(
+                    motor_http, self.cadastro, self.ritmo, self.disjuntor,
+                    ao_baixar=partial(self.__emissao.entregar, caixa_saida=self.caixa_saida)
+                ):
+                    BotAguaSegundaVia.__exibir_resumo(
+                        self.cadastro.cliente,
+                        self.cadastro.matricula,
+                        self.cadastro.documento,
+                        status='FALHA! Alerta de Documento inválido.'
+                    )
+            except Exception as e:
+                logger.error(
+                    f'Falha no motor HTTP para a matrícula {self.cadastro.matricula}: {e}')
+                self.disjuntor.registrar_falha()
+                fallback.append(self.cadastro)
+        return fallback
+
+    def __processar_supervisionado(self, url: str) -> None:
+        """
+        Processa a matrícula corrente pelo navegador sob o supervisor da sessão.
+        Se a sessão cair ou travar, o navegador é reiniciado e a mesma matrícula é retomada;
+        as contas já entregues dela são descartadas pelo controle por conta.
+        :args
+            {url} [str] - Endereço da página de emissão da segunda via.
+        :returns
+            Nenhum.
+        """
+        for tentativa in range(1, TENTATIVAS_SESSAO + 1):
             try:
-                botao_solicitar = BuscarElementos(
+                self.__supervisor.preparar()
+                self.__processar_selenium(url)
+                return
+            except Exception as e:
+                if self.__supervisor.saudavel():
+                    # Só a página que não carregou ou veio fora do padrão indica o portal instável
+                    if isinstance(e, (NoSuchElementException, TimeoutException)):
+                        self.disjuntor.registrar_falha()
+                    logger.error(
+                        f'Falha ao processar a matrícula {self.cadastro.matricula}: {e}')
+                    self.__registrar_resultado(
+                        status='FALHA! Página de emissão fora do padrão.')
+                    return
+                logger.warning(
+                    f'Sessão do navegador perdida na matrícula {self.cadastro.matricula} (tentativa {tentativa}): {e}')
+                self.__supervisor.reiniciar()
+        self.__registrar_resultado(status='FALHA! Navegador não respondeu.')
+
+    def __processar_selenium(self, url: str) -> None:
+        """
+        Processa a matrícula corrente (self.cadastro) pelo navegador.
+        :args
+            {url} [str] - Endereço da página de emissão da segunda via.
+        :returns
+            Nenhum.
+        """
+        # O site não é a página principal por ser um iFrame. Trabalhar direto na página de emissão é mais produtivo.
+        self.ritmo.aguardar()
+        with METRICAS.medir('carga_pagina'):
+            self.driver.get(url)
+        """
+        Além da documentação oficial, o site
+        http://pythonclub.com.br/selenium-parte-4.html
+        é uma boa consulta sobre função de espera.
+        """
+        # Elemento MATRICULA
+        matricula = BuscarElementos(
+            driver=self.driver,
+            locator=(By.ID, 'MATRICULA')
+        ).buscar()
+        if not matricula:
+            raise NoSuchElementException('Campo MATRICULA não encontrado.')
+        matricula.send_keys(self.cadastro.matricula)
+        # Elemento DOCUMENTO
+        if self.cadastro.documento:
+            try:
+                documento = BuscarElementos(
                     driver=self.driver,
-                    locator=(By.ID, 'btncpfvalida')
+                    locator=(By.ID, 'FC01_CPF')
                 ).buscar()
             except:
                 pass
             else:
-                botao_solicitar.click()
-                alerta = Alert(self.driver)
-                try:
-                    texto = alerta.text
-                except:
-                    pass
-                else:
-                    logger.error(
-                        'A página emitiu um alerta de documento inválido!')
-                    if texto:
-                        alerta.accept()
-                        BotAguaSegundaVia.__exibir_resumo(
-                            self.cadastro['cliente'],
-                            self.cadastro['matricula'],
-                            self.cadastro['documento'],
-                            status='FALHA! Alerta de Documento inválido.'
-                        )
-                        continue
-                    else:
-                        pass
-            # Verificar se há vencimento ou se página está em branco
-            sem_dados_a_processar = self.verificar_conteudo_pagina()
-            if sem_dados_a_processar:
-                # Retorna pro loop e processa o próximo
-                continue
-            # Processar vencimentos na página
-            try:
-                self.processar_vencimento()
-            except:
-                pass
-        self.driver.quit()
-        return True
-
-    def verificar_conteudo_pagina(self):
-        """
-        Verifica se a página tem dados à processar ou apenas a mensagem Continuação...
-        """
-        dados_pagina = BuscarElementos(
+                documento.send_keys(self.cadastro.documento)
+        # Elemento BOTÃO SOLICITAR
+        botao_solicitar = BuscarElementos(
             driver=self.driver,
-            locator=(By.CLASS_NAME, 'colVenc'),
-            excecao=False
+            locator=(By.ID, 'btncpfvalida')
         ).buscar()
-        if len(dados_pagina) < 2:
-            # Página sem vencimentos ou apenas com o título 'Continuação...'
-            return True
+        if not botao_solicitar:
+            raise NoSuchElementException('Botão btncpfvalida não encontrado.')
+        botao_solicitar.click()
+        # Verificar se houve alerta, se há vencimento ou se a página está em branco
+        with METRICAS.medir('consulta', motor='selenium'):
+            estado = self.verificar_conteudo_pagina(botao_solicitar)
+        if estado == ESTADO_INDEFINIDO:
+            self.disjuntor.registrar_falha()
         else:
-            return False
+            self.disjuntor.registrar_sucesso()
+        if estado == ESTADO_ALERTA:
+            logger.error('A página emitiu um alerta de documento inválido!')
+            Alert(self.driver).accept()
+            self.__registrar_resultado(
+                status='FALHA! Alerta de Documento inválido.')
+            BotAguaSegundaVia.__exibir_resumo(
+                self.cadastro.cliente,
+                self.cadastro.matricula,
+                self.cadastro.documento,
+                status='FALHA! Alerta de Documento inválido.'
+            )
+            self.__registrar_etapa(ETAPA_CONCLUIDA)
+            return
+        if estado == ESTADO_INDEFINIDO:
+            # Sem etapa concluída: a matrícula volta a ser consultada pelo --resume
+            logger.error(
+                f'A consulta da matrícula {self.cadastro.matricula} não retornou uma página reconhecida.')
+            self.__registrar_resultado(
+                status='FALHA! Página de emissão fora do padrão.')
+            return
+        if estado != ESTADO_VENCIMENTOS:
+            if estado == ESTADO_SEM_CONTAS:
+                self.__registrar_etapa(ETAPA_CONCLUIDA)
+            # Retorna pro loop e processa o próximo
+            return
+        # Processar vencimentos na página
+        try:
+            self.processar_vencimento()
+            self.__registrar_etapa(ETAPA_CONCLUIDA)
+        except Exception as e:
+            if not self.__supervisor.saudavel():
+                # Retomada da matrícula pelo supervisor
+                raise
+            logger.error(
+                f'Falha ao processar os vencimentos da matrícula {self.cadastro.matricula}: {e}')
+
+    def verificar_conteudo_pagina(self, botao_solicitar) -> str:
+        """
+        Aguarda o resultado da solicitação com uma condição combinada, que reconhece cedo
+        o alerta de documento inválido e a página sem vencimentos (ou apenas com a mensagem Continuação...).
+        :args
+            {botao_solicitar} - Elemento btncpfvalida já clicado.
+        :returns
+            [str] - ESTADO_ALERTA, ESTADO_VENCIMENTOS, ESTADO_SEM_CONTAS ou ESTADO_INDEFINIDO.
+        """
+        try:
+            return esperar(
+                self.driver,
+                EstadoConsulta(botao_solicitar),
+                chave='resultado_consulta'
+            )
+        except TimeoutException:
+            logger.error('Tempo expirou aguardando o resultado da solicitação.')
+            return ESTADO_INDEFINIDO
 
     def processar_vencimento(self):
         """
-        Processa todos os vencimentos cujos mês/ano sejam iguais aos da data atual.
+        Extrai a tabela de vencimentos de todas as páginas (Proxima1) e processa as contas
+        cujo vencimento esteja na janela de emissão (padrão: mês corrente).
+        Cada página é lida com uma única chamada ao navegador (extrair_tabela); o navegador
+        só é acionado de novo para selecionar o motivo e clicar no download.
         """
-        # Busca todas as colunas de vencimento na página
+        pagina = 1
+        self.__registrar_etapa(ETAPA_CONSULTADA)
         while True:
-            try:
-                vencimentos = BuscarElementos(
-                    driver=self.driver,
-                    locator=(By.CLASS_NAME, 'colVenc')
-                ).buscar()
-            except:
-                pass
-            else:
-                hoje = datetime.today()
-                data_vencimento = ''
-                for i, vencimento in enumerate(vencimentos):
-                    try:
-                        vencimento_date = datetime.strptime(
-                            vencimento.text, '%d/%m/%y').date()
-                    except:
-                        continue
-                    else:
-                        try:
-                            if vencimento_date.month == hoje.month and vencimento_date.year == hoje.year:
-                                linha_continuacao = BuscarElementos(
-                                    driver=self.driver,
-                                    locator=(By.ID, 'linha_continuacao'),
-                                    excecao=False
-                                ).buscar()
-                                linha_vencimento = i
-                                if linha_continuacao:
-                                    linha_vencimento += 1
-                                data_vencimento = vencimento.text
-                                elemento_motivo = 'DRLMOTIVO' + \
-                                    str(linha_vencimento)
-                            else:
-                                continue
-                        except:
-                            continue
-                        else:
-                            # Elemento MOTIVO
-                            try:
-                                wait = WebDriverWait(self.driver, 20)
-                                motivo = Select(
-                                    wait.until(
-                                        EC.visibility_of_element_located(
-                                            (By.NAME, elemento_motivo))
-                                    )
-                                )
-                                motivo.select_by_index(1)
-                            except:
-                                pass
-                            else:
-                                # Elemento BAIXAR DOCUMENTO
-                                elemento_baixar: str = ''
-                                if self.cadastro['documento']:
-                                    elemento_baixar: str = 'EPortalLinkImp' + \
-                                        str(linha_vencimento)
-                                else:
-                                    elemento_baixar: str = 'LinkBar' + \
-                                        str(linha_vencimento)
-                                # Elemento BAIXAR
-                                try:
-                                    baixar = wait.until(
-                                        EC.visibility_of_element_located(
-                                            (By.ID, elemento_baixar)
-                                        )
-                                    )
-                                except Exception as e:
-                                    print(f'Erro: {e}')
-                                else:
-                                    baixar.click()
-                                    logger.info('Gerando arquivo PDF...')
-                                    arquivo_conta = self.__renomear_arquivo(
-                                        cliente=self.cadastro['cliente'],
-                                        matricula=self.cadastro['matricula'],
-                                        vencimento=data_vencimento
-                                    )
-                                    # Envia e-mail da conta
-                                    logger.info('Enviando e-mail...')
-                                    conf_smtp = ArquivoConfig(
-                                        'smtp.yaml').carregar_arquivo()
-                                    enviar_email: Email = Email(
-                                        host=conf_smtp['host'],
-                                        port=conf_smtp['porta'],
-                                        user=conf_smtp['usuario'],
-                                        pwd=Criptografia().decriptar(
-                                            conf_smtp['senha']
-                                        ),
-                                        de='robo@conectasolucoes.com.br',
-                                        para=[self.cadastro['email']],
-                                        assunto=f'Segunda via CEDAE <-> {self.cadastro["cliente"]}-{self.cadastro["matricula"].replace("-", "")}',
-                                        corpo_html='config/corpo_email.html',
-                                        anexo=arquivo_conta
-                                    ).enviar()
-                                    if not enviar_email:
-                                        self.driver.quit()
-                                        return False
-                                    else:
-                                        logger.info(
-                                            'Registrando matrícula no controle de dados processados.')
-                                        inserir_processada(
-                                            matricula=self.cadastro['matricula'],
-                                            cliente=self.cadastro['cliente'],
-                                            documento=self.cadastro['documento'])
-                                        # Exibe resumo da tarefa
-                                        BotAguaSegundaVia.__exibir_resumo(
-                                            cliente=self.cadastro['cliente'],
-                                            matricula=self.cadastro['matricula'],
-                                            documento=self.cadastro['documento'],
-                                            vencimento=data_vencimento,
-                                            email=self.cadastro['email'],
-                                            status='Concluída com sucesso!')
-                                        logger.info(
-                                            'Processamento da matrícula finalizado.')
-            # Pausa randômica anti-bloqueio
-            sleep(uniform(1, 5))
-            # Avança para próxima página, se houver
-            try:
-                proxima_pagina = BuscarElementos(
-                    driver=self.driver,
-                    locator=(By.ID, 'Proxima1'),
-                    excecao=False
-                ).buscar()
-            except:
+            tabela, existe_proxima = extrair_tabela(self.driver, pagina)
+            self.tabela_vencimentos.setdefault(
+                self.cadastro.matricula, list()).extend(tabela)
+            for vencimento in tabela:
+                if not self.janela.contem(vencimento.data) \
+                        or self.__emissao.processada(self.cadastro.matricula, vencimento.texto):
+                    continue
+                self.__baixar_vencimento(vencimento)
+            if not existe_proxima:
                 break
-            else:
-                proxima_pagina.click()
+            # Ritmo anti-bloqueio compartilhado entre os workers
+            self.ritmo.aguardar()
+            # Avança para próxima página e aguarda a nova tabela
+            proxima_pagina = self.driver.find_element(By.ID, 'Proxima1')
+            proxima_pagina.click()
+            esperar(self.driver, EC.staleness_of(proxima_pagina),
+                    chave='proxima_pagina')
+            if not self.__aguardar_tabela():
+                break
+            pagina += 1
+        logger.info(
+            f'{len(self.tabela_vencimentos[self.cadastro.matricula])} vencimento(s) encontrado(s) para a matrícula {self.cadastro.matricula}.')
 
-    def __renomear_arquivo(
-        self,
-        cliente: str,
-        matricula: str,
-        vencimento: str
-    ) -> str:
+    def __aguardar_tabela(self) -> bool:
+        """ Aguarda a tabela de vencimentos (colVenc) ficar visível após a troca de página. """
+        return bool(BuscarElementos(
+            driver=self.driver,
+            locator=(By.CLASS_NAME, 'colVenc'),
+            lista_de_um=True
+        ).buscar())
+
+    def __baixar_vencimento(self, vencimento: Vencimento) -> None:
         """
-        Renomeia o arquivo baixado para o padrão definido.
+        Seleciona o motivo da emissão, baixa o PDF da linha e o envia para a caixa de saída.
         :args
-            {cliente} [str] - Nome do cliente na planilha de dados.
-            {matricula} [str] - Número da matrícula na planilha de dados.
-            {vencimento} [str] - Data de vencimento da conta extraído do site da prestadora.
+            {vencimento} [Vencimento] - Linha da tabela de vencimentos.
         :returns
-            [str] - Nome do arquivo com seu caminho absoluto.
-
-            O nome final do arquivo será:
-            NomeCliente-NúmeroMatrícula-DataVencimento.pdf
+            Nenhum.
         """
+        elemento_baixar: str = vencimento.link_imp if self.cadastro.documento else vencimento.link_bar
+        if not vencimento.motivo or not elemento_baixar:
+            logger.error(
+                f'Motivo ou link de download ausente para o vencimento {vencimento.texto}.')
+            return
         try:
-            matricula_replace: str = matricula.replace('-', '')
-            vencimento_replace: str = vencimento.replace('/', '-')
-            nome_arquivo: str = cliente + '-' + \
-                matricula_replace + '-' + vencimento_replace + '.pdf'
-            conta: str = self.dir_download + \
-                ArquivoDownload(self.driver).arquivo()
-            conta_renomeada: str = self.dir_download + nome_arquivo
-            os.replace(conta, conta_renomeada)
-            logger.info(f'Arquivo {conta_renomeada} processado com sucesso!')
-            return conta_renomeada
+            # Elemento MOTIVO
+            Select(self.driver.find_element(
+                By.NAME, vencimento.motivo)).select_by_index(1)
+            # Elemento BAIXAR DOCUMENTO, exibido após a seleção do motivo
+            baixar = esperar(
+                self.driver,
+                EC.visibility_of_element_located((By.ID, elemento_baixar)),
+                chave='link_download'
+            )
         except Exception as e:
-            logger.error(f'Erro ao processar o arquivo PDF: {e}')
-            return ''
+            logger.error(
+                f'Falha ao preparar o download do vencimento {vencimento.texto}: {e}')
+            return
+        download = ArquivoDownload(self.dir_download)
+        download.marcar()
+        baixar.click()
+        logger.info('Gerando arquivo PDF...')
+        self.__emissao.entregar(
+            ContaBaixada(self.cadastro, vencimento.texto, download.arquivo()), self.caixa_saida)
+
+    @staticmethod
+    def assunto_lote(tarefas: List[Dict[str, str]]) -> str:
+        """
+        Assunto da mensagem que reúne as contas de várias matrículas de um mesmo destinatário.
+        :args
+            {tarefas} [list] - Tarefas da caixa de saída incluídas na mensagem.
+        :returns
+            Assunto da mensagem.
+        """
+        matriculas = dict.fromkeys(tarefa['matricula'].replace('-', '') for tarefa in tarefas)
+        return f'Segundas vias CEDAE <-> {len(tarefas)} conta(s) de {len(matriculas)} matrícula(s): ' \
+            + ', '.join(matriculas)
+
+    @staticmethod
+    def confirmar_entrega(tarefa: Dict[str, str]) -> None:
+        """
+        Callback da caixa de saída: registra a matrícula no controle após a confirmação do envio.
+        :args
+            {tarefa} [dict] - Tarefa entregue pela caixa de saída.
+        :returns
+            Nenhum.
+        """
+        registrar_etapa(
+            tarefa.get('execucao'), tarefa['matricula'], ETAPA_ENVIADA,
+            vencimento=tarefa['vencimento'])
+        logger.info('Registrando matrícula no controle de dados processados.')
+        inserir_processada(
+            matricula=tarefa['matricula'],
+            cliente=tarefa['cliente'],
+            documento=tarefa['documento'],
+            vencimento=tarefa['vencimento'],
+            hash_pdf=tarefa.get('hash_pdf'),
+            valor=tarefa.get('valor'),
+            linha_digitavel=tarefa.get('linha_digitavel'))
+        registrar_etapa(
+            tarefa.get('execucao'), tarefa['matricula'], ETAPA_REGISTRADA,
+            vencimento=tarefa['vencimento'])
+        METRICAS.incrementar('contas_enviadas_total')
+        # Exibe resumo da tarefa
+        BotAguaSegundaVia.__exibir_resumo(
+            cliente=tarefa['cliente'],
+            matricula=tarefa['matricula'],
+            documento=tarefa['documento'],
+            vencimento=tarefa['vencimento'],
+            email=', '.join(tarefa['para']),
+            status='Concluída com sucesso!')
+        logger.info('Processamento da matrícula finalizado.')
+
+    def __registrar_resultado(self, vencimento: str = '', status: str = '') -> None:
+        """
+        Registra o resultado da matrícula corrente para o resumo consolidado da execução.
+        :args
+            {vencimento} [str] - Vencimento extraído do site da prestadora.
+            {status} [str] - Mensagem de status do processamento.
+        :returns
+            Nenhum.
+        """
+        self.__emissao.registrar_resultado(self.cadastro, vencimento, status)
 
     @staticmethod
     def __exibir_resumo(
@@ -387,6 +682,269 @@ class BotAguaSegundaVia(object):
         )
 
 
+class PipelineSegundaVia(object):
+    def __init__(
+        self,
+        url: str,
+        dir_download: str = '',
+        janela: JanelaVencimento = None,
+        ritmo: Ritmo = None,
+        execucao: str = None,
+        config: Configuracao = None,
+        buscas: int = 2,
+        envios: int = 2,
+        servidor: bool = False,
+        disjuntor: Disjuntor = None,
+        processos: int = 0,
+        motor: str = 'selenium'
+    ) -> None:
+        """
+        Emissão em pipeline: leitura do cadastro, busca das contas, pós-processamento (renomeação,
+        validação e hash) e enfileiramento na caixa de saída, cada etapa com sua própria
+        concorrência e ligadas por filas limitadas (ver lib.pipeline). O envio e o registro no
+        controle ficam com a caixa de saída, com as suas novas tentativas e o envio agrupado.
+        No motor HTTP, as matrículas que falharem são reprocessadas pelo navegador ao final.
+        :args
+            {url} [str] - Endereço da página de emissão da segunda via.
+            {dir_download} [str] - Diretório dos PDFs (padrão: ~/Downloads/).
+            {janela} [JanelaVencimento] - Janela de vencimentos a emitir (padrão: mês corrente).
+            {ritmo} [Ritmo] - Limitador de requisições ao portal (padrão: 0,5 req/s).
+            {execucao} [str] - Execução do diário em que as etapas são registradas.
+            {config} [Configuracao] - Configuração da execução (padrão: carregada de config/).
+            {buscas} [int] - Consultas simultâneas ao portal; no motor selenium, navegadores (padrão: 2).
+            {envios} [int] - Envios de e-mail simultâneos da caixa de saída (padrão: 2).
+            {servidor} [bool] - Navegadores no modo servidor (padrão: False).
+            {disjuntor} [Disjuntor] - Disjuntor do portal, consultado antes de cada busca (padrão: um próprio).
+            {processos} [int] - Processos que validam os PDFs em paralelo; 0 valida na própria
+                thread do pós-processamento (padrão: 0).
+            {motor} [str] - Motor da busca: 'selenium' (um navegador por busca) ou 'http' (padrão: 'selenium',
+                como no bot).
+        :methods
+            executar()
+        """
+        self.__url: str = url
+        self.__dir_download: str = dir_download or os.path.expanduser(
+            '~') + os.sep + 'Downloads' + os.sep
+        self.__janela: JanelaVencimento = janela or JanelaVencimento()
+        self.__ritmo: Ritmo = ritmo or Ritmo()
+        self.__config: Configuracao = config or configuracao()
+        self.__buscas: int = max(1, buscas)
+        self.__envios: int = max(1, envios)
+        self.__servidor: bool = servidor
+        self.__disjuntor: Disjuntor = disjuntor or Disjuntor()
+        self.__processos: int = max(0, processos)
+        self.__motor: str = motor
+        self.__emissao = ControleEmissao(
+            dir_download=self.__dir_download,
+            janela=self.__janela,
+            remetente=self.__config.remetente,
+            execucao=execucao
+        )
+        self.__caixa_saida: CaixaSaida = None
+        self.__validador: ProcessPoolExecutor = None
+        self.__fallback: List[Cadastro] = list()
+        # Contas ainda não enfileiradas de cada matrícula consultada; ao zerar, ela é concluída
+        self.__pendentes: Dict[str, int] = dict()
+        self.__diario: Dict[str, Dict[str, Tuple[str, str]]] = dict()
+        self.__trava = Lock()
+        # Sessão HTTP (ou navegador, no motor selenium) de cada thread de busca
+        self.__recursos = local()
+        self.__bots: List[BotAguaSegundaVia] = list()
+        # Identificação (e diretório e perfil) de cada navegador; não é reaproveitada se ele falhar
+        self.__ids_worker = count(1)
+
+    @property
+    def dir_download(self):
+        return self.__dir_download
+
+    @property
+    def execucao(self):
+        return self.__emissao.execucao
+
+    @property
+    def config(self):
+        return self.__config
+
+    @property
+    def resultados(self):
+        return self.__emissao.resultados
+
+    def __ler_cadastro(self, planilha: str) -> Iterator[Cadastro]:
+        """ Estágio de leitura: gera o cadastro linha a linha, sem carregar a planilha inteira. """
+        try:
+            yield from gerar_cadastro_prestadora(planilha)
+        except Exception as e:
+            logger.critical(f'Erro na leitura do cadastro {planilha}. Erro: {e}')
+
+    def __criar_bot(self, cadastro: Cadastro) -> BotAguaSegundaVia:
+        """
+        Navegador da thread de busca corrente no motor selenium, criado na primeira matrícula.
+        Retorna None (com a falha registrada) se o navegador não iniciar.
+        """
+        bot = getattr(self.__recursos, 'bot', None)
+        if bot is not None:
+            return bot
+        with self.__trava:
+            id_worker = next(self.__ids_worker)
+        dir_worker = self.dir_download + f'cedae_worker_{id_worker}' + os.sep
+        os.makedirs(dir_worker, exist_ok=True)
+        try:
+            bot = BotAguaSegundaVia(
+                dir_download=dir_worker,
+                id_worker=id_worker,
+                caixa_saida=self.__caixa_saida,
+                janela=self.__janela,
+                ritmo=self.__ritmo,
+                servidor=self.__servidor,
+                execucao=self.execucao,
+                config=self.config,
+                disjuntor=self.__disjuntor,
+                emissao=self.__emissao
+            )
+        except Exception as e:
+            logger.critical(f'Falha ao iniciar o navegador. Erro: {e}')
+            self.__emissao.registrar_resultado(cadastro, status='FALHA! Navegador não iniciado.')
+            return None
+        with self.__trava:
+            self.__bots.append(bot)
+        self.__recursos.bot = bot
+        return bot
+
+    def __buscar(self, cadastro: Cadastro) -> List[ContaBaixada]:
+        """
+        Estágio de busca: consulta a matrícula e baixa as contas da janela ainda não enviadas.
+        As contas baixadas e não enviadas de uma execução retomada são reaproveitadas.
+        No motor selenium, o navegador da thread emite e enfileira as contas da matrícula.
+        """
+        definir_contexto(matricula=cadastro.matricula)
+        etapas = self.__diario.get(cadastro.matricula, dict())
+        contas: List[ContaBaixada] = self.__emissao.retomar(cadastro, etapas)
+        if etapas.get('', ('',))[0] == ETAPA_CONCLUIDA:
+            return contas
+        if self.__motor == 'selenium':
+            bot = self.__criar_bot(cadastro)
+            if bot is not None:
+                bot.processar_matricula(self.__url, cadastro)
+            return contas
+        if not self.__disjuntor.liberar(self.__url):
+            self.__emissao.registrar_resultado(cadastro, status='FALHA! Portal indisponível.')
+            return contas
+        motor_http = getattr(self.__recursos, 'motor_http', None)
+        if motor_http is None:
+            motor_http = self.__recursos.motor_http = SegundaViaHttp(self.__url)
+        try:
+            if self.__emissao.buscar_http(
+                motor_http, cadastro, self.__ritmo, self.__disjuntor,
+                ao_baixar=contas.append, concluir=False
+            ):
+                self.__aguardar_contas(cadastro.matricula, len(contas))
+        except Exception as e:
+            logger.error(f'Falha no motor HTTP para a matrícula {cadastro.matricula}: {e}')
+            self.__disjuntor.registrar_falha()
+            with self.__trava:
+                self.__fallback.append(cadastro)
+        return contas
+
+    def __aguardar_contas(self, matricula: str, quantidade: int) -> None:
+        """
+        Adia a conclusão da matrícula no diário até as suas contas serem enfileiradas (ou
+        descartadas): interrompida antes disso, a execução retomada ainda encontra as contas
+        baixadas. Uma conta que falhar no caminho deixa a matrícula para o --resume.
+        """
+        if not quantidade:
+            registrar_etapa(self.execucao, matricula, ETAPA_CONCLUIDA)
+            return
+        with self.__trava:
+            self.__pendentes[matricula] = quantidade
+
+    def __liberar_conta(self, matricula: str) -> None:
+        """ Conta da matrícula enfileirada ou descartada; a última conclui a matrícula. """
+        with self.__trava:
+            if matricula not in self.__pendentes:
+                return
+            self.__pendentes[matricula] -= 1
+            if self.__pendentes[matricula]:
+                return
+            del self.__pendentes[matricula]
+        registrar_etapa(self.execucao, matricula, ETAPA_CONCLUIDA)
+
+    @METRICAS.medido('pos_processamento', contar_falhas=True)
+    def __pos_processar(self, conta: ContaBaixada) -> Dict[str, str]:
+        """
+        Estágio de pós-processamento: renomeia e valida o PDF, calcula o hash e descarta a conta
+        idêntica a uma já enviada. Devolve a tarefa de envio.
+        """
+        definir_contexto(matricula=conta.cadastro.matricula)
+        tarefa = self.__emissao.preparar(conta, self.__validador)
+        if tarefa is None:
+            # Conta descartada (já registrada nos resultados): não chega ao enfileiramento
+            self.__liberar_conta(conta.cadastro.matricula)
+        return tarefa
+
+    def __enfileirar(self, tarefa: Dict[str, str]) -> None:
+        """ Estágio de enfileiramento: entrega a tarefa à caixa de saída, que envia e registra. """
+        definir_contexto(matricula=tarefa['matricula'])
+        if self.__emissao.enfileirar(self.__caixa_saida, tarefa):
+            self.__liberar_conta(tarefa['matricula'])
+
+    def __reprocessar(self) -> None:
+        """ Reprocessa pelo navegador as matrículas que falharam no motor HTTP. """
+        logger.warning(
+            f'{len(self.__fallback)} matrícula(s) serão reprocessadas pelo navegador.')
+        try:
+            bot = BotAguaSegundaVia(
+                dir_download=self.dir_download,
+                caixa_saida=self.__caixa_saida,
+                janela=self.__janela,
+                ritmo=self.__ritmo,
+                servidor=self.__servidor,
+                execucao=self.execucao,
+                config=self.config,
+                disjuntor=self.__disjuntor,
+                emissao=self.__emissao
+            )
+        except Exception as e:
+            logger.critical(f'Falha ao iniciar o navegador. Erro: {e}')
+            for cadastro in self.__fallback:
+                self.__emissao.registrar_resultado(cadastro, status='FALHA! Navegador não iniciado.')
+            return
+        bot.baixar_segunda_via(self.__url, cadastro_clientes=self.__fallback)
+
+    def executar(self, planilha: str) -> List[Dict[str, str]]:
+        """
+        Executa o pipeline com o cadastro da planilha, reprocessa pelo navegador as matrículas
+        que falharam no motor HTTP e aguarda os envios da caixa de saída.
+        :args
+            {planilha} [str] - Arquivo de cadastro: .xlsx, .csv ou .parquet.
+        :returns
+            Lista com os resultados de todas as matrículas.
+        """
+        self.__emissao.carregar()
+        self.__diario = retornar_etapas(self.execucao)
+        os.makedirs(self.dir_download, exist_ok=True)
+        self.__caixa_saida = criar_caixa_saida(self.config, workers=self.__envios)
+        self.__caixa_saida.iniciar()
+        if self.__processos:
+            self.__validador = ProcessPoolExecutor(max_workers=self.__processos)
+        try:
+            Pipeline([
+                Estagio('busca', self.__buscar, self.__buscas),
+                Estagio('pos_processamento', self.__pos_processar, max(2, self.__processos)),
+                Estagio('enfileiramento', self.__enfileirar, 1),
+            ]).executar(self.__ler_cadastro(planilha))
+        finally:
+            for bot in self.__bots:
+                bot.encerrar()
+            if self.__validador is not None:
+                self.__validador.shutdown()
+                self.__validador = None
+        if self.__fallback:
+            self.__reprocessar()
+        logger.info('Aguardando o envio dos e-mails pendentes...')
+        self.resultados.extend(self.__caixa_saida.aguardar())
+        return self.resultados
+
+
 parser = ArgumentParser(
     usage='python agua.py [args]'
 )
@@ -400,11 +958,110 @@ parser.add_argument(
     action='store_true',
     help='Chama o configurador do servidor SMTP para envio de e-mail.'
 )
-
-args = parser.parse_args()
+parser.add_argument(
+    '--importar_controle',
+    metavar='ARQUIVO_YAML',
+    help='Importa um arquivo de controle YAML da versão anterior para o banco de controle.'
+)
+parser.add_argument(
+    '--url',
+    default=URL_SEGUNDA_VIA,
+    help='Página de emissão da segunda via; aponte para o portal simulado nos testes locais.'
+)
+parser.add_argument(
+    '--planilha',
+    default='AGUA.xlsx',
+    help='Arquivo de cadastro dos clientes: .xlsx, .csv ou .parquet (padrão: AGUA.xlsx).'
+)
+parser.add_argument(
+    '--motor',
+    choices=('selenium', 'http'),
+    default='selenium',
+    help='Motor de emissão: navegador (selenium) ou requisições diretas ao formulário (http).'
+)
+parser.add_argument(
+    '--meses',
+    type=int,
+    default=1,
+    help='Emite as contas com vencimento nos próximos N meses, contando o corrente (padrão: 1).'
+)
+parser.add_argument(
+    '--vencidas',
+    action='store_true',
+    help='Inclui as contas com vencimento em meses anteriores ao corrente.'
+)
+parser.add_argument(
+    '--workers',
+    type=int,
+    default=1,
+    help='Quantidade de navegadores simultâneos para processar as matrículas (padrão: 1).'
+)
+parser.add_argument(
+    '--servidor',
+    action='store_true',
+    help='Navegador sem janela (headless), sem imagens, fontes e CSS, para servidores.'
+)
+parser.add_argument(
+    '--resume',
+    action='store_true',
+    help='Retoma a última execução interrompida, reaproveitando os PDFs já baixados.'
+)
+parser.add_argument(
+    '--reciclar',
+    type=int,
+    default=50,
+    help='Reinicia o navegador a cada N matrículas para limitar o consumo de memória; 0 desativa (padrão: 50).'
+)
+parser.add_argument(
+    '--comparar_perfil',
+    action='store_true',
+    help='Compara o início, a carga e a memória do navegador padrão com o do modo servidor.'
+)
+parser.add_argument(
+    '--metricas',
+    metavar='ARQUIVO',
+    help='Grava ao final as métricas da execução: .prom (textfile do Prometheus) ou .json.'
+)
+parser.add_argument(
+    '--ritmo',
+    type=float,
+    default=0.5,
+    help='Requisições por segundo ao portal, somando todos os navegadores (padrão: 0.5).'
+)
+parser.add_argument(
+    '--agrupar',
+    action='store_true',
+    help='Envia uma única mensagem por destinatário com todas as suas contas (ver agrupar no smtp.yaml).'
+)
+parser.add_argument(
+    '--rotacao_log',
+    choices=(ROTACAO_TAMANHO, ROTACAO_DIARIA),
+    default=ROTACAO_TAMANHO,
+    help='Rotação do arquivo log/log.jsonl: a cada 10 MB ou diária (padrão: tamanho).'
+)
+parser.add_argument(
+    '--pipeline',
+    action='store_true',
+    help='Emissão em pipeline: leitura, busca, renomeação e envio pela caixa de saída em paralelo. '
+    'A busca usa o --motor (padrão: selenium, um navegador por busca); informe --motor http para dispensar o navegador.'
+)
+parser.add_argument(
+    '--envios',
+    type=int,
+    default=2,
+    help='Envios de e-mail simultâneos no modo --pipeline (padrão: 2).'
+)
+parser.add_argument(
+    '--processos_pdf',
+    type=int,
+    default=0,
+    help='Processos que validam os PDFs no modo --pipeline, para lotes grandes; 0 valida sem processos extras (padrão: 0).'
+)
 
 
 if __name__ == '__main__':
+    args = parser.parse_args()
+    configurar_log(rotacao=args.rotacao_log)
     if args.config_pk:
         logger.info('Gerando chave criptográfica privada, aguarde...')
         if Criptografia().gerar_chave_cripto():
@@ -416,10 +1073,96 @@ if __name__ == '__main__':
     elif args.config_smtp:
         config_smtp()
         sys.exit(0)
-    bot_segunda_via = BotAguaSegundaVia()
-    if bot_segunda_via.baixar_segunda_via(
-            'https://seguro.cedae.com.br/segunda_via_web/pages/SegundaVia/ENTRADA.aspx'):
+    elif args.importar_controle:
+        importar_yaml(args.importar_controle)
+        sys.exit(0)
+    elif args.comparar_perfil:
+        comparar_perfis(args.url, os.path.expanduser(
+            '~') + os.sep + 'Downloads' + os.sep)
+        sys.exit(0)
+    # Configuração e segredos carregados uma única vez, antes de qualquer navegador
+    try:
+        config = configuracao()
+    except ConfiguracaoInvalida as e:
+        logger.critical(f'Configuração inválida! {e}')
+        sys.exit(1)
+    if args.agrupar:
+        config = config._replace(smtp=config.smtp._replace(agrupar=True))
+    janela = JanelaVencimento(meses=args.meses, vencidas=args.vencidas)
+    logger.info(f'Janela de emissão: {janela}.')
+    ritmo = Ritmo(taxa=args.ritmo)
+    # Disjuntor do portal compartilhado por todos os workers
+    disjuntor = Disjuntor()
+    execucao = iniciar_execucao(retomar=args.resume)
+    definir_contexto(execucao=execucao)
+    if args.pipeline:
+        if not SiteOn(args.url).verificar():
+            logger.critical(
+                'Erro ao carregar a URL. 1) ela pode ter mudado ou 2) o serviço pode estar momentâneamente indisponível.')
+            sys.exit(1)
+        resultados = PipelineSegundaVia(
+            url=args.url,
+            janela=janela,
+            ritmo=ritmo,
+            execucao=execucao,
+            config=config,
+            buscas=args.workers,
+            envios=args.envios,
+            servidor=args.servidor,
+            disjuntor=disjuntor,
+            processos=args.processos_pdf,
+            motor=args.motor
+        ).executar(args.planilha)
+        finalizar_execucao(execucao)
+        if args.metricas:
+            METRICAS.exportar(args.metricas)
+        exibir_resumo_execucao(resultados)
+        logger.info('*** Execução em pipeline finalizada.')
+        sys.exit(0)
+    if args.workers > 1:
+        if not SiteOn(args.url).verificar():
+            logger.critical(
+                'Erro ao carregar a URL. 1) ela pode ter mudado ou 2) o serviço pode estar momentâneamente indisponível.')
+            sys.exit(1)
+        logger.info('Carregando dados da planilha de cadastro...')
+        cadastro = pegar_cadastro_prestadora(
+            arquivo=args.planilha, usar_cache=True)
+        # Caixa de saída única, esvaziada em paralelo à emissão pelos workers
+        caixa_saida = criar_caixa_saida(config, workers=args.workers)
+        caixa_saida.iniciar()
+        resultados = PoolNavegadores(
+            fabrica=partial(
+                BotAguaSegundaVia,
+                motor=args.motor,
+                caixa_saida=caixa_saida,
+                planilha=args.planilha,
+                janela=janela,
+                ritmo=ritmo,
+                servidor=args.servidor,
+                reciclar_a_cada=args.reciclar,
+                execucao=execucao,
+                config=config,
+                disjuntor=disjuntor
+            ),
+            workers=args.workers
+        ).executar(args.url, cadastro)
+        logger.info('Aguardando o envio dos e-mails pendentes...')
+        resultados.extend(caixa_saida.aguardar())
+        finalizar_execucao(execucao)
+        if args.metricas:
+            METRICAS.exportar(args.metricas)
+        exibir_resumo_execucao(resultados)
+        logger.info('*** Execução em pool finalizada.')
+        sys.exit(0)
+    bot_segunda_via = BotAguaSegundaVia(
+        motor=args.motor, planilha=args.planilha, janela=janela, ritmo=ritmo,
+        servidor=args.servidor, reciclar_a_cada=args.reciclar,
+        execucao=execucao, config=config, disjuntor=disjuntor)
+    if bot_segunda_via.baixar_segunda_via(args.url):
+        finalizar_execucao(execucao)
         logger.info('*** Envio das contas concluído com sucesso ;)')
     else:
         logger.info(
             'FALHA na rotina de envio das contas... Entre em contato com o suporte técnico :(')
+    if args.metricas:
+        METRICAS.exportar(args.metricas)
@@ -0,0 +1,193 @@
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from threading import local
+from typing import Dict, Tuple
+
+from lib.log import logger
+
+
+ARQUIVO_DB = Path('controle/diario_execucao.db')
+
+# Etapas da matrícula (vencimento vazio) e de cada conta, na ordem em que acontecem
+ETAPA_CONSULTADA = 'consultada'
+ETAPA_BAIXADA = 'baixada'
+ETAPA_RENOMEADA = 'renomeada'
+ETAPA_ENFILEIRADA = 'enfileirada'
+ETAPA_ENVIADA = 'enviada'
+ETAPA_REGISTRADA = 'registrada'
+ETAPA_CONCLUIDA = 'concluida'
+ETAPAS = (
+    ETAPA_CONSULTADA,
+    ETAPA_BAIXADA,
+    ETAPA_RENOMEADA,
+    ETAPA_ENFILEIRADA,
+    ETAPA_ENVIADA,
+    ETAPA_REGISTRADA,
+    ETAPA_CONCLUIDA,
+)
+
+# Uma conexão por thread: o sqlite3 não compartilha conexões entre threads
+__conexoes = local()
+
+
+def __conectar() -> sqlite3.Connection:
+    """
+    Retorna a conexão da thread corrente com o diário de execuções, criando o banco se necessário.
+    :args
+        Nenhum.
+    :returns
+        Conexão sqlite3.
+    """
+    conexao = getattr(__conexoes, 'conexao', None)
+    if conexao is not None:
+        return conexao
+    conexao = sqlite3.connect(ARQUIVO_DB, timeout=30)
+    conexao.execute('PRAGMA journal_mode=WAL')
+    conexao.execute('PRAGMA synchronous=NORMAL')
+    with conexao:
+        conexao.execute(
+            '''CREATE TABLE IF NOT EXISTS execucao (
+                id TEXT PRIMARY KEY,
+                inicio TEXT NOT NULL,
+                fim TEXT
+            )''')
+        conexao.execute(
+            '''CREATE TABLE IF NOT EXISTS etapa (
+                execucao TEXT NOT NULL,
+                matricula TEXT NOT NULL,
+                vencimento TEXT NOT NULL,
+                etapa TEXT NOT NULL,
+                ordem INTEGER NOT NULL,
+                arquivo TEXT,
+                atualizacao TEXT NOT NULL,
+                PRIMARY KEY (execucao, matricula, vencimento)
+            )''')
+    __conexoes.conexao = conexao
+    return conexao
+
+
+def fechar_conexao() -> None:
+    """
+    Fecha a conexão da thread corrente; a próxima operação reabre o banco. Necessário ao trocar o
+    diretório de trabalho, pois o caminho do banco é relativo (ex.: rodadas do benchmark).
+    :args
+        Nenhum.
+    :returns
+        Nenhum.
+    """
+    conexao = getattr(__conexoes, 'conexao', None)
+    if conexao is not None:
+        __conexoes.conexao = None
+        conexao.close()
+
+
+def iniciar_execucao(retomar: bool = False) -> str:
+    """
+    Inicia uma nova execução no diário ou, se solicitado, retoma a última execução interrompida.
+    :args
+        {retomar} [bool] - Se retoma a última execução não finalizada (padrão: False).
+    :returns
+        Identificação da execução.
+    """
+    agora = datetime.today()
+    try:
+        conexao = __conectar()
+        if retomar:
+            linha = conexao.execute(
+                'SELECT id, inicio FROM execucao WHERE fim IS NULL ORDER BY inicio DESC LIMIT 1'
+            ).fetchone()
+            if linha is not None:
+                logger.info(f'Retomando a execução iniciada em {linha[1]}.')
+                return linha[0]
+            logger.info('Nenhuma execução interrompida para retomar. Iniciando nova execução.')
+        id_execucao = agora.strftime('%Y%m%d%H%M%S%f')
+        with conexao:
+            conexao.execute(
+                'INSERT INTO execucao (id, inicio) VALUES (?, ?)',
+                (id_execucao, agora.isoformat(sep=' ', timespec='seconds')))
+        return id_execucao
+    except sqlite3.Error as erro:
+        logger.error(f'Erro ao iniciar a execução no diário! {erro}')
+        return ''
+
+
+def registrar_etapa(
+    execucao: str,
+    matricula: str,
+    etapa: str,
+    vencimento: str = '',
+    arquivo: str = None
+) -> None:
+    """
+    Registra a etapa alcançada pela matrícula (vencimento vazio) ou por uma de suas contas.
+    Uma etapa anterior à já registrada é ignorada.
+    :args
+        {execucao} [str] - Identificação da execução (ver iniciar_execucao()).
+        {matricula} [str] - Número da matrícula do cliente.
+        {etapa} [str] - Uma das ETAPAS.
+        {vencimento} [str] - Data de vencimento da conta (dd/mm/aa).
+        {arquivo} [str] - Caminho do PDF da conta, se houver.
+    :returns
+        Nenhum.
+    """
+    if not execucao:
+        return
+    try:
+        conexao = __conectar()
+        with conexao:
+            conexao.execute(
+                '''INSERT INTO etapa (execucao, matricula, vencimento, etapa, ordem, arquivo, atualizacao)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (execucao, matricula, vencimento) DO UPDATE SET
+                    etapa = excluded.etapa,
+                    ordem = excluded.ordem,
+                    arquivo = COALESCE(excluded.arquivo, etapa.arquivo),
+                    atualizacao = excluded.atualizacao
+                WHERE excluded.ordem > etapa.ordem''',
+                (execucao, matricula, vencimento or '', etapa, ETAPAS.index(etapa),
+                 arquivo, datetime.today().isoformat(sep=' ', timespec='seconds')))
+    except sqlite3.Error as erro:
+        logger.error(f'Erro ao gravar a etapa da matrícula {matricula} no diário! {erro}')
+
+
+def retornar_etapas(execucao: str) -> Dict[str, Dict[str, Tuple[str, str]]]:
+    """
+    Retorna as etapas registradas na execução, para a retomada.
+    :args
+        {execucao} [str] - Identificação da execução.
+    :returns
+        Dicionário {matrícula: {vencimento: (etapa, arquivo)}}; a etapa da matrícula fica no vencimento vazio.
+    """
+    etapas: Dict[str, Dict[str, Tuple[str, str]]] = dict()
+    if not execucao:
+        return etapas
+    try:
+        cursor = __conectar().execute(
+            'SELECT matricula, vencimento, etapa, arquivo FROM etapa WHERE execucao = ?',
+            (execucao,))
+        for matricula, vencimento, etapa, arquivo in cursor:
+            etapas.setdefault(matricula, dict())[vencimento] = (etapa, arquivo)
+    except sqlite3.Error as erro:
+        logger.error(f'Erro ao consultar o diário da execução: {erro}')
+    return etapas
+
+
+def finalizar_execucao(execucao: str) -> None:
+    """
+    Marca a execução como finalizada; ela deixa de ser candidata à retomada.
+    :args
+        {execucao} [str] - Identificação da execução.
+    :returns
+        Nenhum.
+    """
+    if not execucao:
+        return
+    try:
+        conexao = __conectar()
+        with conexao:
+            conexao.execute(
+                'UPDATE execucao SET fim = ? WHERE id = ?',
+                (datetime.today().isoformat(sep=' ', timespec='seconds'), execucao))
+    except sqlite3.Error as erro:
+        logger.error(f'Erro ao finalizar a execução no diário! {erro}')
@@ -1,123 +1,230 @@
+import sqlite3
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from threading import local
+from typing import List, Set, Tuple
 
 import yaml
 
 from lib.log import logger
+from lib.metricas import METRICAS
 
 
+ARQUIVO_DB = Path('controle/matricula_processada.db')
+# Controle anterior, em YAML, importado automaticamente na criação do banco
 ARQUIVO_YAML = Path('controle/matricula_processada.yaml')
 
+# Uma conexão por thread: o sqlite3 não compartilha conexões entre threads
+__conexoes = local()
 
-def __verificar_data_arquivo_controle() -> None:
+
+def __competencia(data: datetime) -> str:
+    """ Competência (mês/ano) do processamento no formato AAAA-MM. """
+    return data.strftime('%Y-%m')
+
+
+def __conectar() -> sqlite3.Connection:
     """
-    Calcula se o mês e ano corrente são maiores que o da última modificação do arquivo.
-    Se verdadeiro, cria um novo arquivo para o controle do mês corrente. 
-    Se o arquivo não existir, cria.
+    Retorna a conexão da thread corrente com o banco de controle, criando o banco se necessário.
+    O modo WAL permite leituras simultâneas à gravação dos workers do pool de navegadores.
     :args
         Nenhum.
-    :return
-        Nenhum.
+    :returns
+        Conexão sqlite3.
     """
-    if not ARQUIVO_YAML.is_file():
-        __criar_processada()
-    else:
-        hoje = datetime.today()
-        dt_criacao_arquivo_yaml = datetime.fromtimestamp(
-            ARQUIVO_YAML.stat().st_mtime)  # data da última modificação no arquivo.
-        calculo = (hoje.month + hoje.year) > (dt_criacao_arquivo_yaml.month +
-                                              dt_criacao_arquivo_yaml.year)
-        if calculo:
-            __criar_processada()
-        return
-
-
-def __criar_processada() -> None:
+    conexao = getattr(__conexoes, 'conexao', None)
+    if conexao is not None:
+        return conexao
+    novo_banco = not ARQUIVO_DB.is_file()
+    conexao = sqlite3.connect(ARQUIVO_DB, timeout=30)
+    conexao.execute('PRAGMA journal_mode=WAL')
+    conexao.execute('PRAGMA synchronous=NORMAL')
+    with conexao:
+        conexao.execute(
+            '''CREATE TABLE IF NOT EXISTS processada (
+                id INTEGER PRIMARY KEY,
+                matricula TEXT NOT NULL,
+                competencia TEXT NOT NULL,
+                cliente TEXT,
+                documento TEXT,
+                execucao TEXT NOT NULL,
+                vencimento TEXT,
+                hash_pdf TEXT,
+                valor TEXT,
+                linha_digitavel TEXT
+            )''')
+        # Bancos criados antes do controle por conta não têm as colunas vencimento/hash_pdf,
+        # e os anteriores à validação do PDF, as colunas valor/linha_digitavel
+        colunas = [linha[1] for linha in conexao.execute(
+            'PRAGMA table_info(processada)')]
+        for coluna in ('vencimento', 'hash_pdf', 'valor', 'linha_digitavel'):
+            if coluna not in colunas:
+                conexao.execute(
+                    f'ALTER TABLE processada ADD COLUMN {coluna} TEXT')
+        conexao.execute(
+            'CREATE INDEX IF NOT EXISTS idx_processada ON processada (matricula, competencia)')
+        conexao.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_conta ON processada (matricula, vencimento, hash_pdf)')
+        # Registros do controle anterior (sem vencimento) são únicos por execução: reimportar o
+        # mesmo YAML não os duplica. Remove as duplicatas de importações anteriores a este índice
+        if not conexao.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_importada'").fetchone():
+            conexao.execute(
+                '''DELETE FROM processada WHERE vencimento IS NULL AND id NOT IN (
+                    SELECT MIN(id) FROM processada WHERE vencimento IS NULL
+                    GROUP BY matricula, competencia, execucao)''')
+            conexao.execute(
+                '''CREATE UNIQUE INDEX idx_importada ON processada (matricula, competencia, execucao)
+                WHERE vencimento IS NULL''')
+    __conexoes.conexao = conexao
+    if novo_banco and ARQUIVO_YAML.is_file():
+        importar_yaml(ARQUIVO_YAML)
+    return conexao
+
+
+def fechar_conexao() -> None:
     """
-    Cria, no diretório controle, o arquivo matricula_processadas.yaml, que armazena as matrículas já processadas no mês.
+    Fecha a conexão da thread corrente; a próxima operação reabre o banco. Necessário ao trocar o
+    diretório de trabalho, pois o caminho do banco é relativo (ex.: rodadas do benchmark).
+    :args
+        Nenhum.
+    :returns
+        Nenhum.
     """
-    # Chave raiz do arquivo
-    ctrl = {'processada':  list()}
-    # Regrava o arquivo existente ou cria um novo
-    with open(ARQUIVO_YAML, 'w+') as arq_ctrl:
-        try:
-            yaml.dump(
-                ctrl,
-                arq_ctrl,
-                default_flow_style=False,
-                explicit_start=True,
-                explicit_end=True,
-                version=(1, 2),
-                sort_keys=False
-            )
-        except yaml.YAMLError as erro:
-            logger.error(
-                f'Erro na criação do arquivo de controle de matrículas processadas. {erro}')
-    return
+    conexao = getattr(__conexoes, 'conexao', None)
+    if conexao is not None:
+        __conexoes.conexao = None
+        conexao.close()
 
 
-def inserir_processada(matricula: str, cliente: str, documento: str) -> None:
+@METRICAS.medido('registro_controle')
+def inserir_processada(
+    matricula: str,
+    cliente: str,
+    documento: str,
+    vencimento: str = None,
+    hash_pdf: str = None,
+    valor: str = None,
+    linha_digitavel: str = None
+) -> None:
     """
-    Lê o arquivo matricula_processada.yaml, adiciona à lista de valores o novo dicionário com o s daados processados.
+    Registra, em uma transação, a conta processada na competência corrente.
+    A chave da conta é (matrícula, vencimento, hash do PDF); reenvios da mesma conta são ignorados.
     :args
         {matricula} - Número da matrícula do cliente.
         {cliente} - Nome do cliente.
         {documento} - Número do documento do cliente.
+        {vencimento} - Data de vencimento da conta (dd/mm/aa).
+        {hash_pdf} - Hash SHA-256 do arquivo PDF enviado.
+        {valor} - Valor da conta extraído do PDF (ex.: '1234.56').
+        {linha_digitavel} - Linha digitável extraída do PDF, somente dígitos.
     :returns
         Nenhum.
     """
-    # Lê o conteúdo original do arquivo
-    with open(ARQUIVO_YAML) as arq_controle:
-        try:
-            conteudo = yaml.safe_load(arq_controle)
-        except yaml.YAMLError as erro:
-            logger.error(f'Erro ao abrir o arquivo {arq_controle}: {erro}')
-        else:
-            # Novo dicionário à adicionar
-            novo = {
-                'matricula': matricula,
-                'cliente': cliente,
-                'documento': documento,
-                'execucao': datetime.today(),
-            }
-            # Adiciona o novo dicionário na lista de valores do controle
-            conteudo['processada'].append(novo)
-
-    # Abre o arquivo e regrava com o conteúdo adicionado
-    with open(ARQUIVO_YAML, 'w+') as arq_ctrl:
-        try:
-            yaml.dump(
-                conteudo,
-                arq_ctrl,
-                default_flow_style=False,
-                explicit_start=True,
-                explicit_end=True,
-                version=(1, 2),
-                sort_keys=False
-            )
-        except yaml.YAMLError as erro:
-            logger.error(f'Erro ao gravar o arquivo atualizado! {erro}')
+    execucao = datetime.today()
+    try:
+        conexao = __conectar()
+        with conexao:
+            conexao.execute(
+                'INSERT OR IGNORE INTO processada (matricula, competencia, cliente, documento, execucao, vencimento, hash_pdf, valor, linha_digitavel) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (matricula, __competencia(execucao), cliente,
+                 documento, execucao.isoformat(sep=' '), vencimento, hash_pdf, valor, linha_digitavel))
+    except sqlite3.Error as erro:
+        logger.error(f'Erro ao gravar a matrícula {matricula} no controle! {erro}')
     return
 
 
 def retornar_processada() -> List[str]:
     """
-    Retorna o controle das matrículas que já foram processadas para não haver repetição.
+    Retorna as matrículas processadas no mês pelo controle anterior (sem vencimento registrado).
+    Como esse controle só enviava a conta do mês corrente, essas matrículas não precisam ser revisitadas.
+    :args
+        Nenhum.
+    :returns
+        Lista das matrículas já processadas no mês sem o controle por conta.
+    """
+    try:
+        cursor = __conectar().execute(
+            'SELECT DISTINCT matricula FROM processada WHERE competencia = ? AND vencimento IS NULL',
+            (__competencia(datetime.today()),))
+        return [linha[0] for linha in cursor]
+    except sqlite3.Error as erro:
+        logger.error(f'Erro ao consultar o controle de matrículas processadas: {erro}')
+        return list()
+
+
+def retornar_contas_processadas() -> Set[Tuple[str, str]]:
+    """
+    Retorna as contas já enviadas para consulta por pertinência antes do download.
+    :args
+        Nenhum.
+    :returns
+        Conjunto de tuplas (matrícula, vencimento).
+    """
+    try:
+        cursor = __conectar().execute(
+            'SELECT matricula, vencimento FROM processada WHERE vencimento IS NOT NULL')
+        return set(cursor)
+    except sqlite3.Error as erro:
+        logger.error(f'Erro ao consultar o controle de contas processadas: {erro}')
+        return set()
+
+
+def retornar_hashes_processados() -> Set[Tuple[str, str]]:
+    """
+    Retorna os hashes dos PDFs já enviados, para descartar um arquivo idêntico baixado novamente.
     :args
         Nenhum.
     :returns
-        Lista das matrículas já processadas no mês.
+        Conjunto de tuplas (matrícula, hash do PDF).
+    """
+    try:
+        cursor = __conectar().execute(
+            'SELECT matricula, hash_pdf FROM processada WHERE hash_pdf IS NOT NULL')
+        return set(cursor)
+    except sqlite3.Error as erro:
+        logger.error(f'Erro ao consultar o controle de contas processadas: {erro}')
+        return set()
+
+
+def importar_yaml(arquivo: Path = ARQUIVO_YAML) -> int:
+    """
+    Importa, em uma única transação, o arquivo de controle YAML da versão anterior.
+    Os registros já importados (mesma matrícula, competência e execução) são ignorados.
+    :args
+        {arquivo} [Path] - Arquivo YAML com a chave raiz 'processada'.
+    :returns
+        Quantidade de registros importados.
     """
-    __verificar_data_arquivo_controle()
-    with open(ARQUIVO_YAML) as arq_controle:
-        try:
-            controle = yaml.safe_load(arq_controle)
-        except yaml.YAMLError as erro:
-            logger.error(f'Erro ao abrir o arquivo {arq_controle}: {erro}')
-        else:
-            for valores in controle.values():
-                controle_executados: list = [
-                    valor['matricula'] for valor in valores
-                ]
-            return controle_executados
+    try:
+        with open(arquivo) as arq_controle:
+            conteudo = yaml.safe_load(arq_controle) or dict()
+    except (OSError, yaml.YAMLError) as erro:
+        logger.error(f'Erro ao abrir o arquivo {arquivo}: {erro}')
+        return 0
+    registros = list()
+    for valor in conteudo.get('processada') or list():
+        execucao = valor.get('execucao') or datetime.fromtimestamp(
+            Path(arquivo).stat().st_mtime)
+        if isinstance(execucao, str):
+            execucao = datetime.fromisoformat(execucao)
+        registros.append((
+            valor['matricula'],
+            __competencia(execucao),
+            valor.get('cliente'),
+            valor.get('documento'),
+            execucao.isoformat(sep=' ')
+        ))
+    try:
+        conexao = __conectar()
+        with conexao:
+            importados = conexao.executemany(
+                'INSERT OR IGNORE INTO processada (matricula, competencia, cliente, documento, execucao) VALUES (?, ?, ?, ?, ?)',
+                registros).rowcount
+    except sqlite3.Error as erro:
+        logger.error(f'Erro ao importar o arquivo {arquivo}: {erro}')
+        return 0
+    ignorados = len(registros) - importados
+    logger.info(f'{importados} registro(s) importado(s) de {arquivo}'
+                + (f' ({ignorados} já importado(s)).' if ignorados else '.'))
+    return importados
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import pickle
+from pathlib import Path
+from typing import List
+
+from lib.log import logger
+from lib.mineracao import Cadastro, criar_cadastro, ler_linhas
+
+DIR_CACHE = Path('controle')
+VERSAO_CACHE = 2
+# Quantidade máxima de matrículas detalhadas no log por tipo de diferença
+LIMITE_DIFERENCA = 50
+
+
+class CacheCadastro(object):
+    def __init__(self, arquivo: str, diretorio: Path = DIR_CACHE) -> None:
+        """
+        Snapshot binário (pickle) do cadastro já analisado, identificado pela data de modificação,
+        tamanho e hash do arquivo de origem.
+        - Arquivo inalterado: o cadastro é devolvido direto do snapshot, sem abrir a planilha.
+        - Arquivo alterado: a planilha é lida por inteiro, como sem o snapshot (o ganho é apenas
+          dos arquivos inalterados), e a diferença por matrícula é registrada no log.
+        :args
+            {arquivo} [str] - Arquivo de cadastro (.xlsx, .csv ou .parquet).
+            {diretorio} [Path] - Diretório dos snapshots (padrão: controle).
+        :methods
+            carregar()
+        """
+        self.__arquivo = Path(arquivo)
+        self.__snapshot = Path(diretorio).joinpath(
+            f'cadastro_{self.__arquivo.stem}.cache')
+
+    @property
+    def arquivo(self):
+        return self.__arquivo
+
+    @property
+    def snapshot(self):
+        return self.__snapshot
+
+    def __hash_arquivo(self) -> str:
+        sha256 = hashlib.sha256()
+        with open(self.arquivo, 'rb') as arq:
+            for parte in iter(lambda: arq.read(1048576), b''):
+                sha256.update(parte)
+        return sha256.hexdigest()
+
+    def __ler_snapshot(self) -> dict:
+        try:
+            with open(self.snapshot, 'rb') as arq:
+                conteudo = pickle.load(arq)
+            if conteudo.get('versao') == VERSAO_CACHE:
+                return conteudo
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f'Snapshot do cadastro ignorado ({self.snapshot}): {e}')
+        return dict()
+
+    def __gravar_snapshot(self, conteudo: dict) -> None:
+        arquivo_temp = self.snapshot.with_suffix('.tmp')
+        try:
+            with open(arquivo_temp, 'wb') as arq:
+                pickle.dump(conteudo, arq, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(arquivo_temp, self.snapshot)
+        except OSError as e:
+            logger.warning(f'Falha ao gravar o snapshot do cadastro: {e}')
+
+    def carregar(self) -> List[Cadastro]:
+        """
+        Retorna o cadastro completo (sem o filtro de processadas), atualizando o snapshot se necessário.
+        :args
+            Nenhum.
+        :returns
+            Lista de Cadastro.
+        """
+        estado = self.arquivo.stat()
+        anterior = self.__ler_snapshot()
+        if anterior and anterior['mtime'] == estado.st_mtime and anterior['tamanho'] == estado.st_size:
+            logger.info(f'Cadastro carregado do snapshot: {self.snapshot}')
+            return [Cadastro(*linha) for linha in anterior['cadastro']]
+        hash_atual = self.__hash_arquivo()
+        if anterior and anterior['hash'] == hash_atual:
+            # Arquivo regravado sem alteração de conteúdo: só atualiza a data no snapshot
+            anterior.update(mtime=estado.st_mtime, tamanho=estado.st_size)
+            self.__gravar_snapshot(anterior)
+            logger.info(f'Cadastro inalterado, carregado do snapshot: {self.snapshot}')
+            return [Cadastro(*linha) for linha in anterior['cadastro']]
+
+        cadastro: List[tuple] = [
+            tuple(registro) for registro in map(criar_cadastro, ler_linhas(self.arquivo))
+            if registro is not None
+        ]
+        self.__registrar_diferenca(anterior.get('cadastro', list()), cadastro)
+        self.__gravar_snapshot({
+            'versao': VERSAO_CACHE,
+            'mtime': estado.st_mtime,
+            'tamanho': estado.st_size,
+            'hash': hash_atual,
+            'cadastro': cadastro
+        })
+        return [Cadastro(*linha) for linha in cadastro]
+
+    def __registrar_diferenca(self, anterior: List[tuple], atual: List[tuple]) -> None:
+        """ Registra no log as matrículas incluídas, excluídas e alteradas em relação ao snapshot. """
+        por_matricula_anterior = {linha[1]: linha for linha in anterior}
+        por_matricula_atual = {linha[1]: linha for linha in atual}
+        incluidas = por_matricula_atual.keys() - por_matricula_anterior.keys()
+        excluidas = por_matricula_anterior.keys() - por_matricula_atual.keys()
+        alteradas = [
+            matricula for matricula in por_matricula_atual.keys() & por_matricula_anterior.keys()
+            if por_matricula_atual[matricula] != por_matricula_anterior[matricula]
+        ]
+        logger.info(
+            f'Cadastro atualizado: {len(incluidas)} incluída(s), {len(excluidas)} excluída(s), {len(alteradas)} alterada(s).')
+        if not anterior:
+            # Primeiro snapshot: não há diferença a detalhar
+            return
+        for rotulo, matriculas in (('Incluída', incluidas), ('Excluída', excluidas), ('Alterada', alteradas)):
+            for matricula in sorted(map(str, matriculas))[:LIMITE_DIFERENCA]:
+                logger.info(f'{rotulo}: {matricula}')
+            if len(matriculas) > LIMITE_DIFERENCA:
+                logger.info(
+                    f'{rotulo}: ... e mais {len(matriculas) - LIMITE_DIFERENCA} matrícula(s).')
@@ -0,0 +1,299 @@
+import json
+import os
+from pathlib import Path
+from queue import Queue
+from threading import Condition, Lock, Thread, Timer
+from typing import Callable, Dict, List, Tuple
+from uuid import uuid4
+
+from lib.configuracao import LIMITE_ANEXOS
+from lib.envio_email import ConexaoSmtp, Email
+from lib.log import definir_contexto, logger
+
+
+class CaixaSaida(object):
+    def __init__(
+        self,
+        fabrica_conexao: Callable[[], ConexaoSmtp],
+        ao_entregar: Callable[[Dict[str, str]], None] = None,
+        diretorio: str = 'saida',
+        workers: int = 2,
+        tentativas: int = 5,
+        espera: float = 2.0,
+        corpo_html: str = None,
+        agrupar: bool = False,
+        limite_anexos: int = LIMITE_ANEXOS,
+        assunto_lote: Callable[[List[Dict[str, str]]], str] = None
+    ) -> None:
+        """
+        Caixa de saída de e-mails persistida em disco e esvaziada por workers em segundo plano.
+        Cada conta baixada vira uma tarefa (arquivo JSON) que sobrevive a uma queda do processo;
+        as tarefas pendentes de execuções anteriores são recarregadas em iniciar().
+        :args
+            {fabrica_conexao} [Callable] - Cria a ConexaoSmtp persistente de cada worker.
+            {ao_entregar} [Callable] - Chamado com a tarefa após a confirmação do envio.
+            {diretorio} [str] - Diretório da caixa de saída (padrão: saida).
+            {workers} [int] - Quantidade de envios simultâneos (padrão: 2).
+            {tentativas} [int] - Quantidade máxima de tentativas por mensagem (padrão: 5).
+            {espera} [float] - Espera base, em segundos, do recuo exponencial entre tentativas (padrão: 2).
+            {corpo_html} [str] - Corpo HTML já carregado, comum a todos os e-mails. Se não informado,
+                cada envio lê o arquivo corpo_html da tarefa.
+            {agrupar} [bool] - Se reúne as contas de um mesmo destinatário em uma única mensagem,
+                enviada em aguardar() ou ao atingir o limite_anexos (padrão: False).
+            {limite_anexos} [int] - Tamanho máximo, em bytes, dos anexos de uma mensagem agrupada;
+                acima dele as contas são divididas em várias mensagens (padrão: 15 MB).
+            {assunto_lote} [Callable] - Monta o assunto da mensagem agrupada a partir das suas tarefas.
+        :methods
+            iniciar()
+            adicionar()
+            liberar()
+            aguardar()
+        """
+        self.__fabrica_conexao = fabrica_conexao
+        self.__ao_entregar = ao_entregar
+        self.__diretorio = Path(diretorio)
+        self.__dir_falha = self.__diretorio.joinpath('falha')
+        self.__workers: int = max(1, workers)
+        self.__tentativas: int = max(1, tentativas)
+        self.__espera: float = espera
+        self.__corpo_html: str = corpo_html
+        self.__agrupar: bool = agrupar
+        self.__limite_anexos: int = limite_anexos
+        self.__assunto_lote = assunto_lote
+        # Contas aguardando o envio agrupado, por destinatário
+        self.__grupos: Dict[Tuple[str, ...], List[Dict[str, str]]] = dict()
+        self.__tamanhos: Dict[Tuple[str, ...], int] = dict()
+        self.__trava_grupos = Lock()
+        self.__fila: Queue = Queue()
+        self.__threads: List[Thread] = list()
+        self.__pendentes: int = 0
+        self.__condicao = Condition()
+        self.__resultados: List[Dict[str, str]] = list()
+
+    @property
+    def diretorio(self):
+        return self.__diretorio
+
+    @property
+    def resultados(self):
+        return self.__resultados
+
+    @property
+    def agrupar(self):
+        return self.__agrupar
+
+    def __arquivo_tarefa(self, id_tarefa: str) -> Path:
+        return self.diretorio.joinpath(id_tarefa + '.json')
+
+    def __gravar_tarefa(self, tarefa: Dict[str, str]) -> None:
+        """ Grava a tarefa de forma atômica (arquivo temporário + substituição). """
+        arquivo = self.__arquivo_tarefa(tarefa['id'])
+        arquivo_temp = arquivo.with_suffix('.tmp')
+        with open(arquivo_temp, 'w', encoding='utf-8') as arq:
+            json.dump(tarefa, arq, ensure_ascii=False)
+        os.replace(arquivo_temp, arquivo)
+
+    def __enfileirar(self, tarefa: Dict[str, str]) -> None:
+        """ Enfileira o envio da tarefa ou, no envio agrupado, a reúne às do mesmo destinatário. """
+        with self.__condicao:
+            self.__pendentes += 1
+        if not self.agrupar:
+            self.__fila.put([tarefa])
+            return
+        destinatario = tuple(sorted(endereco.strip().lower() for endereco in tarefa['para']))
+        try:
+            tamanho = os.path.getsize(tarefa['anexo'])
+        except OSError:
+            tamanho = 0
+        with self.__trava_grupos:
+            grupo = self.__grupos.setdefault(destinatario, list())
+            if grupo and self.__tamanhos[destinatario] + tamanho > self.__limite_anexos:
+                self.__fila.put(grupo)
+                grupo = self.__grupos[destinatario] = list()
+                self.__tamanhos[destinatario] = 0
+            grupo.append(tarefa)
+            self.__tamanhos[destinatario] = self.__tamanhos.get(destinatario, 0) + tamanho
+            if self.__tamanhos[destinatario] >= self.__limite_anexos:
+                self.__fila.put(self.__grupos.pop(destinatario))
+                self.__tamanhos.pop(destinatario)
+
+    def liberar(self) -> None:
+        """ Enfileira as mensagens agrupadas que ainda aguardam novas contas dos destinatários. """
+        with self.__trava_grupos:
+            grupos = list(self.__grupos.values())
+            self.__grupos = dict()
+            self.__tamanhos = dict()
+        for grupo in grupos:
+            self.__fila.put(grupo)
+
+    def __concluir(self) -> None:
+        with self.__condicao:
+            self.__pendentes -= 1
+            self.__condicao.notify_all()
+
+    def iniciar(self) -> None:
+        """
+        Cria o diretório da caixa de saída, recarrega as tarefas pendentes e inicia os workers.
+        """
+        self.__dir_falha.mkdir(parents=True, exist_ok=True)
+        for arquivo in sorted(self.diretorio.glob('*.json')):
+            try:
+                with open(arquivo, encoding='utf-8') as arq:
+                    tarefa = json.load(arq)
+            except (OSError, ValueError) as e:
+                logger.error(f'Tarefa ilegível na caixa de saída: {arquivo}. Erro: {e}')
+                continue
+            logger.info(
+                f'Retomando envio pendente da matrícula {tarefa["matricula"]}.')
+            self.__enfileirar(tarefa)
+        for i in range(self.__workers):
+            thread = Thread(
+                target=self.__executar_worker,
+                name=f'caixa_saida_{i}',
+                daemon=True
+            )
+            thread.start()
+            self.__threads.append(thread)
+
+    def adicionar(self, **tarefa) -> bool:
+        """
+        Registra em disco e enfileira o envio de uma conta (ou a agrupa, ver agrupar).
+        :args
+            {de}, {para}, {assunto}, {corpo_html}, {anexo} - Dados do e-mail (ver Email).
+            {cliente}, {matricula}, {documento}, {vencimento} - Dados da conta para o controle.
+        :returns
+            True/False - Se a tarefa foi registrada.
+        """
+        if not tarefa.get('anexo') or not Path(tarefa['anexo']).is_file():
+            logger.error(
+                f'Conta da matrícula {tarefa.get("matricula")} sem arquivo PDF para envio.')
+            return False
+        tarefa['id'] = uuid4().hex
+        tarefa['tentativas'] = 0
+        try:
+            self.__gravar_tarefa(tarefa)
+        except OSError as e:
+            logger.critical(f'Falha ao gravar a tarefa na caixa de saída. Erro: {e}')
+            return False
+        self.__enfileirar(tarefa)
+        return True
+
+    def __assunto(self, lote: List[Dict[str, str]]) -> str:
+        """ Assunto da mensagem: o da tarefa ou, na mensagem agrupada, o montado por assunto_lote. """
+        if len(lote) == 1:
+            return lote[0]['assunto']
+        if self.__assunto_lote is not None:
+            return self.__assunto_lote(lote)
+        return f'{lote[0]["assunto"]} (+{len(lote) - 1})'
+
+    def __executar_worker(self) -> None:
+        """ Envia os lotes da fila (uma mensagem por lote) por uma conexão SMTP persistente do worker. """
+        conexao: ConexaoSmtp = None
+        while True:
+            lote = self.__fila.get()
+            if lote is None:
+                break
+            tarefa = lote[0]
+            matriculas = ', '.join(dict.fromkeys(item['matricula'] for item in lote))
+            definir_contexto(matricula=matriculas, execucao=tarefa.get('execucao'))
+            if conexao is None:
+                try:
+                    conexao = self.__fabrica_conexao()
+                except Exception as e:
+                    logger.critical(f'Falha ao configurar a conexão SMTP. Erro: {e}')
+            try:
+                enviado = conexao is not None and Email(
+                    de=tarefa['de'],
+                    para=tarefa['para'],
+                    assunto=self.__assunto(lote),
+                    corpo_html=tarefa['corpo_html'],
+                    corpo=self.__corpo_html,
+                    anexo=[item['anexo'] for item in lote],
+                    conexao=conexao
+                ).enviar()
+            except Exception as e:
+                logger.error(f'Falha no envio da(s) matrícula(s) {matriculas}. Erro: {e}')
+                enviado = False
+            if enviado:
+                if len(lote) > 1:
+                    logger.info(
+                        f'{len(lote)} contas enviadas em uma única mensagem para {", ".join(tarefa["para"])}.')
+                for item in lote:
+                    self.__entregue(item)
+            else:
+                self.__reagendar(lote)
+        if conexao is not None:
+            conexao.fechar()
+
+    def __entregue(self, tarefa: Dict[str, str]) -> None:
+        """ Confirma o envio: executa o callback, registra o resultado e remove a tarefa do disco. """
+        try:
+            if self.__ao_entregar is not None:
+                self.__ao_entregar(tarefa)
+            self.resultados.append({
+                'cliente': tarefa['cliente'],
+                'matricula': tarefa['matricula'],
+                'vencimento': tarefa['vencimento'],
+                'status': 'Concluída com sucesso!'
+            })
+            self.__arquivo_tarefa(tarefa['id']).unlink()
+        except Exception as e:
+            logger.error(
+                f'Falha ao finalizar a tarefa da matrícula {tarefa["matricula"]}. Erro: {e}')
+        finally:
+            self.__concluir()
+
+    def __reagendar(self, lote: List[Dict[str, str]]) -> None:
+        """ Agenda nova tentativa do lote com recuo exponencial ou move as suas tarefas para falha/. """
+        for tarefa in lote:
+            tarefa['tentativas'] += 1
+        tentativas = max(tarefa['tentativas'] for tarefa in lote)
+        matriculas = ', '.join(dict.fromkeys(tarefa['matricula'] for tarefa in lote))
+        if tentativas >= self.__tentativas:
+            logger.critical(
+                f'Envio da(s) matrícula(s) {matriculas} falhou após {tentativas} tentativas.')
+            for tarefa in lote:
+                self.resultados.append({
+                    'cliente': tarefa['cliente'],
+                    'matricula': tarefa['matricula'],
+                    'vencimento': tarefa['vencimento'],
+                    'status': 'FALHA! Erro no envio do e-mail.'
+                })
+                try:
+                    os.replace(
+                        self.__arquivo_tarefa(tarefa['id']),
+                        self.__dir_falha.joinpath(tarefa['id'] + '.json')
+                    )
+                except OSError as e:
+                    logger.error(f'Falha ao mover a tarefa para {self.__dir_falha}. Erro: {e}')
+                self.__concluir()
+            return
+        espera = self.__espera * 2 ** (tentativas - 1)
+        logger.warning(
+            f'Nova tentativa de envio da(s) matrícula(s) {matriculas} em {espera:.0f}s.')
+        for tarefa in lote:
+            try:
+                self.__gravar_tarefa(tarefa)
+            except OSError:
+                pass
+        temporizador = Timer(espera, self.__fila.put, args=(lote,))
+        temporizador.daemon = True
+        temporizador.start()
+
+    def aguardar(self) -> List[Dict[str, str]]:
+        """
+        Envia as mensagens agrupadas pendentes, aguarda o envio (ou a falha definitiva)
+        de todas as tarefas e encerra os workers.
+        :returns
+            Lista com os resultados dos envios.
+        """
+        self.liberar()
+        with self.__condicao:
+            while self.__pendentes > 0:
+                self.__condicao.wait()
+        for _ in self.__threads:
+            self.__fila.put(None)
+        for thread in self.__threads:
+            thread.join()
+        self.__threads = list()
+        return self.resultados
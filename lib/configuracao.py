@@ -0,0 +1,145 @@
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from lib.log import logger
+from lib.secret import Criptografia
+from lib.util import ArquivoConfig
+
+ARQUIVO_SMTP = 'smtp.yaml'
+ARQUIVO_CORPO_EMAIL = 'config/corpo_email.html'
+CHAVES_SMTP = ('host', 'porta', 'usuario', 'senha')
+# Limite padrão dos anexos de uma mensagem agrupada, abaixo dos 25 MB dos provedores
+# (a codificação base64 aumenta o tamanho em cerca de um terço)
+LIMITE_ANEXOS = 15 * 2 ** 20
+
+
+class ConfiguracaoInvalida(Exception):
+    """ Configuração ausente ou inválida: a execução não deve começar. """
+
+
+class ConfigSmtp(NamedTuple):
+    """ Parâmetros do servidor SMTP, com a senha já descriptografada. """
+    host: str
+    porta: int
+    usuario: str
+    senha: str
+    ssl: bool = True
+    mensagens_por_conexao: int = 100
+    agrupar: bool = False
+    limite_anexos: int = LIMITE_ANEXOS
+
+    def __repr__(self) -> str:
+        return f'ConfigSmtp(host={self.host!r}, porta={self.porta}, usuario={self.usuario!r}, senha=***)'
+
+
+class Configuracao(NamedTuple):
+    """ Configuração imutável da execução, carregada e validada uma única vez. """
+    smtp: ConfigSmtp
+    remetente: str
+    corpo_html: str
+
+
+def carregar_corpo_html(arquivo: str = ARQUIVO_CORPO_EMAIL) -> str:
+    """
+    Lê o modelo HTML do corpo dos e-mails.
+    :args
+        {arquivo} [str] - Caminho do modelo (padrão: config/corpo_email.html).
+    :returns
+        Corpo HTML pronto para o envio.
+    """
+    try:
+        corpo_html = Path.cwd().joinpath(arquivo).read_text(encoding='utf-8')
+    except (OSError, UnicodeDecodeError) as e:
+        raise ConfiguracaoInvalida(f'Falha ao ler o corpo do e-mail {arquivo}: {e}') from e
+    if not corpo_html.strip():
+        raise ConfiguracaoInvalida(f'O corpo do e-mail {arquivo} está vazio.')
+    return corpo_html
+
+
+def validar_smtp(conf_smtp: dict) -> ConfigSmtp:
+    """
+    Valida os parâmetros do config/smtp.yaml e descriptografa a senha.
+    :args
+        {conf_smtp} [dict] - Conteúdo do config/smtp.yaml.
+    :returns
+        ConfigSmtp.
+    """
+    ausentes = [chave for chave in CHAVES_SMTP if not conf_smtp.get(chave)]
+    if ausentes:
+        raise ConfiguracaoInvalida(
+            f'Parâmetro(s) ausente(s) em config/{ARQUIVO_SMTP}: {", ".join(ausentes)}.')
+    try:
+        porta = int(conf_smtp['porta'])
+        mensagens_por_conexao = int(conf_smtp.get('mensagens_por_conexao', 100))
+        limite_anexos = int(float(conf_smtp.get('limite_anexos_mb', LIMITE_ANEXOS / 2 ** 20)) * 2 ** 20)
+    except (TypeError, ValueError) as e:
+        raise ConfiguracaoInvalida(f'Parâmetro numérico inválido em config/{ARQUIVO_SMTP}: {e}') from e
+    chave = Criptografia().ler_chave_cripto()
+    if not chave:
+        raise ConfiguracaoInvalida(
+            'Chave criptográfica privada não encontrada. Execute python agua.py --config_pk')
+    try:
+        senha = Fernet(chave).decrypt(str(conf_smtp['senha']).encode('utf-8')).decode('utf-8')
+    except (InvalidToken, ValueError) as e:
+        raise ConfiguracaoInvalida(
+            'A senha do SMTP não pode ser descriptografada com config/secret.key. '
+            'Execute python agua.py --config_smtp') from e
+    return ConfigSmtp(
+        host=str(conf_smtp['host']),
+        porta=porta,
+        usuario=str(conf_smtp['usuario']),
+        senha=senha,
+        ssl=bool(conf_smtp.get('ssl', True)),
+        mensagens_por_conexao=mensagens_por_conexao,
+        agrupar=bool(conf_smtp.get('agrupar', False)),
+        limite_anexos=limite_anexos
+    )
+
+
+def carregar_configuracao() -> Configuracao:
+    """
+    Carrega, valida e descriptografa toda a configuração da execução.
+    :args
+        Nenhum.
+    :returns
+        Configuracao.
+    """
+    if not ArquivoConfig(ARQUIVO_SMTP).arquivo:
+        raise ConfiguracaoInvalida(
+            f'config/{ARQUIVO_SMTP} não encontrado. Execute python agua.py --config_smtp')
+    conf_smtp = ArquivoConfig(ARQUIVO_SMTP).carregar_arquivo()
+    if not isinstance(conf_smtp, dict):
+        raise ConfiguracaoInvalida(f'config/{ARQUIVO_SMTP} ilegível.')
+    smtp = validar_smtp(conf_smtp)
+    return Configuracao(
+        smtp=smtp,
+        remetente=str(conf_smtp.get('remetente') or smtp.usuario),
+        corpo_html=carregar_corpo_html()
+    )
+
+
+# Configuração da execução: carregada na primeira consulta e compartilhada por todos os workers
+__configuracao: Configuracao = None
+__trava = Lock()
+
+
+def configuracao() -> Configuracao:
+    """
+    Retorna a configuração da execução, carregando-a na primeira chamada.
+    Lança ConfiguracaoInvalida se a configuração estiver ausente ou inválida.
+    :args
+        Nenhum.
+    :returns
+        Configuracao.
+    """
+    global __configuracao
+    with __trava:
+        if __configuracao is None:
+            __configuracao = carregar_configuracao()
+            logger.info(
+                f'Configuração carregada: SMTP {__configuracao.smtp.host}:{__configuracao.smtp.porta}, '
+                f'remetente {__configuracao.remetente}.')
+        return __configuracao
@@ -0,0 +1,214 @@
+import re
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Match, NamedTuple
+
+from lib.log import logger
+from lib.vencimento import converter_vencimento
+
+# Início e final do arquivo em que o cabeçalho %PDF- e o startxref/%%EOF são procurados
+TAMANHO_CABECALHO = 1024
+TAMANHO_FINAL = 2048
+
+STARTXREF = re.compile(rb'startxref\s+(\d+)\s+%%EOF')
+OBJETO = re.compile(rb'\d+\s+\d+\s+obj\b')
+STREAM = re.compile(rb'(?<!end)stream\r?\n')
+# Streams sem texto: imagens, fontes, metadados, objetos e tabelas xref comprimidos
+STREAM_SEM_TEXTO = re.compile(
+    rb'/Subtype\s*/(?!Form\b)\w+|/Type\s*/(?:XRef|ObjStm|Metadata)\b|/Length[123]\b')
+# Strings (literais e hexadecimais) e operadores de texto do conteúdo das páginas
+TOKEN_TEXTO = re.compile(rb'''\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>|(?:T[Jj*dDm]|ET)(?![A-Za-z])|'|"''', re.S)
+ESCAPE = re.compile(rb'\\([nrtbf()\\]|[0-7]{1,3}|\r?\n)')
+ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f', b'(': b'(', b')': b')', b'\\': b'\\'}
+
+MATRICULA = re.compile(r'Matr[íi]cula\W*(\d[\d.\-/]*\d)', re.I)
+VENCIMENTO = re.compile(r'Vencimento\W*(\d{2}/\d{2}/\d{2,4})', re.I)
+VALOR = re.compile(r'Valor[^\n\d]*?R\$\s*(\d[\d.]*,\d{2})', re.I)
+VALOR_LIVRE = re.compile(r'R\$\s*(\d[\d.]*,\d{2})')
+LINHA_DIGITAVEL = re.compile(r'Linha\s+digit[áa]vel\W*(\d[\d .\-]+\d)', re.I)
+LINHA_LIVRE = re.compile(r'\d[\d .\-]{44,70}\d')
+
+
+class ContaInvalida(Exception):
+    """ PDF da conta incompleto, corrompido ou de outra matrícula/vencimento: não deve ser enviado. """
+
+
+class DadosConta(NamedTuple):
+    """ Dados extraídos da camada de texto do PDF da conta (None se não encontrados). """
+    matricula: str
+    vencimento: date
+    valor: Decimal
+    linha_digitavel: str
+
+
+def __modulo10(numero: str) -> int:
+    """ Dígito verificador módulo 10 (FEBRABAN). """
+    soma = 0
+    for i, digito in enumerate(reversed(numero)):
+        produto = int(digito) * (2 if i % 2 == 0 else 1)
+        soma += produto // 10 + produto % 10
+    return (10 - soma % 10) % 10
+
+
+def __modulo11(numero: str) -> int:
+    """ Dígito verificador módulo 11 dos blocos da linha digitável de arrecadação. """
+    soma = sum(int(digito) * (2 + i % 8) for i, digito in enumerate(reversed(numero)))
+    resto = soma % 11
+    return 0 if resto in (0, 1) else 11 - resto
+
+
+def __valor_linha(linha: str) -> Decimal:
+    """
+    Confere os dígitos verificadores da linha digitável (somente dígitos) e retorna o valor nela
+    contido (None se a linha não informa o valor).
+    Arrecadação (48 dígitos, iniciada por 8): 4 blocos de 11 dígitos + DV módulo 10 ou 11.
+    Bloqueto bancário (47 dígitos): 3 campos com DV módulo 10 e o valor nos 10 últimos dígitos.
+    """
+    if len(linha) == 48 and linha[0] == '8':
+        dv = __modulo10 if linha[2] in '67' else __modulo11
+        blocos = [linha[i:i + 12] for i in range(0, 48, 12)]
+        if any(dv(bloco[:11]) != int(bloco[11]) for bloco in blocos):
+            raise ContaInvalida(f'Dígito verificador inválido na linha digitável {linha}.')
+        barras = ''.join(bloco[:11] for bloco in blocos)
+        return Decimal(int(barras[4:15])) / 100 if linha[2] in '68' else None
+    if len(linha) == 47:
+        for inicio, fim in ((0, 9), (10, 20), (21, 31)):
+            if __modulo10(linha[inicio:fim]) != int(linha[fim]):
+                raise ContaInvalida(f'Dígito verificador inválido na linha digitável {linha}.')
+        return Decimal(int(linha[-10:])) / 100 or None
+    raise ContaInvalida(f'Linha digitável com {len(linha)} dígitos: {linha}.')
+
+
+def __validar_estrutura(dados: bytes) -> None:
+    """ Confere o cabeçalho, o %%EOF e a tabela de referências (startxref) do PDF. """
+    if b'%PDF-' not in dados[:TAMANHO_CABECALHO]:
+        raise ContaInvalida('O arquivo não é um PDF.')
+    final = STARTXREF.findall(dados[-TAMANHO_FINAL:])
+    if not final:
+        raise ContaInvalida('PDF incompleto: startxref/%%EOF não encontrado.')
+    posicao = int(final[-1])
+    if not (dados.startswith(b'xref', posicao) or OBJETO.match(dados, posicao)):
+        raise ContaInvalida(f'PDF corrompido: tabela de referências ausente na posição {posicao}.')
+
+
+def __literal(texto: bytes) -> bytes:
+    """ Conteúdo de uma string literal do PDF, sem os parênteses e com os escapes resolvidos. """
+    def escape(encontrado: Match) -> bytes:
+        sequencia = encontrado.group(1)
+        if sequencia in ESCAPES:
+            return ESCAPES[sequencia]
+        if sequencia.isdigit():
+            return bytes([int(sequencia, 8) & 0xFF])
+        # Quebra de linha escapada: continuação da string
+        return b''
+
+    return ESCAPE.sub(escape, texto[1:-1])
+
+
+def extrair_texto(dados: bytes) -> str:
+    """
+    Extrai a camada de texto dos streams de conteúdo do PDF (operadores Tj, TJ, ' e "),
+    uma linha por posicionamento de texto. Streams FlateDecode são descomprimidos.
+    :args
+        {dados} [bytes] - Conteúdo do arquivo PDF.
+    :returns
+        Texto extraído (vazio se o PDF não tiver camada de texto legível).
+    """
+    linhas: List[str] = list()
+    atual: List[bytes] = list()
+    posicao = 0
+    while True:
+        inicio = STREAM.search(dados, posicao)
+        if inicio is None:
+            break
+        fim = dados.find(b'endstream', inicio.end())
+        if fim < 0:
+            raise ContaInvalida('PDF corrompido: stream sem endstream.')
+        posicao = fim + len(b'endstream')
+        dicionario = dados[dados.rfind(b'obj', 0, inicio.start()):inicio.start()]
+        if STREAM_SEM_TEXTO.search(dicionario):
+            continue
+        conteudo = dados[inicio.end():fim]
+        if b'/FlateDecode' in dicionario:
+            try:
+                conteudo = zlib.decompressobj().decompress(conteudo)
+            except zlib.error as e:
+                raise ContaInvalida(f'PDF corrompido: stream comprimido ilegível ({e}).') from e
+        if b'BT' not in conteudo:
+            continue
+        strings: List[bytes] = list()
+        for token in TOKEN_TEXTO.finditer(conteudo):
+            valor = token.group()
+            if valor.startswith(b'('):
+                strings.append(__literal(valor))
+            elif valor.startswith(b'<'):
+                hexadecimal = re.sub(rb'\s', b'', valor[1:-1])
+                strings.append(bytes.fromhex((hexadecimal + b'0' * (len(hexadecimal) % 2)).decode()))
+            else:
+                if valor in (b"'", b'"'):
+                    linhas.append(b''.join(atual).decode('cp1252', 'replace'))
+                    atual = list()
+                atual.extend(strings)
+                strings = list()
+                if valor not in (b'Tj', b'TJ'):
+                    linhas.append(b''.join(atual).decode('cp1252', 'replace'))
+                    atual = list()
+    linhas.append(b''.join(atual).decode('cp1252', 'replace'))
+    return '\n'.join(linha for linha in linhas if linha.strip())
+
+
+def __data(texto: str) -> date:
+    try:
+        return datetime.strptime(texto, '%d/%m/%Y').date()
+    except ValueError:
+        return converter_vencimento(texto)
+
+
+def validar_conta(arquivo: str, matricula: str = '', vencimento: str = '') -> DadosConta:
+    """
+    Valida o PDF baixado e extrai da sua camada de texto a matrícula, o vencimento, o valor e a
+    linha digitável, conferindo-os com a linha da tabela de vencimentos do portal.
+    Um PDF incompleto ou corrompido, de outra matrícula ou vencimento, com a linha digitável
+    inválida ou com o valor divergente do da linha digitável lança ContaInvalida.
+    Os campos ausentes do texto (ex.: PDF só com imagem) não impedem o envio.
+    Função pura, sem estado: pode ser executada em um pool de processos.
+    :args
+        {arquivo} [str] - Caminho do PDF.
+        {matricula} [str] - Matrícula da conta no cadastro (padrão: não conferida).
+        {vencimento} [str] - Vencimento da tabela do portal, dd/mm/aa (padrão: não conferido).
+    :returns
+        DadosConta.
+    """
+    try:
+        with open(arquivo, 'rb') as arq:
+            dados = arq.read()
+    except OSError as e:
+        raise ContaInvalida(f'Falha ao ler o PDF {arquivo}: {e}') from e
+    __validar_estrutura(dados)
+    texto = extrair_texto(dados)
+    encontrado = MATRICULA.search(texto)
+    matricula_pdf = encontrado.group(1) if encontrado else None
+    if matricula_pdf and matricula \
+            and re.sub(r'\D', '', matricula_pdf) != re.sub(r'\D', '', matricula):
+        raise ContaInvalida(f'O PDF é da matrícula {matricula_pdf}, e não da {matricula}.')
+    encontrado = VENCIMENTO.search(texto)
+    vencimento_pdf = __data(encontrado.group(1)) if encontrado else None
+    if vencimento_pdf and vencimento and vencimento_pdf != __data(vencimento):
+        raise ContaInvalida(
+            f'O PDF vence em {vencimento_pdf.strftime("%d/%m/%Y")}, e não em {vencimento}.')
+    encontrado = VALOR.search(texto) or VALOR_LIVRE.search(texto)
+    valor = Decimal(encontrado.group(1).replace('.', '').replace(',', '.')) if encontrado else None
+    linha = None
+    for candidato in LINHA_DIGITAVEL.findall(texto) or LINHA_LIVRE.findall(texto):
+        digitos = re.sub(r'\D', '', candidato)
+        if len(digitos) in (47, 48):
+            linha = digitos
+            break
+    if linha:
+        valor_linha = __valor_linha(linha)
+        if valor is not None and valor_linha is not None and valor != valor_linha:
+            raise ContaInvalida(f'Valor do PDF (R$ {valor}) diferente do da linha digitável (R$ {valor_linha}).')
+    if not (matricula_pdf and vencimento_pdf and valor is not None and linha):
+        logger.warning(f'Camada de texto incompleta no PDF {arquivo}: campos não conferidos.')
+    return DadosConta(matricula_pdf, vencimento_pdf, valor, linha)
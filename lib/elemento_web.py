@@ -1,8 +1,14 @@
+import os
+from pathlib import Path
+from time import monotonic, sleep
+from typing import Dict
+
 from selenium.common.exceptions import NoSuchElementException, TimeoutException
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
 
+from lib.espera import esperar
 from lib.log import logger
+from lib.metricas import METRICAS
 
 
 class BuscarElementos:
@@ -11,7 +17,8 @@ class BuscarElementos:
         driver,
         locator: tuple,
         excecao: bool = True,
-        lista_de_um: bool = False
+        lista_de_um: bool = False,
+        timeout: float = None
     ) -> None:
         """
         Classe para busca de elementos no DOM de uma página Web.
@@ -20,6 +27,8 @@ class BuscarElementos:
             {locator} [tuple] - Parâmetros da busca (Método, 'argumento para busca').
             {excecao} [bool] - Se tratará ou não caso ocorra uma exceção (padrão: True).
             {lista_de_um} [bool] - Se retorna uma string com o texto do elemento encontrado na primeira posição da lista (padrão: False).        
+            {timeout} [float] - Tempo máximo de espera fixo. Se não informado, usa o tempo aprendido
+                para o locator nas execuções recentes (ver lib.espera.EstatisticaEspera).
         :methods
             buscar()
 
@@ -28,6 +37,7 @@ class BuscarElementos:
         self.__locator: tuple = locator
         self.__excecao: bool = excecao
         self.__lista_de_um: bool = lista_de_um
+        self.__timeout: float = timeout
 
     @property
     def driver(self):
@@ -53,40 +63,39 @@ class BuscarElementos:
             {locator} - Tupla com (By.CLASSE, elemento) para a pesquisa.
         :returns
             {busca}:
-                    None - se a busca falhar,
+                    None - se a busca falhar (a sessão do navegador é mantida; ver SupervisorNavegador),
                     Webelement - o resultado da busca,
                     Lista de webelements - com os resultados encontrados.
         """
-        wait = WebDriverWait(self.driver, 20)
-
         # Variável com o conteúdo da chave elemento para utilização no except
         elemento = self.locator[1]
 
         try:
-            busca = wait.until(
-                EC.visibility_of_all_elements_located(self.locator)
-            )
+            with METRICAS.medir('busca_elemento', elemento=elemento):
+                busca = esperar(
+                    self.driver,
+                    EC.visibility_of_all_elements_located(self.locator),
+                    chave=f'{self.locator[0]}={elemento}',
+                    timeout=self.__timeout
+                )
         except TimeoutException as erro:
             if not self.excecao:
                 pass
             else:
                 logger.critical(
                     f'Tempo expirou... o elemento [{elemento}] não existe ou não ficou visível na página. Erro: {erro}.')
-                self.driver.quit()
         except NoSuchElementException as erro:
             if not self.excecao:
                 pass
             else:
                 logger.critical(
                     f'Elemento [{elemento}] não encontrado na página. Erro: {erro}.')
-                self.driver.quit()
         except Exception as erro:
             if not self.excecao:
                 pass
             else:
                 logger.critical(
                     f'Falha ao encontrar o elemento [{elemento}] na página. Erro: {erro}')
-                self.driver.quit()
         else:
             if len(busca) < 2:
                 if not self.lista_de_um:
@@ -95,39 +104,77 @@ class BuscarElementos:
 
 
 class ArquivoDownload:
-    def __init__(self, driver) -> str:
+    # Extensões de arquivos temporários gravados pelo Chrome durante o download
+    TEMPORARIOS = ('.crdownload', '.tmp', '.part')
+
+    def __init__(self, diretorio: str, timeout: float = 60, intervalo: float = 0.2) -> None:
         """
-        Classe que captura o nome do último arquivo baixado pelo WebDriver.
+        Classe que acompanha o diretório de download do WebDriver e captura o arquivo concluído.
+        Dispensa a navegação até chrome://downloads/: basta marcar() antes do clique e aguardar() depois.
         :args
-            {driver} - WebDriver (Navegador Chrome).
-        :returns
-            [str] - Nome e extensão do arquivo baixado.
+            {diretorio} [str] - Diretório de download exclusivo do navegador.
+            {timeout} [float] - Tempo máximo de espera pelo download em segundos (padrão: 60).
+            {intervalo} [float] - Intervalo entre as verificações do diretório em segundos (padrão: 0.2).
         :methods
+            marcar()
             arquivo()
         """
-        self.__driver = driver
+        self.__diretorio = Path(diretorio)
+        self.__timeout: float = timeout
+        self.__intervalo: float = intervalo
+        self.__existentes: Dict[str, float] = dict()
 
     @property
-    def driver(self):
-        return self.__driver
+    def diretorio(self):
+        return self.__diretorio
+
+    def __listar(self) -> Dict[str, float]:
+        """ Arquivos do diretório com a data da última modificação. """
+        try:
+            return {
+                entrada.name: entrada.stat().st_mtime
+                for entrada in os.scandir(self.diretorio) if entrada.is_file()
+            }
+        except OSError:
+            return dict()
 
+    def marcar(self) -> None:
+        """ Registra o conteúdo do diretório antes do clique que inicia o download. """
+        self.__existentes = self.__listar()
+
+    @METRICAS.medido('download', contar_falhas=True)
     def arquivo(self) -> str:
         """
-        Captura o nome do arquivo baixado, por meio de script na página download (chrome://downloads/).
+        Aguarda um arquivo novo (ou regravado) no diretório, enquanto não houver um temporário novo
+        do Chrome, e o retorna assim que o tamanho dele se estabilizar.
         :args
             Nenhum.
         :returns
-            Nome do arquivo baixado.
+            Caminho absoluto do arquivo baixado ou vazio se o tempo expirar.
         """
-        try:
-            self.driver.get('chrome://downloads/')
-            arquivo = self.driver.execute_script(
-                'return document.querySelector("downloads-manager").shadowRoot.querySelector("#downloadsList downloads-item").shadowRoot.querySelector("#file-link").text'
-            )
-        except Exception as e:
-            logger.critical(
-                f'Erro ao capturar o arquivo de Download: {e}'
-            )
-            self.driver.quit()
-        else:
-            return arquivo
+        limite = monotonic() + self.__timeout
+        candidato: str = ''
+        tamanho_anterior: int = -1
+        while monotonic() < limite:
+            atuais = self.__listar()
+            # Temporários que já existiam antes do clique são restos de downloads interrompidos
+            em_andamento = any(
+                nome.endswith(self.TEMPORARIOS) and nome not in self.__existentes for nome in atuais)
+            novos = [
+                nome for nome, modificacao in atuais.items()
+                if not nome.endswith(self.TEMPORARIOS)
+                and self.__existentes.get(nome) != modificacao
+            ]
+            if novos and not em_andamento:
+                novo = max(novos, key=lambda nome: atuais[nome])
+                try:
+                    tamanho = self.diretorio.joinpath(novo).stat().st_size
+                except OSError:
+                    tamanho = -1
+                if novo == candidato and tamanho == tamanho_anterior and tamanho > 0:
+                    return str(self.diretorio.joinpath(novo))
+                candidato, tamanho_anterior = novo, tamanho
+            sleep(self.__intervalo)
+        logger.critical(
+            f'Tempo expirou aguardando o download no diretório {self.diretorio}.')
+        return ''
@@ -0,0 +1,345 @@
+import os
+from concurrent.futures import Executor
+from threading import Lock
+from typing import Callable, Dict, List, NamedTuple, Set, Tuple
+from uuid import uuid4
+
+from controle.diario_execucao import (ETAPA_BAIXADA, ETAPA_CONCLUIDA,
+                                      ETAPA_CONSULTADA, ETAPA_ENFILEIRADA,
+                                      ETAPA_RENOMEADA, ETAPAS, registrar_etapa)
+from controle.matricula_processada import (retornar_contas_processadas,
+                                          retornar_hashes_processados)
+from lib.caixa_saida import CaixaSaida
+from lib.configuracao import ARQUIVO_CORPO_EMAIL
+from lib.conta_pdf import ContaInvalida, DadosConta, validar_conta
+from lib.espera import Disjuntor, Ritmo
+from lib.log import logger
+from lib.metricas import METRICAS
+from lib.mineracao import Cadastro
+from lib.segunda_via_http import SegundaViaHttp
+from lib.util import hash_arquivo
+from lib.vencimento import JanelaVencimento
+
+
+def nome_conta(cliente: str, matricula: str, vencimento: str) -> str:
+    """ Nome padrão do PDF da conta: NomeCliente-NúmeroMatrícula-DataVencimento.pdf """
+    return cliente + '-' + matricula.replace('-', '') + '-' + vencimento.replace('/', '-') + '.pdf'
+
+
+def assunto_conta(cadastro: Cadastro) -> str:
+    """ Assunto do e-mail de uma conta: Segunda via CEDAE <-> NomeCliente-NúmeroMatrícula """
+    return f'Segunda via CEDAE <-> {cadastro.cliente}-{cadastro.matricula.replace("-", "")}'
+
+
+class ContaBaixada(NamedTuple):
+    """ Conta baixada do portal (ou retomada do diário), antes da renomeação e da validação. """
+    cadastro: Cadastro
+    vencimento: str
+    arquivo: str
+
+
+class ControleEmissao(object):
+    def __init__(
+        self,
+        dir_download: str,
+        janela: JanelaVencimento,
+        remetente: str,
+        execucao: str = None
+    ) -> None:
+        """
+        Etapas comuns ao bot (motores selenium e http) e ao pipeline: busca das contas pelo motor
+        HTTP, retomada do diário, renomeação, validação e entrega das contas à caixa de saída.
+        Mantém o controle por conta (matrícula, vencimento) e por hash do PDF e os resultados da
+        execução; pode ser compartilhado entre threads.
+        :args
+            {dir_download} [str] - Diretório dos PDFs renomeados e dos baixados pelo motor HTTP.
+            {janela} [JanelaVencimento] - Janela de vencimentos a emitir.
+            {remetente} [str] - E-mail de origem das contas.
+            {execucao} [str] - Execução do diário em que as etapas são registradas.
+        :methods
+            carregar()
+            registrar_resultado()
+            processada()
+            retomar()
+            buscar_http()
+            renomear()
+            preparar()
+            enfileirar()
+            entregar()
+        """
+        self.__dir_download: str = dir_download
+        self.__janela: JanelaVencimento = janela
+        self.__remetente: str = remetente
+        self.__execucao: str = execucao
+        self.__resultados: List[Dict[str, str]] = list()
+        self.__contas_processadas: Set[Tuple[str, str]] = set()
+        self.__hashes_processados: Set[Tuple[str, str]] = set()
+        self.__trava = Lock()
+
+    @property
+    def dir_download(self):
+        return self.__dir_download
+
+    @property
+    def janela(self):
+        return self.__janela
+
+    @property
+    def execucao(self):
+        return self.__execucao
+
+    @execucao.setter
+    def execucao(self, execucao: str) -> None:
+        self.__execucao = execucao
+
+    @property
+    def resultados(self):
+        return self.__resultados
+
+    def carregar(self) -> None:
+        """ Carrega, uma única vez, o controle por conta e por hash para consultas por pertinência. """
+        contas = retornar_contas_processadas()
+        hashes = retornar_hashes_processados()
+        with self.__trava:
+            self.__contas_processadas = contas
+            self.__hashes_processados = hashes
+
+    def registrar_resultado(self, cadastro: Cadastro, vencimento: str = '', status: str = '') -> None:
+        """
+        Registra o resultado da matrícula para o resumo consolidado da execução.
+        :args
+            {cadastro} [Cadastro] - Matrícula processada.
+            {vencimento} [str] - Vencimento extraído do site da prestadora.
+            {status} [str] - Mensagem de status do processamento.
+        :returns
+            Nenhum.
+        """
+        self.resultados.append({
+            'cliente': cadastro.cliente,
+            'matricula': cadastro.matricula,
+            'vencimento': vencimento,
+            'status': status
+        })
+        METRICAS.incrementar(
+            'resultados_total', status='falha' if status.startswith('FALHA') else 'ok')
+
+    def processada(self, matricula: str, vencimento: str) -> bool:
+        """
+        Verifica se a conta (matrícula, vencimento) já foi enviada ou enfileirada, evitando o download.
+        :args
+            {matricula} [str] - Número da matrícula.
+            {vencimento} [str] - Vencimento extraído do site da prestadora.
+        :returns
+            True/False.
+        """
+        with self.__trava:
+            processada = (matricula, vencimento) in self.__contas_processadas
+        if processada:
+            logger.info(f'Conta da matrícula {matricula} com vencimento {vencimento} já enviada.')
+        return processada
+
+    def retomar(self, cadastro: Cadastro, etapas: Dict[str, Tuple[str, str]]) -> List[ContaBaixada]:
+        """
+        Contas da matrícula no diário da execução retomada: as já enfileiradas não são baixadas
+        de novo e as baixadas, cujo PDF ainda existe, são devolvidas para a entrega (e também não
+        são baixadas de novo).
+        :args
+            {cadastro} [Cadastro] - Matrícula retomada.
+            {etapas} [dict] - Etapas da matrícula no diário, por vencimento (ver retornar_etapas()).
+        :returns
+            Lista de ContaBaixada a reaproveitar.
+        """
+        contas: List[ContaBaixada] = list()
+        for vencimento, (etapa, arquivo) in etapas.items():
+            if not vencimento:
+                continue
+            if ETAPAS.index(etapa) < ETAPAS.index(ETAPA_ENFILEIRADA):
+                if not arquivo or not os.path.isfile(arquivo):
+                    continue
+                logger.info(f'Reaproveitando a conta já baixada {arquivo}.')
+                contas.append(ContaBaixada(cadastro, vencimento, arquivo))
+            # A conta reaproveitada não é baixada de novo enquanto aguarda a entrega
+            with self.__trava:
+                self.__contas_processadas.add((cadastro.matricula, vencimento))
+        return contas
+
+    def buscar_http(
+        self,
+        motor_http: SegundaViaHttp,
+        cadastro: Cadastro,
+        ritmo: Ritmo,
+        disjuntor: Disjuntor,
+        ao_baixar: Callable[[ContaBaixada], None],
+        concluir: bool = True
+    ) -> bool:
+        """
+        Consulta a matrícula pelo motor HTTP e baixa, página a página, as contas da janela ainda
+        não enviadas, registrando as etapas no diário. Lança as exceções do motor HTTP.
+        :args
+            {motor_http} [SegundaViaHttp] - Sessão HTTP com o portal (uma por thread).
+            {cadastro} [Cadastro] - Matrícula consultada.
+            {ritmo} [Ritmo] - Limitador de requisições ao portal.
+            {disjuntor} [Disjuntor] - Disjuntor do portal, informado da resposta à consulta.
+            {ao_baixar} [Callable] - Recebe cada ContaBaixada assim que o download termina.
+            {concluir} [bool] - Se registra a matrícula como concluída ao final (padrão: True). Quem
+                enfileira as contas depois do retorno (ex.: o pipeline) a conclui só após enfileirá-las.
+        :returns
+            False se o portal emitiu o alerta de documento inválido; True caso contrário.
+        """
+        ritmo.aguardar()
+        with METRICAS.medir('consulta', motor='http'):
+            pagina = motor_http.consultar(cadastro.matricula, cadastro.documento)
+        disjuntor.registrar_sucesso()
+        if pagina.alerta:
+            logger.error('A página emitiu um alerta de documento inválido!')
+            self.registrar_resultado(cadastro, status='FALHA! Alerta de Documento inválido.')
+            registrar_etapa(self.execucao, cadastro.matricula, ETAPA_CONCLUIDA)
+            return False
+        registrar_etapa(self.execucao, cadastro.matricula, ETAPA_CONSULTADA)
+        # A mesma conta não é baixada duas vezes, mesmo que apareça em mais de uma página
+        baixadas: Set[str] = set()
+        numero_pagina = 1
+        while pagina is not None:
+            for vencimento in motor_http.vencimentos(pagina, numero_pagina):
+                if not self.janela.contem(vencimento.data) or vencimento.texto in baixadas \
+                        or self.processada(cadastro.matricula, vencimento.texto):
+                    continue
+                baixadas.add(vencimento.texto)
+                with METRICAS.medir('download_http'):
+                    arquivo_conta = motor_http.baixar(
+                        pagina,
+                        vencimento.linha,
+                        com_documento=bool(cadastro.documento),
+                        destino=self.dir_download + f'segunda_via_{uuid4().hex}.pdf'
+                    )
+                # Registrada antes de a conta seguir adiante, para a retomada encontrar o PDF
+                if arquivo_conta:
+                    registrar_etapa(
+                        self.execucao, cadastro.matricula, ETAPA_BAIXADA,
+                        vencimento=vencimento.texto, arquivo=arquivo_conta)
+                ao_baixar(ContaBaixada(cadastro, vencimento.texto, arquivo_conta))
+            ritmo.aguardar()
+            pagina = motor_http.proxima_pagina(pagina)
+            numero_pagina += 1
+        if concluir:
+            registrar_etapa(self.execucao, cadastro.matricula, ETAPA_CONCLUIDA)
+        return True
+
+    @METRICAS.medido('renomeacao', contar_falhas=True)
+    def renomear(self, conta: ContaBaixada) -> str:
+        """
+        Renomeia o arquivo baixado para o padrão NomeCliente-NúmeroMatrícula-DataVencimento.pdf.
+        :args
+            {conta} [ContaBaixada] - Conta com o caminho absoluto do arquivo baixado.
+        :returns
+            [str] - Caminho absoluto do arquivo renomeado ou vazio se o download não foi concluído.
+        """
+        cadastro = conta.cadastro
+        try:
+            if not conta.arquivo:
+                raise FileNotFoundError('download não concluído')
+            registrar_etapa(
+                self.execucao, cadastro.matricula, ETAPA_BAIXADA,
+                vencimento=conta.vencimento, arquivo=conta.arquivo)
+            conta_renomeada: str = self.dir_download + nome_conta(
+                cadastro.cliente, cadastro.matricula, conta.vencimento)
+            os.replace(conta.arquivo, conta_renomeada)
+            registrar_etapa(
+                self.execucao, cadastro.matricula, ETAPA_RENOMEADA,
+                vencimento=conta.vencimento, arquivo=conta_renomeada)
+            logger.info(f'Arquivo {conta_renomeada} processado com sucesso!')
+            return conta_renomeada
+        except Exception as e:
+            logger.error(f'Erro ao processar o arquivo PDF da matrícula {cadastro.matricula}: {e}')
+            return ''
+
+    def preparar(self, conta: ContaBaixada, validador: Executor = None) -> Dict[str, str]:
+        """
+        Renomeia e valida o PDF, calcula o hash e descarta a conta idêntica a uma já enviada.
+        As contas descartadas ficam registradas nos resultados.
+        :args
+            {conta} [ContaBaixada] - Conta baixada.
+            {validador} [Executor] - Pool de processos que valida o PDF (padrão: na própria thread).
+        :returns
+            Tarefa de envio para a caixa de saída (ver enfileirar()) ou None se a conta foi descartada.
+        """
+        cadastro = conta.cadastro
+        arquivo_conta = self.renomear(conta)
+        if not arquivo_conta:
+            self.registrar_resultado(cadastro, conta.vencimento, 'FALHA! Arquivo PDF não gerado.')
+            return None
+        try:
+            with METRICAS.medir('validacao_pdf'):
+                if validador is not None:
+                    dados: DadosConta = validador.submit(
+                        validar_conta, arquivo_conta, cadastro.matricula, conta.vencimento).result()
+                else:
+                    dados = validar_conta(arquivo_conta, cadastro.matricula, conta.vencimento)
+        except ContaInvalida as e:
+            logger.error(f'PDF inválido para a matrícula {cadastro.matricula}: {e}')
+            self.registrar_resultado(cadastro, conta.vencimento, 'FALHA! PDF inválido.')
+            return None
+        hash_pdf = hash_arquivo(arquivo_conta)
+        with self.__trava:
+            duplicada = (cadastro.matricula, hash_pdf) in self.__hashes_processados
+            if not duplicada:
+                self.__hashes_processados.add((cadastro.matricula, hash_pdf))
+        if duplicada:
+            logger.info(f'A conta {arquivo_conta} é idêntica a uma já enviada e foi descartada.')
+            self.registrar_resultado(cadastro, conta.vencimento, 'Conta já enviada anteriormente.')
+            return None
+        return {
+            'de': self.__remetente,
+            'para': [cadastro.email],
+            'assunto': assunto_conta(cadastro),
+            'corpo_html': ARQUIVO_CORPO_EMAIL,
+            'anexo': arquivo_conta,
+            'cliente': cadastro.cliente,
+            'matricula': cadastro.matricula,
+            'documento': cadastro.documento,
+            'vencimento': conta.vencimento,
+            'hash_pdf': hash_pdf,
+            'valor': None if dados.valor is None else str(dados.valor),
+            'linha_digitavel': dados.linha_digitavel,
+            'execucao': self.execucao,
+        }
+
+    def enfileirar(self, caixa_saida: CaixaSaida, tarefa: Dict[str, str]) -> bool:
+        """
+        Coloca a conta preparada na caixa de saída, que a envia em segundo plano.
+        O registro no controle de dados processados só ocorre após a confirmação do envio.
+        :args
+            {caixa_saida} [CaixaSaida] - Caixa de saída dos e-mails.
+            {tarefa} [dict] - Tarefa devolvida por preparar().
+        :returns
+            True/False - Indicando se a conta foi colocada na caixa de saída.
+        """
+        logger.info('Enviando conta para a caixa de saída...')
+        enfileirado = caixa_saida.adicionar(**tarefa)
+        with self.__trava:
+            if enfileirado:
+                # Evita reenviar a mesma conta se ela aparecer de novo nesta execução
+                self.__contas_processadas.add((tarefa['matricula'], tarefa['vencimento']))
+            else:
+                self.__hashes_processados.discard((tarefa['matricula'], tarefa['hash_pdf']))
+        if enfileirado:
+            registrar_etapa(
+                self.execucao, tarefa['matricula'], ETAPA_ENFILEIRADA,
+                vencimento=tarefa['vencimento'], arquivo=tarefa['anexo'])
+        else:
+            self.registrar_resultado(
+                Cadastro(tarefa['cliente'], tarefa['matricula'], tarefa['documento'], tarefa['para'][0]),
+                tarefa['vencimento'], 'FALHA! Conta não enfileirada.')
+        return enfileirado
+
+    def entregar(self, conta: ContaBaixada, caixa_saida: CaixaSaida) -> bool:
+        """
+        Prepara a conta baixada e a coloca na caixa de saída (ver preparar() e enfileirar()).
+        :args
+            {conta} [ContaBaixada] - Conta baixada.
+            {caixa_saida} [CaixaSaida] - Caixa de saída dos e-mails.
+        :returns
+            True/False - Indicando se a conta foi colocada na caixa de saída.
+        """
+        tarefa = self.preparar(conta)
+        return tarefa is not None and self.enfileirar(caixa_saida, tarefa)
@@ -1,12 +1,272 @@
+import base64
+import mimetypes
+import os
+import re
 import smtplib
-from email import encoders
-from email.mime.base import MIMEBase
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
+from email.generator import BytesGenerator
+from email.message import EmailMessage, MIMEPart
+from email.policy import SMTP
+from email.utils import formatdate, make_msgid
+from io import BytesIO
 from os.path import basename
 from pathlib import Path
+from threading import RLock
+from typing import Callable, List, Union
+from uuid import uuid4
 
+from lib.configuracao import ConfigSmtp, configuracao
 from lib.log import logger
+from lib.metricas import METRICAS
+
+# Bytes lidos do anexo por vez: múltiplo de 57, que codificados em base64 formam linhas de 76 caracteres
+BLOCO_ANEXO = 57 * 1024
+
+
+class MensagemEmail(object):
+    def __init__(
+        self,
+        de: str,
+        para: List[str],
+        assunto: str,
+        corpo_html: str,
+        anexos: List[str] = None,
+        bloco: int = BLOCO_ANEXO
+    ) -> None:
+        """
+        Mensagem MIME (multipart/mixed) montada sob demanda: os cabeçalhos e o corpo são gerados
+        pela API email.message/BytesGenerator e os anexos são lidos do disco e codificados em base64
+        em blocos, direto para a saída (o socket SMTP), sem a mensagem inteira em memória.
+        :args
+            {de} [str] - E-mail de origem.
+            {para} [list] - Lista dos destinatários.
+            {assunto} [str] - Assunto da mensagem.
+            {corpo_html} [str] - Corpo HTML da mensagem.
+            {anexos} [list] - Caminhos dos arquivos anexados.
+            {bloco} [int] - Bytes lidos de cada anexo por vez (padrão: 57 KB).
+        :methods
+            escrever()
+            como_bytes()
+        """
+        self.__de: str = de
+        self.__para: List[str] = list(para)
+        self.__assunto: str = assunto
+        self.__corpo_html: str = corpo_html
+        self.__anexos: List[str] = list(anexos or list())
+        self.__bloco: int = max(57, bloco - bloco % 57)
+        self.__fronteira: str = '===============' + uuid4().hex + '=='
+
+    @property
+    def anexos(self):
+        return self.__anexos
+
+    @staticmethod
+    def __cabecalhos(parte: MIMEPart) -> bytes:
+        """ Cabeçalhos da parte, dobrados e codificados conforme o SMTP, seguidos da linha em branco. """
+        return b''.join(SMTP.fold_binary(nome, valor) for nome, valor in parte.items()) + b'\r\n'
+
+    @staticmethod
+    def __transparencia(dados: bytes) -> bytes:
+        """ Normaliza as quebras de linha para CRLF e duplica o ponto no início das linhas (RFC 5321). """
+        dados = re.sub(rb'\r\n|\n|\r', b'\r\n', dados)
+        return re.sub(rb'(?m)^\.', b'..', dados)
+
+    def escrever(self, saida: Callable[[bytes], None]) -> None:
+        """
+        Escreve a mensagem, já pronta para o comando DATA, em blocos.
+        :args
+            {saida} [Callable] - Recebe cada bloco de bytes (ex.: smtplib.SMTP.send).
+        :returns
+            Nenhum.
+        """
+        cabecalho = EmailMessage(policy=SMTP)
+        cabecalho['From'] = self.__de
+        cabecalho['To'] = ', '.join(self.__para)
+        cabecalho['Subject'] = self.__assunto
+        cabecalho['Date'] = formatdate(localtime=True)
+        cabecalho['Message-ID'] = make_msgid()
+        cabecalho['MIME-Version'] = '1.0'
+        cabecalho['Content-Type'] = f'multipart/mixed; boundary="{self.__fronteira}"'
+        saida(MensagemEmail.__cabecalhos(cabecalho))
+        delimitador = f'--{self.__fronteira}\r\n'.encode('ascii')
+
+        # Texto da mensagem
+        corpo = MIMEPart(policy=SMTP)
+        corpo.set_content(self.__corpo_html, subtype='html', charset='utf-8', cte='base64')
+        buffer = BytesIO()
+        BytesGenerator(buffer, policy=SMTP).flatten(corpo)
+        saida(delimitador + MensagemEmail.__transparencia(buffer.getvalue()))
+
+        # Anexos: linhas base64 nunca começam com ponto
+        for anexo in self.__anexos:
+            parte = MIMEPart(policy=SMTP)
+            parte['Content-Type'] = mimetypes.guess_type(anexo)[0] or 'application/octet-stream'
+            parte.add_header(
+                'Content-Disposition', 'attachment', filename=basename(anexo).replace(' ', '_'))
+            parte['Content-Transfer-Encoding'] = 'base64'
+            saida(b'\r\n' + delimitador + MensagemEmail.__cabecalhos(parte))
+            with open(anexo, 'rb') as arquivo:
+                while True:
+                    dados = arquivo.read(self.__bloco)
+                    if not dados:
+                        break
+                    saida(base64.encodebytes(dados).replace(b'\n', b'\r\n'))
+        saida(f'\r\n--{self.__fronteira}--\r\n'.encode('ascii'))
+
+    def como_bytes(self) -> bytes:
+        """ Mensagem completa em memória (com a transparência do DATA), para inspeção. """
+        buffer = BytesIO()
+        self.escrever(buffer.write)
+        return buffer.getvalue()
+
+
+class ConexaoSmtp(object):
+    def __init__(
+        self,
+        host: str,
+        port: int = 465,
+        user: str = '',
+        pwd: str = '',
+        ssl: bool = True,
+        max_mensagens: int = 100,
+        timeout: float = 30
+    ) -> None:
+        """
+        Conexão SMTP persistente: conecta e autentica uma única vez e envia várias mensagens.
+        Reconecta automaticamente se o servidor derrubar a conexão e ao atingir o limite
+        de mensagens por conexão (evita o bloqueio por parte do provedor).
+        :args
+            {host} - Endereço do servidor SMTP.
+            {port} - Porta de conexão (padrão: 465 SSL).
+            {user} - Usuário de autenticação.
+            {pwd} - Senha de autenticação.
+            {ssl} - Se a conexão usa SSL (padrão: True).
+            {max_mensagens} - Quantidade máxima de mensagens por conexão (padrão: 100).
+            {timeout} - Tempo máximo das operações de rede em segundos (padrão: 30).
+        :methods
+            enviar()
+            fechar()
+        """
+        self.__host = host
+        self.__port = port
+        self.__user = user
+        self.__pwd = pwd
+        self.__ssl = ssl
+        self.__max_mensagens = max(1, max_mensagens)
+        self.__timeout = timeout
+        self.__servidor = None
+        self.__enviadas: int = 0
+        self.__trava = RLock()
+
+    @property
+    def host(self):
+        return self.__host
+
+    @property
+    def port(self):
+        return self.__port
+
+    @property
+    def max_mensagens(self):
+        return self.__max_mensagens
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.fechar()
+
+    def __conectar(self) -> None:
+        """ Abre a conexão e autentica no servidor SMTP. """
+        if self.__ssl:
+            servidor = smtplib.SMTP_SSL(
+                self.host, self.port, timeout=self.__timeout)
+        else:
+            servidor = smtplib.SMTP(
+                self.host, self.port, timeout=self.__timeout)
+        if self.__user:
+            servidor.login(self.__user, self.__pwd)
+        self.__servidor = servidor
+        self.__enviadas = 0
+        logger.info(f'Conectado ao servidor SMTP: {self.host}')
+
+    def __descartar(self) -> None:
+        """ Encerra a conexão atual, ignorando erros de uma conexão já derrubada. """
+        if self.__servidor is not None:
+            try:
+                self.__servidor.quit()
+            except Exception:
+                pass
+        self.__servidor = None
+
+    def __transmitir(self, de: str, para: list, mensagem: MensagemEmail) -> None:
+        """
+        Envia a mensagem pelos comandos MAIL, RCPT e DATA, escrevendo-a em blocos direto no socket.
+        Lança as mesmas exceções de smtplib.SMTP.sendmail().
+        """
+        servidor = self.__servidor
+        servidor.ehlo_or_helo_if_needed()
+        codigo, resposta = servidor.mail(de)
+        if codigo != 250:
+            servidor.rset()
+            raise smtplib.SMTPSenderRefused(codigo, resposta, de)
+        recusados = dict()
+        for destinatario in para:
+            codigo, resposta = servidor.rcpt(destinatario)
+            if codigo not in (250, 251):
+                recusados[destinatario] = (codigo, resposta)
+        if len(recusados) == len(para):
+            servidor.rset()
+            raise smtplib.SMTPRecipientsRefused(recusados)
+        servidor.putcmd('data')
+        codigo, resposta = servidor.getreply()
+        if codigo != 354:
+            servidor.rset()
+            raise smtplib.SMTPDataError(codigo, resposta)
+        mensagem.escrever(servidor.send)
+        servidor.send(b'.\r\n')
+        codigo, resposta = servidor.getreply()
+        if codigo != 250:
+            raise smtplib.SMTPDataError(codigo, resposta)
+
+    def enviar(self, de: str, para: list, mensagem: Union[str, MensagemEmail]) -> bool:
+        """
+        Envia a mensagem pela conexão persistente, reconectando quando necessário.
+        :args
+            {de} - E-mail de origem.
+            {para} - Lista dos destinatários.
+            {mensagem} - Mensagem MIME completa ou MensagemEmail, transmitida em blocos.
+        :returns
+            True/False - Indicando o sucesso do envio.
+        """
+        with self.__trava:
+            for tentativa in (1, 2):
+                try:
+                    if self.__enviadas >= self.max_mensagens:
+                        self.__descartar()
+                    if self.__servidor is None:
+                        self.__conectar()
+                    if isinstance(mensagem, MensagemEmail):
+                        self.__transmitir(de, para, mensagem)
+                    else:
+                        self.__servidor.sendmail(de, para, mensagem)
+                    self.__enviadas += 1
+                    return True
+                except (smtplib.SMTPAuthenticationError, smtplib.SMTPRecipientsRefused,
+                        smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    logger.error(
+                        f'Falha no envio pelo servidor SMTP: {self.host} => {e}')
+                    return False
+                except OSError as e:
+                    # SMTPServerDisconnected, timeouts e quedas de rede: reconecta e tenta novamente
+                    logger.warning(
+                        f'Conexão com o servidor SMTP perdida (tentativa {tentativa}): {self.host} => {e}')
+                    self.__descartar()
+            return False
+
+    def fechar(self) -> None:
+        """ Encerra a conexão com o servidor SMTP. """
+        with self.__trava:
+            self.__descartar()
 
 
 class Email(object):
@@ -22,7 +282,10 @@ class Email(object):
             {para} - Lista dos destinatários.
             {assunto} - Assunto da mensagem.
             {corpo_html} - Arquivo HTML com o corpo da mensagem.
-            {anexo} - Caminho completo e nome do arquivo para anexar.
+            {corpo} - Corpo HTML já carregado (ver lib.configuracao); dispensa a leitura de corpo_html.
+            {anexo} - Caminho completo e nome do arquivo para anexar, ou lista de arquivos.
+            {conexao} - ConexaoSmtp persistente (opcional). Se não informada,
+                uma conexão é aberta e fechada apenas para esta mensagem.
         :returns
             True/False - Indicando o sucesso da tarefa.
         """
@@ -34,7 +297,9 @@ class Email(object):
         self.__para = kwargs.get('para')
         self.__assunto = kwargs.get('assunto')
         self.__corpo_html = kwargs.get('corpo_html')
+        self.__corpo = kwargs.get('corpo', None)
         self.__anexo = kwargs.get('anexo', None)
+        self.__conexao = kwargs.get('conexao', None)
 
     @property
     def host(self):
@@ -72,54 +337,69 @@ class Email(object):
     def anexo(self):
         return self.__anexo
 
+    @property
+    def anexos(self):
+        """ Arquivos anexados, como lista. """
+        if not self.__anexo:
+            return list()
+        if isinstance(self.__anexo, str):
+            return [self.__anexo]
+        return list(self.__anexo)
+
+    @property
+    def conexao(self):
+        return self.__conexao
+
+    @METRICAS.medido('envio_email', contar_falhas=True)
     def enviar(self) -> bool:
         """ Envia e-mail. """
-        # Instância do objeto e-mail
-        mensagem = MIMEMultipart()
+        # Texto da mensagem
+        corpo_email = self.__corpo
+        if corpo_email is None:
+            try:
+                with open(self.corpo_html, 'r') as arquivo:
+                    corpo_email = arquivo.read()
+            except Exception as e:
+                logger.critical(f'Erro ao abrir {self.corpo_html} => {e}')
+                return False
 
-        # Configuração de envio
-        mensagem['From'] = self.de
-        mensagem['To'] = ', '.join(self.para)
-        mensagem['Subject'] = self.assunto
+        # Anexos: lidos do disco somente durante a transmissão
+        for anexo in self.anexos:
+            if not os.access(anexo, os.R_OK):
+                logger.critical(
+                    f'Erro ao processar o arquivo de anexo: {anexo} => arquivo inexistente ou ilegível.')
+                return False
 
-        # Texto da mensagem
-        try:
-            arquivo = open(self.corpo_html, 'r')
-            corpo_email = arquivo.read()
-        except Exception as e:
-            logger.critical(f'Erro ao abrir {self.corpo_html} => {e}')
-            return False
-        else:
-            mensagem.attach(
-                MIMEText(_text=corpo_email, _subtype='html', _charset='utf-8')
-            )
-
-        # Anexo
-        try:
-            with open(self.anexo, 'rb') as carregar_arquivo:
-                anexar = MIMEBase('application', 'octet-stream')
-                anexar.set_payload((carregar_arquivo).read())
-                encoders.encode_base64(anexar)
-                anexar.add_header('Content-Disposition',
-                                  "attachment; filename= %s" % basename(self.anexo).replace(' ', '_'))
-                mensagem.attach(anexar)
-        except Exception as e:
-            logger.critical(
-                f'Erro ao processar o arquivo de anexo: {self.anexo} => {e}')
-            arquivo.close()
-            return False
+        mensagem = MensagemEmail(
+            de=self.de,
+            para=self.para,
+            assunto=self.assunto,
+            corpo_html=corpo_email,
+            anexos=self.anexos
+        )
 
-        # Servidor SMTP SSL
-        try:
-            servidor_smtp = smtplib.SMTP_SSL(self.host, self.port)
-            servidor_smtp.login(self.user, self.pwd)
-        except Exception as e:
-            logger.error(
-                f'Falha de conexão com o servidor SSL: {self.host} => {e}')
-            return False
-        else:
-            servidor_smtp.sendmail(self.de, self.para, mensagem.as_string())
-            return True
-        finally:
-            arquivo.close()
-            servidor_smtp.quit()
+        # Servidor SMTP
+        if self.conexao is not None:
+            return self.conexao.enviar(self.de, self.para, mensagem)
+        with ConexaoSmtp(self.host, self.port, self.user, self.pwd) as conexao:
+            return conexao.enviar(self.de, self.para, mensagem)
+
+
+def criar_conexao_smtp(smtp: ConfigSmtp = None) -> ConexaoSmtp:
+    """
+    Cria uma ConexaoSmtp a partir da configuração da execução (config/smtp.yaml),
+    carregada e descriptografada uma única vez.
+    :args
+        {smtp} [ConfigSmtp] - Parâmetros do SMTP (padrão: os da configuração da execução).
+    :returns
+        ConexaoSmtp (ainda não conectada).
+    """
+    smtp = smtp or configuracao().smtp
+    return ConexaoSmtp(
+        host=smtp.host,
+        port=smtp.porta,
+        user=smtp.usuario,
+        pwd=smtp.senha,
+        ssl=smtp.ssl,
+        max_mensagens=smtp.mensagens_por_conexao
+    )
@@ -0,0 +1,331 @@
+import json
+import os
+from collections import deque
+from pathlib import Path
+from threading import Condition, Lock
+from time import monotonic, sleep
+from typing import Callable, Deque, Dict
+
+from selenium.common.exceptions import (NoAlertPresentException,
+                                        StaleElementReferenceException,
+                                        TimeoutException)
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+
+from lib.log import logger
+from lib.metricas import METRICAS
+from lib.util import SiteOn
+
+ARQUIVO_LATENCIAS = Path('controle/latencias.json')
+
+# Estados da página após a solicitação da segunda via
+ESTADO_ALERTA = 'alerta'
+ESTADO_VENCIMENTOS = 'vencimentos'
+ESTADO_SEM_CONTAS = 'sem_contas'
+ESTADO_INDEFINIDO = 'indefinido'
+
+# Estados do disjuntor do portal
+DISJUNTOR_FECHADO = 'fechado'
+DISJUNTOR_ABERTO = 'aberto'
+DISJUNTOR_MEIO_ABERTO = 'meio_aberto'
+
+
+class EstatisticaEspera(object):
+    def __init__(
+        self,
+        arquivo: Path = ARQUIVO_LATENCIAS,
+        percentil: float = 0.95,
+        fator: float = 2.0,
+        minimo: float = 2.0,
+        maximo: float = 20.0,
+        amostras: int = 200
+    ) -> None:
+        """
+        Aprende a latência de aparecimento de cada elemento (locator) nas execuções recentes
+        e calcula o tempo máximo de espera a partir do percentil observado.
+        Enquanto não houver amostras suficientes, usa o tempo máximo (20 s, como antes).
+        Uma espera que expira entra nas amostras com o próprio tempo máximo (a latência real foi
+        maior) e, enquanto as expirações forem seguidas, o tempo do locator dobra até o máximo:
+        um portal que ficou mais lento não fica preso a um tempo aprendido quando era rápido.
+        :args
+            {arquivo} [Path] - Arquivo onde as amostras são preservadas entre execuções.
+            {percentil} [float] - Percentil da latência usado como base (padrão: 0.95).
+            {fator} [float] - Multiplicador de segurança sobre o percentil (padrão: 2).
+            {minimo} [float] - Tempo mínimo de espera em segundos (padrão: 2).
+            {maximo} [float] - Tempo máximo de espera em segundos (padrão: 20).
+            {amostras} [int] - Quantidade de amostras recentes mantidas por locator (padrão: 200).
+        :methods
+            timeout()
+            registrar()
+            registrar_timeout()
+            salvar()
+        """
+        self.__arquivo = Path(arquivo)
+        self.__percentil: float = percentil
+        self.__fator: float = fator
+        self.__minimo: float = minimo
+        self.__maximo: float = maximo
+        self.__amostras: int = amostras
+        self.__latencias: Dict[str, Deque[float]] = dict()
+        self.__expiradas: Dict[str, int] = dict()
+        self.__trava = Lock()
+        self.__carregar()
+
+    @property
+    def maximo(self):
+        return self.__maximo
+
+    def __carregar(self) -> None:
+        try:
+            with open(self.__arquivo, encoding='utf-8') as arq:
+                conteudo = json.load(arq)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f'Latências anteriores ignoradas ({self.__arquivo}): {e}')
+            return
+        for chave, valores in conteudo.items():
+            self.__latencias[chave] = deque(valores, maxlen=self.__amostras)
+
+    def timeout(self, chave: str) -> float:
+        """
+        Tempo máximo de espera para o locator, a partir do percentil das latências observadas.
+        :args
+            {chave} [str] - Identificação do locator.
+        :returns
+            Tempo em segundos.
+        """
+        with self.__trava:
+            valores = sorted(self.__latencias.get(chave, ()))
+            expiradas = self.__expiradas.get(chave, 0)
+        if len(valores) < 5:
+            return self.__maximo
+        indice = min(len(valores) - 1, int(len(valores) * self.__percentil))
+        base = max(self.__minimo, valores[indice] * self.__fator)
+        return min(self.__maximo, base * 2 ** min(expiradas, 10))
+
+    def registrar(self, chave: str, latencia: float) -> None:
+        """ Registra a latência observada até o aparecimento do elemento. """
+        with self.__trava:
+            self.__latencias.setdefault(
+                chave, deque(maxlen=self.__amostras)).append(round(latencia, 3))
+            self.__expiradas.pop(chave, None)
+
+    def registrar_timeout(self, chave: str, timeout: float) -> None:
+        """ Registra a espera que expirou: amostra com o tempo máximo usado e mais uma expiração seguida. """
+        with self.__trava:
+            self.__latencias.setdefault(
+                chave, deque(maxlen=self.__amostras)).append(round(timeout, 3))
+            self.__expiradas[chave] = self.__expiradas.get(chave, 0) + 1
+
+    def salvar(self) -> None:
+        """ Preserva as amostras para as próximas execuções (gravação atômica). """
+        with self.__trava:
+            conteudo = {chave: list(valores)
+                        for chave, valores in self.__latencias.items()}
+        arquivo_temp = self.__arquivo.with_suffix('.tmp')
+        try:
+            with open(arquivo_temp, 'w', encoding='utf-8') as arq:
+                json.dump(conteudo, arq)
+            os.replace(arquivo_temp, self.__arquivo)
+        except OSError as e:
+            logger.warning(f'Falha ao gravar as latências em {self.__arquivo}: {e}')
+
+
+# Estatística compartilhada por todos os workers do processo
+ESTATISTICA_ESPERA = EstatisticaEspera()
+
+
+def esperar(driver, condicao: Callable, chave: str, timeout: float = None):
+    """
+    Aguarda a condição com o tempo máximo aprendido para a chave e registra a latência observada
+    (ou a expiração do tempo, que aumenta as próximas esperas da chave).
+    :args
+        {driver} - WebDriver (Navegador Chrome).
+        {condicao} [Callable] - Condição do WebDriverWait (ex.: expected_conditions).
+        {chave} [str] - Identificação do locator para as estatísticas.
+        {timeout} [float] - Tempo máximo fixo, ignorando o aprendido (opcional).
+    :returns
+        O retorno da condição. Lança TimeoutException se o tempo expirar.
+    """
+    limite = timeout or ESTATISTICA_ESPERA.timeout(chave)
+    inicio = monotonic()
+    try:
+        resultado = WebDriverWait(driver, limite, poll_frequency=0.1).until(condicao)
+    except TimeoutException:
+        ESTATISTICA_ESPERA.registrar_timeout(chave, limite)
+        raise
+    ESTATISTICA_ESPERA.registrar(chave, monotonic() - inicio)
+    return resultado
+
+
+class EstadoConsulta(object):
+    def __init__(self, botao_solicitar) -> None:
+        """
+        Condição combinada do WebDriverWait para o resultado da solicitação da segunda via.
+        Decide, assim que possível, entre: alerta de documento inválido, página com vencimentos
+        ou página sem contas, sem esperar o tempo máximo nos casos sem contas.
+        :args
+            {botao_solicitar} - Elemento btncpfvalida clicado (fica obsoleto quando a página muda).
+        """
+        self.__botao = botao_solicitar
+
+    def __call__(self, driver) -> str:
+        try:
+            driver.switch_to.alert
+            return ESTADO_ALERTA
+        except NoAlertPresentException:
+            pass
+        try:
+            # Enquanto o botão estiver acessível, a página de resultado ainda não carregou
+            self.__botao.is_enabled()
+            return ''
+        except StaleElementReferenceException:
+            pass
+        if driver.execute_script('return document.readyState') != 'complete':
+            return ''
+        if len(driver.find_elements(By.CLASS_NAME, 'colVenc')) >= 2:
+            return ESTADO_VENCIMENTOS
+        return ESTADO_SEM_CONTAS
+
+
+class Ritmo(object):
+    def __init__(self, taxa: float = 0.5, capacidade: int = 3) -> None:
+        """
+        Limitador de requisições ao portal por balde de fichas (token bucket), compartilhado
+        entre os workers. Substitui as pausas aleatórias fixas: só espera quando o ritmo
+        médio de requisições ultrapassa a taxa configurada.
+        :args
+            {taxa} [float] - Requisições por segundo permitidas em média (padrão: 0.5).
+            {capacidade} [int] - Rajada máxima de requisições sem espera (padrão: 3).
+        :methods
+            aguardar()
+        """
+        self.__taxa: float = max(0.01, taxa)
+        self.__capacidade: float = max(1, capacidade)
+        self.__fichas: float = self.__capacidade
+        self.__ultimo: float = monotonic()
+        self.__trava = Lock()
+
+    def aguardar(self) -> float:
+        """
+        Consome uma ficha, aguardando a reposição se o balde estiver vazio.
+        :returns
+            Tempo aguardado em segundos.
+        """
+        with self.__trava:
+            agora = monotonic()
+            self.__fichas = min(
+                self.__capacidade,
+                self.__fichas + (agora - self.__ultimo) * self.__taxa)
+            self.__ultimo = agora
+            self.__fichas -= 1
+            espera = -self.__fichas / self.__taxa if self.__fichas < 0 else 0.0
+        if espera:
+            sleep(espera)
+        return espera
+
+
+class Disjuntor(object):
+    def __init__(
+        self,
+        limite_falhas: int = 3,
+        pausa: float = 10.0,
+        pausa_maxima: float = 300.0,
+        tolerancia: float = 1800.0
+    ) -> None:
+        """
+        Disjuntor (circuit breaker) do portal, compartilhado entre os workers.
+        Após {limite_falhas} falhas seguidas o disjuntor abre: os workers param de consultar o portal
+        e aguardam a pausa; ao fim dela, um único worker verifica o portal (SiteOn) enquanto os
+        demais aguardam. Se o portal responder, as consultas são retomadas (meio aberto: a próxima
+        falha reabre o disjuntor); se não, a pausa dobra, até {pausa_maxima}.
+        :args
+            {limite_falhas} [int] - Falhas seguidas que abrem o disjuntor (padrão: 3).
+            {pausa} [float] - Pausa inicial, em segundos, com o disjuntor aberto (padrão: 10).
+            {pausa_maxima} [float] - Pausa máxima, em segundos (padrão: 300).
+            {tolerancia} [float] - Tempo, em segundos, de portal indisponível até desistir das
+                matrículas restantes (padrão: 1800).
+        :methods
+            liberar()
+            registrar_sucesso()
+            registrar_falha()
+        """
+        self.__limite_falhas: int = max(1, limite_falhas)
+        self.__pausa_inicial: float = pausa
+        self.__pausa_maxima: float = max(pausa, pausa_maxima)
+        self.__tolerancia: float = tolerancia
+        self.__estado: str = DISJUNTOR_FECHADO
+        self.__falhas: int = 0
+        self.__pausa: float = pausa
+        self.__aberto_desde: float = 0.0
+        self.__religamento: float = 0.0
+        self.__verificando: bool = False
+        self.__condicao = Condition()
+
+    @property
+    def estado(self):
+        return self.__estado
+
+    def __abrir(self, agora: float) -> None:
+        """ Abre o disjuntor (ou o mantém aberto) e agenda a próxima verificação do portal. """
+        if self.__estado == DISJUNTOR_FECHADO:
+            self.__aberto_desde = agora
+            self.__pausa = self.__pausa_inicial
+        else:
+            self.__pausa = min(self.__pausa_maxima, self.__pausa * 2)
+        self.__estado = DISJUNTOR_ABERTO
+        self.__religamento = agora + self.__pausa
+        METRICAS.incrementar('disjuntor_aberturas_total')
+        logger.warning(
+            f'Portal instável: consultas suspensas por {self.__pausa:.0f}s ({self.__falhas} falha(s) seguida(s)).')
+
+    def liberar(self, url: str) -> bool:
+        """
+        Aguarda o disjuntor permitir uma consulta ao portal.
+        :args
+            {url} [str] - Endereço verificado ao fim da pausa.
+        :returns
+            True se a consulta pode seguir; False se o portal segue indisponível além da tolerância.
+        """
+        while True:
+            with self.__condicao:
+                while True:
+                    if self.__estado != DISJUNTOR_ABERTO:
+                        return True
+                    agora = monotonic()
+                    if agora - self.__aberto_desde > self.__tolerancia:
+                        return False
+                    if not self.__verificando and agora >= self.__religamento:
+                        # Este worker verifica o portal; os demais aguardam o resultado
+                        self.__verificando = True
+                        break
+                    self.__condicao.wait(None if self.__verificando else self.__religamento - agora)
+            online = False
+            try:
+                online = SiteOn(url).verificar(forcar=True)
+            finally:
+                with self.__condicao:
+                    self.__verificando = False
+                    if online:
+                        self.__estado = DISJUNTOR_MEIO_ABERTO
+                        logger.info('Portal respondeu: consultas retomadas.')
+                    else:
+                        self.__abrir(monotonic())
+                    self.__condicao.notify_all()
+
+    def registrar_sucesso(self) -> None:
+        """ Registra uma consulta bem-sucedida: zera as falhas e fecha o disjuntor. """
+        with self.__condicao:
+            self.__falhas = 0
+            if self.__estado == DISJUNTOR_MEIO_ABERTO:
+                self.__estado = DISJUNTOR_FECHADO
+                self.__pausa = self.__pausa_inicial
+
+    def registrar_falha(self) -> None:
+        """ Registra uma consulta que falhou (erro, timeout ou página fora do padrão). """
+        with self.__condicao:
+            self.__falhas += 1
+            if self.__estado == DISJUNTOR_MEIO_ABERTO \
+                    or (self.__estado == DISJUNTOR_FECHADO and self.__falhas >= self.__limite_falhas):
+                self.__abrir(monotonic())
@@ -1,31 +1,189 @@
+import atexit
+import json
 import logging
+import os
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import (QueueHandler, QueueListener, RotatingFileHandler,
+                              TimedRotatingFileHandler)
+from queue import SimpleQueue
+from threading import RLock
+from typing import Dict
 
-# Criando Logger e setando Level
+# Logger raiz usado por todos os módulos; os handlers só são instalados em configurar_log()
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
-# Criando Handlers e setando Level
-# Console Handler
-ch = logging.StreamHandler()
-ch.setLevel(logging.INFO)
-
-# File Handler
-fh = logging.FileHandler('log/log.log')
-fh.setLevel(logging.INFO)
-
-# Criando Formatter e setando os handlers
-formatter_ch = logging.Formatter(
-    fmt='''%(asctime)s => %(levelname)s: %(message)s''',
-    datefmt='%d-%m-%Y %H:%M:%S'
-)
-formatter_fh = logging.Formatter(
-    fmt='''%(asctime)s => %(levelname)s: módulo:%(module)s função:%(funcName)s linha:%(lineno)d
-    %(message)s''',
-    datefmt='%d-%m-%Y %H:%M:%S'
-)
-ch.setFormatter(formatter_ch)
-fh.setFormatter(formatter_fh)
-
-# Adicionando Handler ao Logger
-logger.addHandler(ch)
-logger.addHandler(fh)
+DIR_LOG = 'log'
+ARQUIVO_LOG = 'log.jsonl'
+# Rotação por tamanho: 10 MB por arquivo, mantendo os 5 últimos
+TAMANHO_MAXIMO = 10 * 2 ** 20
+BACKUPS = 5
+ROTACAO_TAMANHO = 'tamanho'
+ROTACAO_DIARIA = 'diaria'
+
+# Campos de contexto gravados em cada registro do log
+CAMPOS_CONTEXTO = ('execucao', 'worker', 'matricula')
+
+# Contexto da thread (ou tarefa) corrente: cada worker enxerga apenas o seu
+__contexto: ContextVar = ContextVar('contexto_log', default=dict())
+__trava = RLock()
+__listener: QueueListener = None
+
+
+class FormatoJson(logging.Formatter):
+    """ Formata cada registro como um objeto JSON em uma única linha (JSON lines). """
+
+    def format(self, record: logging.LogRecord) -> str:
+        registro = {
+            'data': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'nivel': record.levelname,
+            'mensagem': record.getMessage(),
+            'modulo': record.module,
+            'funcao': record.funcName,
+            'linha': record.lineno,
+            'thread': record.threadName,
+        }
+        for campo in CAMPOS_CONTEXTO:
+            valor = getattr(record, campo, None)
+            if valor not in (None, ''):
+                registro[campo] = valor
+        return json.dumps(registro, ensure_ascii=False, default=str)
+
+
+class FiltroContexto(logging.Filter):
+    """ Anexa ao registro os campos de contexto da thread que o emitiu. """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for campo, valor in contexto_atual().items():
+            if not hasattr(record, campo):
+                setattr(record, campo, valor)
+        return True
+
+
+class ConfiguracaoTardia(logging.Handler):
+    """
+    Handler provisório instalado na importação, sem abrir arquivos:
+    no primeiro registro emitido configura o log com os valores padrão e o repassa.
+    """
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        configurar_log()
+        for handler in list(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                handler.handle(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        pass
+
+
+def contexto_atual() -> Dict[str, object]:
+    """ Campos de contexto do log da thread corrente. """
+    return __contexto.get()
+
+
+def definir_contexto(**campos) -> None:
+    """
+    Define campos de contexto do log da thread corrente (ex.: worker=1, matricula='123-4').
+    Um campo com valor None é removido.
+    :args
+        {campos} - Campos de CAMPOS_CONTEXTO e seus valores.
+    :returns
+        Nenhum.
+    """
+    contexto = dict(__contexto.get())
+    for campo, valor in campos.items():
+        if valor is None:
+            contexto.pop(campo, None)
+        else:
+            contexto[campo] = valor
+    __contexto.set(contexto)
+
+
+def configurar_log(
+    diretorio: str = DIR_LOG,
+    arquivo: str = ARQUIVO_LOG,
+    nivel_console: int = logging.INFO,
+    nivel_arquivo: int = logging.INFO,
+    rotacao: str = ROTACAO_TAMANHO,
+    tamanho_maximo: int = TAMANHO_MAXIMO,
+    backups: int = BACKUPS
+) -> None:
+    """
+    Configura o log da aplicação: os módulos apenas enfileiram os registros (QueueHandler) e uma
+    thread própria (QueueListener) os grava no console e no arquivo em JSON lines, com rotação.
+    Chamadas seguintes não têm efeito; sem chamada explícita, o log é configurado com os valores
+    padrão no primeiro registro emitido.
+    :args
+        {diretorio} [str] - Diretório do arquivo de log, criado se necessário (padrão: log).
+        {arquivo} [str] - Nome do arquivo de log (padrão: log.jsonl).
+        {nivel_console} [int] - Nível mínimo exibido no console (padrão: INFO).
+        {nivel_arquivo} [int] - Nível mínimo gravado no arquivo (padrão: INFO).
+        {rotacao} [str] - 'tamanho' (por tamanho_maximo) ou 'diaria' (à meia-noite) (padrão: tamanho).
+        {tamanho_maximo} [int] - Tamanho, em bytes, que dispara a rotação por tamanho (padrão: 10 MB).
+        {backups} [int] - Quantidade de arquivos rotacionados mantidos (padrão: 5).
+    :returns
+        Nenhum.
+    """
+    global __listener
+    with __trava:
+        if __listener is not None:
+            return
+        # Console Handler
+        ch = logging.StreamHandler()
+        ch.setLevel(nivel_console)
+        ch.setFormatter(logging.Formatter(
+            fmt='''%(asctime)s => %(levelname)s: %(message)s''',
+            datefmt='%d-%m-%Y %H:%M:%S'
+        ))
+        handlers = [ch]
+        # File Handler
+        try:
+            os.makedirs(diretorio, exist_ok=True)
+            caminho = os.path.join(diretorio, arquivo)
+            if rotacao == ROTACAO_DIARIA:
+                fh = TimedRotatingFileHandler(
+                    caminho, when='midnight', backupCount=backups, encoding='utf-8')
+            else:
+                fh = RotatingFileHandler(
+                    caminho, maxBytes=tamanho_maximo, backupCount=backups, encoding='utf-8')
+        except OSError as e:
+            fh = None
+            erro_arquivo = e
+        else:
+            fh.setLevel(nivel_arquivo)
+            fh.setFormatter(FormatoJson())
+            handlers.append(fh)
+        fila = SimpleQueue()
+        qh = QueueHandler(fila)
+        qh.setLevel(min(nivel_console, nivel_arquivo))
+        qh.addFilter(FiltroContexto())
+        for handler in list(logger.handlers):
+            if isinstance(handler, ConfiguracaoTardia):
+                logger.removeHandler(handler)
+        logger.addHandler(qh)
+        __listener = QueueListener(fila, *handlers, respect_handler_level=True)
+        __listener.start()
+        atexit.register(encerrar_log)
+    if fh is None:
+        logger.error(f'Não foi possível abrir o arquivo de log em {diretorio}: {erro_arquivo}')
+
+
+def encerrar_log() -> None:
+    """ Grava os registros ainda na fila e encerra a thread do log. """
+    global __listener
+    with __trava:
+        if __listener is None:
+            return
+        __listener.stop()
+        for handler in __listener.handlers:
+            handler.close()
+        for handler in list(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                logger.removeHandler(handler)
+        __listener = None
+        logger.addHandler(ConfiguracaoTardia())
+
+
+logger.addHandler(ConfiguracaoTardia())
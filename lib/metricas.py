@@ -0,0 +1,190 @@
+import json
+import os
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, Iterator, List, Tuple
+
+from lib.log import logger
+
+PREFIXO = 'cedae_'
+# Limites (em segundos) dos intervalos dos histogramas de duração
+LIMITES_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+
+class Histograma(object):
+    def __init__(self, limites: Tuple[float, ...] = LIMITES_PADRAO) -> None:
+        """ Histograma cumulativo de durações, no modelo do Prometheus. """
+        self.limites: Tuple[float, ...] = limites
+        self.intervalos: List[int] = [0] * len(limites)
+        self.contagem: int = 0
+        self.soma: float = 0.0
+        self.maximo: float = 0.0
+
+    def observar(self, valor: float) -> None:
+        self.contagem += 1
+        self.soma += valor
+        self.maximo = max(self.maximo, valor)
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.intervalos[i] += 1
+
+
+class Metricas(object):
+    def __init__(self, limites: Tuple[float, ...] = LIMITES_PADRAO) -> None:
+        """
+        Registro de métricas da execução: histogramas de duração das etapas (spans) e contadores.
+        Exporta no formato textfile do Prometheus (.prom) ou em JSON ao final da execução.
+        :args
+            {limites} [tuple] - Limites, em segundos, dos intervalos dos histogramas.
+        :methods
+            medir()
+            medido()
+            observar()
+            incrementar()
+            exportar()
+        """
+        self.__limites = limites
+        self.__histogramas: Dict[str, Dict[Rotulos, Histograma]] = dict()
+        self.__contadores: Dict[str, Dict[Rotulos, float]] = dict()
+        self.__trava = Lock()
+
+    @contextmanager
+    def medir(self, etapa: str, **rotulos) -> Iterator[None]:
+        """
+        Span de uma etapa: registra a duração do bloco em {etapa}_segundos
+        e, se o bloco lançar uma exceção, incrementa {etapa}_erros_total.
+        :args
+            {etapa} [str] - Nome da etapa (ex.: 'envio_email').
+            {rotulos} - Rótulos da medição (ex.: elemento='MATRICULA').
+        """
+        inicio = monotonic()
+        try:
+            yield
+        except BaseException:
+            self.incrementar(f'{etapa}_erros_total', **rotulos)
+            raise
+        finally:
+            self.observar(f'{etapa}_segundos', monotonic() - inicio, **rotulos)
+
+    def medido(self, etapa: str, contar_falhas: bool = False) -> Callable:
+        """
+        Decorador que envolve a função inteira em um span (ver medir()).
+        :args
+            {etapa} [str] - Nome da etapa.
+            {contar_falhas} [bool] - Se incrementa {etapa}_falhas_total quando a função
+                retornar um valor vazio (False, '' ou None) (padrão: False).
+        """
+        def decorador(funcao: Callable) -> Callable:
+            @wraps(funcao)
+            def medida(*args, **kwargs):
+                with self.medir(etapa):
+                    retorno = funcao(*args, **kwargs)
+                if contar_falhas and not retorno:
+                    self.incrementar(f'{etapa}_falhas_total')
+                return retorno
+            return medida
+        return decorador
+
+    def observar(self, nome: str, valor: float, **rotulos) -> None:
+        """ Registra um valor no histograma. """
+        chave = tuple(sorted((rotulo, str(conteudo)) for rotulo, conteudo in rotulos.items()))
+        with self.__trava:
+            serie = self.__histogramas.setdefault(nome, dict())
+            if chave not in serie:
+                serie[chave] = Histograma(self.__limites)
+            serie[chave].observar(valor)
+
+    def incrementar(self, nome: str, valor: float = 1, **rotulos) -> None:
+        """ Incrementa o contador. """
+        chave = tuple(sorted((rotulo, str(conteudo)) for rotulo, conteudo in rotulos.items()))
+        with self.__trava:
+            serie = self.__contadores.setdefault(nome, dict())
+            serie[chave] = serie.get(chave, 0) + valor
+
+    @staticmethod
+    def __rotulos(rotulos: Rotulos, extra: str = '') -> str:
+        def escapar(valor: str) -> str:
+            return valor.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        itens = [f'{chave}="{escapar(valor)}"' for chave, valor in rotulos]
+        if extra:
+            itens.append(extra)
+        return '{' + ','.join(itens) + '}' if itens else ''
+
+    def prometheus(self) -> str:
+        """ Métricas no formato de exposição em texto do Prometheus. """
+        linhas: List[str] = list()
+        with self.__trava:
+            for nome, serie in sorted(self.__histogramas.items()):
+                linhas.append(f'# TYPE {PREFIXO}{nome} histogram')
+                for rotulos, histograma in sorted(serie.items()):
+                    limites = [str(limite) for limite in histograma.limites] + ['+Inf']
+                    quantidades = histograma.intervalos + [histograma.contagem]
+                    for limite, quantidade in zip(limites, quantidades):
+                        intervalo = Metricas.__rotulos(rotulos, 'le="' + limite + '"')
+                        linhas.append(f'{PREFIXO}{nome}_bucket{intervalo} {quantidade}')
+                    linhas.append(f'{PREFIXO}{nome}_sum{Metricas.__rotulos(rotulos)} {histograma.soma:.6f}')
+                    linhas.append(f'{PREFIXO}{nome}_count{Metricas.__rotulos(rotulos)} {histograma.contagem}')
+            for nome, serie in sorted(self.__contadores.items()):
+                linhas.append(f'# TYPE {PREFIXO}{nome} counter')
+                for rotulos, valor in sorted(serie.items()):
+                    linhas.append(f'{PREFIXO}{nome}{Metricas.__rotulos(rotulos)} {valor:g}')
+        return '\n'.join(linhas) + '\n'
+
+    def dicionario(self) -> Dict[str, list]:
+        """ Métricas como dicionário serializável em JSON. """
+        with self.__trava:
+            return {
+                'histogramas': [
+                    {
+                        'nome': nome,
+                        'rotulos': dict(rotulos),
+                        'contagem': histograma.contagem,
+                        'soma': round(histograma.soma, 6),
+                        'media': round(histograma.soma / histograma.contagem, 6),
+                        'maximo': round(histograma.maximo, 6),
+                        'intervalos': dict(zip(map(str, histograma.limites), histograma.intervalos)),
+                    }
+                    for nome, serie in sorted(self.__histogramas.items())
+                    for rotulos, histograma in sorted(serie.items())
+                ],
+                'contadores': [
+                    {'nome': nome, 'rotulos': dict(rotulos), 'valor': valor}
+                    for nome, serie in sorted(self.__contadores.items())
+                    for rotulos, valor in sorted(serie.items())
+                ],
+            }
+
+    def exportar(self, arquivo: str) -> bool:
+        """
+        Grava as métricas de forma atômica: JSON se o arquivo terminar em .json,
+        senão no formato textfile do Prometheus (ex.: para o textfile collector do node_exporter).
+        :args
+            {arquivo} [str] - Caminho do arquivo de métricas.
+        :returns
+            True/False - Se o arquivo foi gravado.
+        """
+        caminho = Path(arquivo)
+        if caminho.suffix.lower() == '.json':
+            conteudo = json.dumps(self.dicionario(), ensure_ascii=False, indent=2)
+        else:
+            conteudo = self.prometheus()
+        arquivo_temp = caminho.with_name(caminho.name + '.tmp')
+        try:
+            with open(arquivo_temp, 'w', encoding='utf-8') as arq:
+                arq.write(conteudo)
+            os.replace(arquivo_temp, caminho)
+        except OSError as e:
+            logger.error(f'Falha ao gravar as métricas em {caminho}: {e}')
+            return False
+        logger.info(f'Métricas da execução gravadas em {caminho}.')
+        return True
+
+
+# Métricas compartilhadas por todos os workers do processo
+METRICAS = Metricas()
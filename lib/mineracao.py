@@ -1,4 +1,6 @@
-from typing import Dict, List
+import csv
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple
 
 from openpyxl import load_workbook
 
@@ -6,52 +8,130 @@ from controle.matricula_processada import retornar_processada
 from lib.log import logger
 
 
-def pegar_cadastro_prestadora(arquivo) -> List[Dict[str, str]]:
+class Cadastro(NamedTuple):
+    """ Registro compacto (tupla) de um cliente da planilha de cadastro. """
+    cliente: str
+    matricula: str
+    documento: str
+    email: str
+
+
+def __linhas_xlsx(arquivo: Path) -> Iterator[tuple]:
+    """ Lê a planilha em modo somente leitura, linha a linha, sem a linha de títulos. """
+    arquivo_planilha = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        planilha = arquivo_planilha.active
+        yield from planilha.iter_rows(min_row=2, max_col=4, values_only=True)
+    finally:
+        arquivo_planilha.close()
+
+
+def __linhas_csv(arquivo: Path) -> Iterator[tuple]:
+    """ Lê o arquivo CSV (separador ';' ou ','), linha a linha, sem a linha de títulos. """
+    with open(arquivo, newline='', encoding='utf-8-sig') as arq:
+        dialeto = csv.Sniffer().sniff(arq.readline(), delimiters=';,')
+        yield from csv.reader(arq, dialeto)
+
+
+def __linhas_parquet(arquivo: Path) -> Iterator[tuple]:
+    """ Lê o arquivo Parquet em lotes (requer a biblioteca opcional pyarrow). """
+    import pyarrow.parquet as pq
+
+    arquivo_parquet = pq.ParquetFile(arquivo)
+    colunas = arquivo_parquet.schema_arrow.names[:4]
+    for lote in arquivo_parquet.iter_batches(columns=colunas):
+        yield from zip(*(lote.column(i).to_pylist() for i in range(len(colunas))))
+
+
+LEITORES = {
+    '.xlsx': __linhas_xlsx,
+    '.xlsm': __linhas_xlsx,
+    '.csv': __linhas_csv,
+    '.parquet': __linhas_parquet,
+}
+
+
+def ler_linhas(arquivo) -> Iterator[tuple]:
+    """
+    Lê, linha a linha, o arquivo de cadastro sem a linha de títulos.
+    Aceita planilha Excel (.xlsx), CSV (.csv) ou Parquet (.parquet) com as colunas:
+        Coluna A = Nome do cliente
+        Coluna B = Número da matrícula
+        Coluna C = Número do documento (CPF/CNPJ)
+        Coluna D = Endereço e e-mail para envio da conta
+    :args
+        {arquivo} [str] - Caminho do arquivo de cadastro.
+    :returns
+        Gerador das linhas (tuplas) do arquivo.
+    """
+    caminho = Path(arquivo)
+    leitor = LEITORES.get(caminho.suffix.lower())
+    if leitor is None:
+        raise ValueError(f'Formato de cadastro não suportado: {caminho.suffix}')
+    return leitor(caminho)
+
+
+def criar_cadastro(dado: tuple) -> Cadastro:
     """
-        Extrai da planilha de cadastro de clientes, das linhas que estiverem completas, as informações necessárias para a solicitação da segunda via.
-        A planilha de dados deve se chamar AGUA.xlsx.
+    Converte uma linha do arquivo em Cadastro, se os dados estiverem completos.
+    :args
+        {dado} [tuple] - Linha do arquivo: cliente[0], matricula[1], documento[2], e-mail[3].
+    :returns
+        Cadastro ou None para dados incompletos.
+    """
+    if len(dado) < 4 or not (dado[0] and dado[1] and dado[2] and dado[3]):
+        return None
+    return Cadastro(dado[0], dado[1], dado[2], dado[3])
+
+
+def filtrar_processadas(cadastro: Iterable[Cadastro]) -> Iterator[Cadastro]:
+    """
+    Descarta as matrículas já enviadas no mês pelo controle anterior (sem vencimento registrado).
+    As contas novas são filtradas pelo controle por conta durante a emissão.
+    """
+    matriculas_processadas = set(retornar_processada())
+    for registro in cadastro:
+        if registro.matricula not in matriculas_processadas:
+            yield registro
+
+
+def gerar_cadastro_prestadora(arquivo) -> Iterator[Cadastro]:
+    """
+    Gera, linha a linha, o cadastro dos clientes com os dados completos e ainda não processados no mês.
+    :args
+        {arquivo} [str] - Caminho do arquivo de cadastro (ver ler_linhas()).
+    :returns
+        Gerador de Cadastro.
+    """
+    completos = (criar_cadastro(dado) for dado in ler_linhas(arquivo))
+    yield from filtrar_processadas(
+        registro for registro in completos if registro is not None)
+
+
+def pegar_cadastro_prestadora(arquivo, usar_cache: bool = False) -> List[Cadastro]:
+    """
+        Extrai do arquivo de cadastro de clientes, das linhas que estiverem completas, as informações necessárias para a solicitação da segunda via.
+        O arquivo padrão é a planilha AGUA.xlsx.
             A primeira linha deve conter o título das colunas [Cliente, CNPJ/CPF, Documento].
-            A partir da segunda linha, as colunas devem conter:
-                Coluna A = Nome do cliente
-                Coluna B = Número da matrícula
-                Coluna C = Número do documento (CPF/CNPJ)
-                Coluna D = Endereço e e-mail para envio da conta
+            A partir da segunda linha, as colunas devem conter os dados descritos em ler_linhas().
         :args
-            {arquivo} [str] - Nome da planilha de dados localizada na raiz da aplicação.
+            {arquivo} [str] - Nome do arquivo de dados localizado na raiz da aplicação.
+            {usar_cache} [bool] - Se utiliza o snapshot do cadastro da execução anterior (padrão: False).
         :returns
-            Uma lista de dicionários do cadastro.
-            [
-                {'cliente': 'NomeDoCliente'},
-                {'matricula': 'NumeroDaMatricula'},
-                {'documento': 'NumeroDocumento'}
-            ]
+            Uma lista de Cadastro(cliente, matricula, documento, email).
     """
     try:
-        arquivo_planilha = load_workbook(arquivo)
-        planilha = arquivo_planilha.active
-        # Deleta a linha de títulos da matriz
-        planilha.delete_rows(1)
-        cadastro_temp: List[Dict[str, list]] = list()
-        # Na planilha, os dados de acesso correspondem as seguintes colunas:
-        # cliente[0], matricula[1], documento[2], e-mail[3]
-
-        # Ignora dados incompletos na [lista] como os dados da planilha
-        for dado in planilha.values:
-            if dado[0] and dado[1] and dado[2] and dado[3]:
-                dic_dado = {
-                    'cliente': dado[0],
-                    'matricula': dado[1],
-                    'documento': dado[2],
-                    'email': dado[3]
-                }
-                cadastro_temp.append(dic_dado)
-        matriculas_processadas = retornar_processada()
-        cadastro_prestadora = list(filter(
-            lambda x: x['matricula'] not in matriculas_processadas, cadastro_temp)
-        )
-        return cadastro_prestadora
+        if usar_cache:
+            # Importação tardia: o cache depende dos leitores deste módulo
+            from lib.cache_cadastro import CacheCadastro
+            return list(filtrar_processadas(CacheCadastro(arquivo).carregar()))
+        return list(gerar_cadastro_prestadora(arquivo))
+    except ImportError as e:
+        logger.critical(
+            f'Biblioteca opcional ausente para ler o arquivo {arquivo}: {e}. Instale com: pip install pyarrow')
+        return list()
     except Exception as e:
         logger.critical(
-            f'Erro na mineração de dados da planilha: {arquivo}. O arquivo não existe no diretório da aplicação.'
+            f'Erro na mineração de dados da planilha: {arquivo}. O arquivo não existe no diretório da aplicação. Erro: {e}'
         )
         return list()
@@ -0,0 +1,209 @@
+import os
+from pathlib import Path
+from platform import system
+from textwrap import dedent
+from time import monotonic
+from typing import Dict, List, Tuple
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+
+from lib.log import logger
+
+# Perfis (user-data-dir) reaproveitados entre execuções do modo servidor, um por worker
+DIR_PERFIS = os.path.expanduser('~') + os.sep + '.cache' + os.sep + 'cedae_segunda_via' + os.sep
+
+# Recursos dispensáveis para a emissão, bloqueados via CDP no modo servidor
+RECURSOS_BLOQUEADOS = [
+    '*.css', '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.webp',
+]
+
+# Arquivos de trava deixados pelo Chrome quando a execução anterior é interrompida
+TRAVAS_PERFIL = ('SingletonLock', 'SingletonSocket', 'SingletonCookie')
+
+
+def __caminho_driver() -> Service:
+    """ Define o path do driver de acordo com sistema operacional. """
+    if system() == 'Windows':
+        return Service(os.getcwd() + os.sep + 'chromedriver_win.exe')
+    return Service(os.getcwd() + os.sep + 'chromedriver_linux')
+
+
+def __preparar_perfil(id_worker: int) -> str:
+    """ Cria, se necessário, o perfil do worker e remove as travas de uma execução interrompida. """
+    dir_perfil = Path(DIR_PERFIS) / f'perfil_worker_{id_worker}'
+    dir_perfil.mkdir(parents=True, exist_ok=True)
+    for trava in TRAVAS_PERFIL:
+        try:
+            os.unlink(dir_perfil / trava)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f'Não foi possível remover a trava {trava} do perfil: {e}')
+    return str(dir_perfil)
+
+
+def __executa_como_root() -> bool:
+    """ Se o processo roda como root (Linux/macOS). """
+    return hasattr(os, 'geteuid') and os.geteuid() == 0
+
+
+def criar_driver(dir_download: str, servidor: bool = False, id_worker: int = 0) -> webdriver.Chrome:
+    """
+    Inicia o WebDriver do Chrome configurado para o diretório de download.
+    No modo servidor o Chrome roda sem janela (headless), sem GPU, sem imagens, fontes e CSS,
+    com um perfil reaproveitado entre execuções e com os PDFs sempre baixados (sem o visualizador).
+    O sandbox do Chrome só é desativado se o processo rodar como root, que o Chrome exige.
+    :args
+        {dir_download} [str] - Diretório de download dos arquivos.
+        {servidor} [bool] - Se utiliza o perfil enxuto para servidores (padrão: False).
+        {id_worker} [int] - Identificação do worker, para o perfil exclusivo (padrão: 0).
+    :returns
+        WebDriver (Navegador Chrome).
+    """
+    config_chrome = webdriver.ChromeOptions()
+    preferencias_chrome: dict = {
+        'download.default_directory': dir_download,
+        # 'directory_upgrade': True,
+        # 'safebrowsing, enable': True
+    }
+    if servidor:
+        preferencias_chrome.update({
+            'download.prompt_for_download': False,
+            'plugins.always_open_pdf_externally': True,
+            'profile.managed_default_content_settings.images': 2,
+            'profile.default_content_setting_values.notifications': 2,
+        })
+        for argumento in (
+            '--headless=new',
+            '--disable-gpu',
+            '--disable-dev-shm-usage',
+            '--disable-extensions',
+            '--disable-background-networking',
+            '--disable-component-update',
+            '--no-first-run',
+            '--mute-audio',
+            '--window-size=1366,768',
+            f'--user-data-dir={__preparar_perfil(id_worker)}',
+        ):
+            config_chrome.add_argument(argumento)
+        if __executa_como_root():
+            # O Chrome não inicia como root com o sandbox ativo (ex.: contêineres sem usuário próprio).
+            # Desativá-lo expõe o sistema a uma página maliciosa: prefira rodar com um usuário comum
+            logger.warning('Executando como root: o Chrome será iniciado sem o sandbox (--no-sandbox).')
+            config_chrome.add_argument('--no-sandbox')
+    config_chrome.add_experimental_option('prefs', preferencias_chrome)
+
+    logger.info(f'Sistema operacional: {system()}')
+    driver = webdriver.Chrome(service=__caminho_driver(), options=config_chrome)
+    if not servidor:
+        driver.maximize_window()
+        return driver
+    # Headless: a pasta de download precisa ser liberada explicitamente
+    driver.execute_cdp_cmd('Page.setDownloadBehavior', {
+        'behavior': 'allow',
+        'downloadPath': dir_download
+    })
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': RECURSOS_BLOQUEADOS})
+    return driver
+
+
+def arvore_processos(raiz: int) -> List[Tuple[int, str, int]]:
+    """
+    Lista o processo raiz e todos os seus descendentes, com a memória residente (RSS) de cada um.
+    Disponível apenas no Linux (leitura do /proc).
+    :args
+        {raiz} [int] - PID do processo raiz.
+    :returns
+        Lista de tuplas (pid, nome, memória em bytes); vazia se não for possível ler o /proc.
+    """
+    filhos: Dict[int, List[int]] = dict()
+    processos: Dict[int, Tuple[str, int]] = dict()
+    try:
+        entradas = [entrada.name for entrada in os.scandir('/proc') if entrada.name.isdigit()]
+    except OSError:
+        return list()
+    for pid in entradas:
+        try:
+            with open(f'/proc/{pid}/stat') as arq:
+                # O nome do processo (2º campo) pode conter espaços: o ppid vem após o ')'
+                inicio, fim = arq.read().rsplit(')', 1)
+            with open(f'/proc/{pid}/statm') as arq:
+                memoria = int(arq.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            continue
+        processos[int(pid)] = (inicio.split('(', 1)[1], memoria)
+        filhos.setdefault(int(fim.split()[1]), list()).append(int(pid))
+    arvore: List[Tuple[int, str, int]] = list()
+    pendentes = [raiz]
+    while pendentes:
+        pid = pendentes.pop()
+        if pid in processos:
+            arvore.append((pid, *processos[pid]))
+        pendentes.extend(filhos.get(pid, ()))
+    return arvore
+
+
+def memoria_navegador(driver) -> int:
+    """
+    Soma a memória residente (RSS) do chromedriver e de todos os processos do Chrome que ele iniciou.
+    Disponível apenas no Linux (leitura do /proc).
+    :args
+        {driver} - WebDriver (Navegador Chrome).
+    :returns
+        Memória em bytes, ou 0 se não for possível medir.
+    """
+    try:
+        raiz = driver.service.process.pid
+    except AttributeError as e:
+        logger.warning(f'Não foi possível medir a memória do navegador: {e}')
+        return 0
+    return sum(memoria for _, _, memoria in arvore_processos(raiz))
+
+
+def __medir_perfil(url: str, dir_download: str, servidor: bool) -> Dict[str, float]:
+    """ Mede o tempo de início do navegador, o tempo de carga da página e a memória ocupada. """
+    inicio = monotonic()
+    driver = criar_driver(dir_download, servidor=servidor)
+    try:
+        iniciado = monotonic()
+        driver.get(url)
+        carregado = monotonic()
+        return {
+            'inicio': iniciado - inicio,
+            'carga': carregado - iniciado,
+            'memoria': memoria_navegador(driver) / 2 ** 20
+        }
+    finally:
+        driver.quit()
+
+
+def comparar_perfis(url: str, dir_download: str) -> Dict[str, Dict[str, float]]:
+    """
+    Compara o perfil padrão (janela maximizada) com o perfil do modo servidor
+    e exibe no terminal as diferenças de tempo de início, carga da página e memória.
+    :args
+        {url} [str] - Página carregada na medição.
+        {dir_download} [str] - Diretório de download dos navegadores.
+    :returns
+        Dicionário com as medições de cada perfil ('padrao' e 'servidor').
+    """
+    medicoes = {
+        'padrao': __medir_perfil(url, dir_download, servidor=False),
+        'servidor': __medir_perfil(url, dir_download, servidor=True),
+    }
+    padrao, servidor = medicoes['padrao'], medicoes['servidor']
+    print(dedent(
+        f'''
+        ============================================================
+                    Perfil do navegador: padrão x servidor
+        ============================================================
+        Início do navegador: {padrao['inicio']:.2f}s x {servidor['inicio']:.2f}s ({servidor['inicio'] - padrao['inicio']:+.2f}s)
+        Carga da página: {padrao['carga']:.2f}s x {servidor['carga']:.2f}s ({servidor['carga'] - padrao['carga']:+.2f}s)
+        Memória (RSS): {padrao['memoria']:.0f} MB x {servidor['memoria']:.0f} MB ({servidor['memoria'] - padrao['memoria']:+.0f} MB)
+        ------------------------------------------------------------
+        ''')
+    )
+    return medicoes
@@ -0,0 +1,145 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple
+
+from lib.log import contexto_atual, definir_contexto, logger
+from lib.metricas import METRICAS
+
+# Marca o fim dos itens de uma fila
+FIM = object()
+
+
+class Estagio(NamedTuple):
+    """
+    Estágio do pipeline.
+    {funcao} recebe um item e devolve o item seguinte, uma lista de itens (um para cada item
+    do estágio seguinte) ou None (o item é descartado). Funções bloqueantes são executadas em
+    threads exclusivas do estágio, no máximo {concorrencia} ao mesmo tempo.
+    {fila} limita os itens aguardando o estágio (padrão: o dobro da concorrência).
+    """
+    nome: str
+    funcao: Callable[[Any], Any]
+    concorrencia: int = 1
+    fila: int = 0
+
+
+class Pipeline(object):
+    def __init__(self, estagios: List[Estagio]) -> None:
+        """
+        Encadeia estágios por filas limitadas (asyncio.Queue): cada estágio consome a sua fila
+        com a sua própria concorrência e só avança quando o seguinte tem espaço na fila,
+        de modo que o estágio mais lento define a vazão, e não a soma de todos.
+        :args
+            {estagios} [list] - Estágios, na ordem em que os itens os percorrem.
+        :methods
+            executar()
+        """
+        self.__estagios: List[Estagio] = list(estagios)
+        self.__processados: Dict[str, int] = {estagio.nome: 0 for estagio in estagios}
+        self.__falhas: Dict[str, int] = {estagio.nome: 0 for estagio in estagios}
+
+    @property
+    def estagios(self):
+        return self.__estagios
+
+    @property
+    def processados(self):
+        return self.__processados
+
+    @property
+    def falhas(self):
+        return self.__falhas
+
+    @staticmethod
+    def __chamar(estagio: Estagio, contexto: Dict[str, object], item: Any) -> Any:
+        """ Executa a função do estágio na thread do estágio, com o contexto de log do pipeline. """
+        definir_contexto(**contexto)
+        with METRICAS.medir('estagio_pipeline', estagio=estagio.nome):
+            return estagio.funcao(item)
+
+    async def __consumir(
+        self,
+        estagio: Estagio,
+        entrada: asyncio.Queue,
+        saida: asyncio.Queue,
+        executor: ThreadPoolExecutor
+    ) -> None:
+        """ Um dos consumidores do estágio: processa a fila até receber FIM. """
+        loop = asyncio.get_running_loop()
+        contexto = dict(contexto_atual())
+        while True:
+            item = await entrada.get()
+            if item is FIM:
+                return
+            try:
+                resultado = await loop.run_in_executor(
+                    executor, Pipeline.__chamar, estagio, contexto, item)
+            except Exception as e:
+                self.__falhas[estagio.nome] += 1
+                logger.error(f'Falha no estágio {estagio.nome} do pipeline: {e}')
+                continue
+            self.__processados[estagio.nome] += 1
+            if resultado is None or saida is None:
+                continue
+            for proximo in resultado if isinstance(resultado, list) else [resultado]:
+                await saida.put(proximo)
+
+    async def __alimentar(self, origem: Iterable, fila: asyncio.Queue) -> None:
+        """
+        Coloca os itens da origem na fila do primeiro estágio, respeitando o seu limite.
+        A origem é lida em uma thread, para que a leitura (ex.: da planilha) não bloqueie os estágios.
+        """
+        loop = asyncio.get_running_loop()
+        iterador = iter(origem)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipeline_origem') as executor:
+            while True:
+                item = await loop.run_in_executor(executor, next, iterador, FIM)
+                if item is FIM:
+                    return
+                await fila.put(item)
+
+    async def __executar(self, origem: Iterable) -> None:
+        filas = [
+            asyncio.Queue(maxsize=estagio.fila or 2 * max(1, estagio.concorrencia))
+            for estagio in self.estagios
+        ]
+        executores = [
+            ThreadPoolExecutor(
+                max_workers=max(1, estagio.concorrencia),
+                thread_name_prefix=f'pipeline_{estagio.nome}')
+            for estagio in self.estagios
+        ]
+        try:
+            alimentador = asyncio.ensure_future(self.__alimentar(origem, filas[0]))
+            consumidores = [
+                [
+                    asyncio.ensure_future(self.__consumir(
+                        estagio, filas[i], filas[i + 1] if i + 1 < len(filas) else None, executores[i]))
+                    for _ in range(max(1, estagio.concorrencia))
+                ]
+                for i, estagio in enumerate(self.estagios)
+            ]
+            await alimentador
+            # Encerra os estágios em ordem: cada um recebe FIM depois que o anterior terminou
+            for i, estagio in enumerate(self.estagios):
+                for _ in consumidores[i]:
+                    await filas[i].put(FIM)
+                await asyncio.gather(*consumidores[i])
+        finally:
+            for executor in executores:
+                executor.shutdown(wait=True)
+
+    def executar(self, origem: Iterable) -> Dict[str, int]:
+        """
+        Executa o pipeline até que todos os itens da origem tenham percorrido todos os estágios.
+        :args
+            {origem} [Iterable] - Itens do primeiro estágio (pode ser um gerador, lido sob demanda).
+        :returns
+            Quantidade de itens processados por estágio.
+        """
+        asyncio.run(self.__executar(origem))
+        for estagio in self.estagios:
+            logger.info(
+                f'Estágio {estagio.nome}: {self.processados[estagio.nome]} item(ns) processado(s), '
+                f'{self.falhas[estagio.nome]} falha(s).')
+        return self.processados
@@ -0,0 +1,147 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from textwrap import dedent
+from typing import Callable, Dict, List
+
+from lib.log import definir_contexto, logger
+from lib.mineracao import Cadastro
+
+
+class PoolNavegadores(object):
+    def __init__(
+        self,
+        fabrica: Callable,
+        workers: int = 1,
+        dir_base: str = os.path.expanduser('~') + os.sep + 'Downloads' + os.sep
+    ) -> None:
+        """
+        Classe que distribui o cadastro de clientes entre N sessões isoladas do navegador.
+        Cada worker possui seu próprio WebDriver e seu próprio diretório de download.
+        :args
+            {fabrica} [Callable] - Classe/função que cria o bot, recebendo (dir_download, id_worker).
+            {workers} [int] - Quantidade de navegadores simultâneos (padrão: 1).
+            {dir_base} [str] - Diretório base onde serão criados os diretórios de download dos workers.
+        :methods
+            fatiar_cadastro()
+            executar()
+        """
+        self.__fabrica: Callable = fabrica
+        self.__workers: int = max(1, workers)
+        self.__dir_base: str = dir_base
+
+    @property
+    def fabrica(self):
+        return self.__fabrica
+
+    @property
+    def workers(self):
+        return self.__workers
+
+    @property
+    def dir_base(self):
+        return self.__dir_base
+
+    def fatiar_cadastro(self, cadastro: List[Cadastro]) -> List[List[Cadastro]]:
+        """
+        Divide o cadastro em fatias intercaladas, uma para cada worker.
+        :args
+            {cadastro} [list] - Lista de Cadastro dos clientes.
+        :returns
+            Lista com as fatias do cadastro (as vazias são descartadas).
+        """
+        fatias = [cadastro[i::self.workers] for i in range(self.workers)]
+        return [fatia for fatia in fatias if fatia]
+
+    def __dir_worker(self, id_worker: int) -> str:
+        """ Cria, se necessário, e retorna o diretório de download exclusivo do worker. """
+        diretorio: str = self.dir_base + f'cedae_worker_{id_worker}' + os.sep
+        os.makedirs(diretorio, exist_ok=True)
+        return diretorio
+
+    def __executar_worker(
+        self,
+        id_worker: int,
+        url: str,
+        fatia: List[Cadastro]
+    ) -> List[Dict[str, str]]:
+        """
+        Executa um bot com sua fatia do cadastro e devolve os resultados do worker.
+        """
+        definir_contexto(worker=id_worker)
+        logger.info(
+            f'Worker {id_worker}: iniciando com {len(fatia)} matrícula(s).')
+        try:
+            bot = self.fabrica(
+                dir_download=self.__dir_worker(id_worker),
+                id_worker=id_worker
+            )
+        except Exception as e:
+            logger.critical(
+                f'Worker {id_worker}: falha ao iniciar o navegador. Erro: {e}')
+            return [
+                {
+                    'cliente': cadastro.cliente,
+                    'matricula': cadastro.matricula,
+                    'vencimento': '',
+                    'status': 'FALHA! Navegador não iniciado.'
+                } for cadastro in fatia
+            ]
+        try:
+            bot.baixar_segunda_via(url, cadastro_clientes=fatia)
+        except Exception as e:
+            logger.critical(f'Worker {id_worker}: execução interrompida. Erro: {e}')
+        logger.info(f'Worker {id_worker}: finalizado.')
+        return bot.resultados
+
+    def executar(self, url: str, cadastro: List[Cadastro]) -> List[Dict[str, str]]:
+        """
+        Distribui o cadastro entre os workers e aguarda a conclusão de todos.
+        :args
+            {url} [str] - Endereço da página de emissão da segunda via.
+            {cadastro} [list] - Lista de Cadastro dos clientes.
+        :returns
+            Lista única com os resultados de todos os workers.
+        """
+        fatias = self.fatiar_cadastro(cadastro)
+        resultados: List[Dict[str, str]] = list()
+        if not fatias:
+            return resultados
+        logger.info(
+            f'Distribuindo {len(cadastro)} matrícula(s) entre {len(fatias)} navegador(es)...')
+        with ThreadPoolExecutor(max_workers=len(fatias)) as executor:
+            futuros = [
+                executor.submit(self.__executar_worker, i, url, fatia)
+                for i, fatia in enumerate(fatias, start=1)
+            ]
+            for futuro in as_completed(futuros):
+                resultados.extend(futuro.result())
+        return resultados
+
+
+def exibir_resumo_execucao(resultados: List[Dict[str, str]]) -> None:
+    """
+    Exibe no terminal o resumo consolidado da execução de todos os workers.
+    :args
+        {resultados} [list] - Lista de dicionários com cliente, matrícula, vencimento e status.
+    :returns
+        Nenhum.
+    """
+    sucesso = [r for r in resultados if r['status'].startswith('Concluída')]
+    linhas = '\n'.join(
+        f'{r["cliente"]} | {r["matricula"]} | {r["vencimento"]} | {r["status"]}'
+        for r in resultados
+    )
+    print(dedent(
+        f'''
+        ============================================================
+                        Resumo da execução
+        ============================================================
+        Data: {datetime.today().strftime('%d/%m/%Y %H:%M:%S')}
+        Contas enviadas: {len(sucesso)}
+        Ocorrências: {len(resultados)}
+        ------------------------------------------------------------
+        ''')
+    )
+    if linhas:
+        print(linhas)
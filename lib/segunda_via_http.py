@@ -0,0 +1,280 @@
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Tuple
+from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from lib.log import logger
+from lib.vencimento import Vencimento, converter_vencimento
+
+POSTBACK = re.compile(r"__doPostBack\('([^']*)','([^']*)'\)")
+ALERTA = re.compile(r'''alert\((['"])(.*?)\1\)''', re.DOTALL)
+JANELA = re.compile(r'''(?:window\.open|location\.href\s*=)\s*\(?\s*['"]([^'"]+)['"]''')
+
+
+class LeitorPagina(HTMLParser):
+    def __init__(self) -> None:
+        """
+        Analisador da página ASP.NET de emissão de segunda via.
+        Extrai em uma única leitura os campos do formulário, os selects,
+        os links (href/onclick) e os textos das colunas de vencimento (colVenc).
+        """
+        super().__init__(convert_charrefs=True)
+        self.acao: str = ''
+        self.campos: Dict[str, str] = dict()
+        self.botoes: Dict[str, Tuple[str, str]] = dict()
+        self.selects: Dict[str, List[str]] = dict()
+        self.links: Dict[str, str] = dict()
+        self.ids: set = set()
+        self.vencimentos: List[str] = list()
+        self.__select_atual: str = ''
+        self.__capturando: str = ''
+        self.__texto: List[str] = list()
+
+    def handle_starttag(self, tag: str, attrs: list) -> None:
+        atributos = {chave: valor or '' for chave, valor in attrs}
+        if atributos.get('id'):
+            self.ids.add(atributos['id'])
+        if tag == 'form' and not self.acao:
+            self.acao = atributos.get('action', '')
+        elif tag == 'input' and atributos.get('name'):
+            tipo = atributos.get('type', 'text').lower()
+            if tipo in ('submit', 'button', 'image'):
+                self.botoes[atributos.get('id') or atributos['name']] = (
+                    atributos['name'], atributos.get('value', ''))
+            elif tipo in ('checkbox', 'radio') and 'checked' not in atributos:
+                pass
+            else:
+                self.campos[atributos['name']] = atributos.get('value', '')
+        elif tag == 'select' and atributos.get('name'):
+            self.__select_atual = atributos['name']
+            self.selects[self.__select_atual] = list()
+        elif tag == 'option' and self.__select_atual:
+            self.selects[self.__select_atual].append(
+                atributos.get('value', ''))
+        if atributos.get('id') and (tag == 'a' or atributos.get('onclick')):
+            self.links[atributos['id']] = atributos.get(
+                'href', '') + ' ' + atributos.get('onclick', '')
+        if 'colVenc' in atributos.get('class', '').split():
+            self.__capturando = tag
+            self.__texto = list()
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == 'select':
+            self.__select_atual = ''
+        elif self.__capturando and tag == self.__capturando:
+            self.vencimentos.append(''.join(self.__texto).strip())
+            self.__capturando = ''
+
+    def handle_data(self, data: str) -> None:
+        if self.__capturando:
+            self.__texto.append(data)
+
+
+class PaginaSegundaVia(object):
+    def __init__(self, url: str, html: str) -> None:
+        """
+        Representa uma página do portal já analisada.
+        :args
+            {url} [str] - Endereço de onde a página foi obtida.
+            {html} [str] - Conteúdo HTML da página.
+        """
+        self.url: str = url
+        self.html: str = html
+        self.leitor: LeitorPagina = LeitorPagina()
+        self.leitor.feed(html)
+
+    @property
+    def acao(self) -> str:
+        return urljoin(self.url, self.leitor.acao) if self.leitor.acao else self.url
+
+    @property
+    def alerta(self) -> str:
+        """ Texto do alerta JavaScript emitido pela página (ex.: documento inválido). """
+        encontrado = ALERTA.search(self.html)
+        return encontrado.group(2) if encontrado else ''
+
+    def formulario(self, **extras) -> Dict[str, str]:
+        """ Campos do formulário (VIEWSTATE, EVENTVALIDATION etc.) acrescidos dos extras. """
+        dados = dict(self.leitor.campos)
+        for nome, opcoes in self.leitor.selects.items():
+            if opcoes:
+                dados.setdefault(nome, opcoes[0])
+        dados.update(extras)
+        return dados
+
+
+class SegundaViaHttp(object):
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 15,
+        conexoes: int = 10
+    ) -> None:
+        """
+        Motor de emissão de segunda via por HTTP, sem navegador.
+        Reproduz o formulário ASP.NET da página ENTRADA.aspx com uma requests.Session
+        reaproveitada entre as matrículas (pool de conexões keep-alive).
+        :args
+            {url} [str] - Endereço da página de emissão da segunda via.
+            {timeout} [float] - Tempo máximo de cada requisição em segundos (padrão: 15).
+            {conexoes} [int] - Tamanho do pool de conexões da sessão (padrão: 10).
+        :methods
+            consultar()
+            vencimentos()
+            baixar()
+            proxima_pagina()
+        """
+        self.__url: str = url
+        self.__timeout: float = timeout
+        self.__sessao = requests.Session()
+        adaptador = HTTPAdapter(
+            pool_connections=conexoes,
+            pool_maxsize=conexoes,
+            max_retries=Retry(total=2, backoff_factor=0.5,
+                              status_forcelist=(502, 503, 504))
+        )
+        self.__sessao.mount('http://', adaptador)
+        self.__sessao.mount('https://', adaptador)
+        self.__sessao.headers.update({'User-Agent': 'Mozilla/5.0'})
+
+    @property
+    def url(self):
+        return self.__url
+
+    @property
+    def sessao(self):
+        return self.__sessao
+
+    def __postar(self, pagina: PaginaSegundaVia, dados: Dict[str, str]) -> requests.Response:
+        resposta = self.sessao.post(
+            pagina.acao,
+            data=dados,
+            timeout=self.__timeout,
+            headers={'Referer': pagina.url}
+        )
+        resposta.raise_for_status()
+        return resposta
+
+    def __acionar(
+        self,
+        pagina: PaginaSegundaVia,
+        elemento: str,
+        **extras
+    ) -> requests.Response:
+        """
+        Simula o clique em um elemento: __doPostBack, botão de submit ou link simples.
+        """
+        acao = pagina.leitor.links.get(elemento, '')
+        postback = POSTBACK.search(acao)
+        if postback:
+            extras.update({
+                '__EVENTTARGET': postback.group(1),
+                '__EVENTARGUMENT': postback.group(2)
+            })
+            dados = pagina.formulario(**extras)
+            return self.__postar(pagina, dados)
+        if elemento in pagina.leitor.botoes:
+            dados = pagina.formulario(**extras)
+            nome, valor = pagina.leitor.botoes[elemento]
+            dados[nome] = valor
+            return self.__postar(pagina, dados)
+        href = acao.split(' ')[0]
+        if href and not href.startswith('javascript'):
+            resposta = self.sessao.get(
+                urljoin(pagina.url, href), timeout=self.__timeout)
+            resposta.raise_for_status()
+            return resposta
+        raise LookupError(f'Elemento [{elemento}] não encontrado na página.')
+
+    def consultar(self, matricula: str, documento: str) -> PaginaSegundaVia:
+        """
+        Preenche MATRICULA/FC01_CPF e aciona o botão btncpfvalida.
+        :args
+            {matricula} [str] - Número da matrícula.
+            {documento} [str] - Número do documento (CPF/CNPJ).
+        :returns
+            A página de resultado. Verificar PaginaSegundaVia.alerta para documento inválido.
+        """
+        resposta = self.sessao.get(self.url, timeout=self.__timeout)
+        resposta.raise_for_status()
+        entrada = PaginaSegundaVia(resposta.url, resposta.text)
+        extras = {'MATRICULA': matricula}
+        if documento:
+            extras['FC01_CPF'] = documento
+        resposta = self.__acionar(entrada, 'btncpfvalida', **extras)
+        return PaginaSegundaVia(resposta.url, resposta.text)
+
+    @staticmethod
+    def vencimentos(pagina: PaginaSegundaVia, numero_pagina: int = 1) -> List[Vencimento]:
+        """
+        Extrai as datas de vencimento da página com o índice da linha correspondente
+        nos elementos DRLMOTIVO{n}/EPortalLinkImp{n}/LinkBar{n}.
+        :args
+            {pagina} [PaginaSegundaVia] - Página de resultado da consulta.
+            {numero_pagina} [int] - Número da página de vencimentos (padrão: 1).
+        :returns
+            Lista de Vencimento.
+        """
+        deslocamento = 1 if 'linha_continuacao' in pagina.leitor.ids else 0
+        encontrados: List[Vencimento] = list()
+        for i, texto in enumerate(pagina.leitor.vencimentos):
+            data = converter_vencimento(texto)
+            if data is not None:
+                encontrados.append(
+                    Vencimento(numero_pagina, i + deslocamento, texto, data))
+        return encontrados
+
+    def baixar(
+        self,
+        pagina: PaginaSegundaVia,
+        linha: int,
+        com_documento: bool,
+        destino: str
+    ) -> str:
+        """
+        Seleciona o motivo da emissão e baixa o PDF da linha informada diretamente para o disco.
+        :args
+            {pagina} [PaginaSegundaVia] - Página com a tabela de vencimentos.
+            {linha} [int] - Índice da linha do vencimento.
+            {com_documento} [bool] - Se a consulta foi feita com documento (EPortalLinkImp) ou não (LinkBar).
+            {destino} [str] - Caminho completo do arquivo PDF a gravar.
+        :returns
+            [str] - Caminho do arquivo gravado.
+        """
+        motivo = 'DRLMOTIVO' + str(linha)
+        opcoes = pagina.leitor.selects.get(motivo, [])
+        extras = {motivo: opcoes[1]} if len(opcoes) > 1 else {}
+        elemento = ('EPortalLinkImp' if com_documento else 'LinkBar') + \
+            str(linha)
+        resposta = self.__acionar(pagina, elemento, **extras)
+        if not resposta.content.startswith(b'%PDF'):
+            # O portal pode responder com uma página que abre o PDF em nova janela
+            janela = JANELA.search(resposta.text)
+            if not janela:
+                raise ValueError(
+                    f'A resposta do elemento [{elemento}] não contém um PDF.')
+            resposta = self.sessao.get(
+                urljoin(resposta.url, janela.group(1)), timeout=self.__timeout)
+            resposta.raise_for_status()
+            if not resposta.content.startswith(b'%PDF'):
+                raise ValueError(
+                    f'A resposta do elemento [{elemento}] não contém um PDF.')
+        with open(destino, 'wb') as arquivo:
+            arquivo.write(resposta.content)
+        logger.info(f'PDF baixado via HTTP: {destino}')
+        return destino
+
+    def proxima_pagina(self, pagina: PaginaSegundaVia) -> PaginaSegundaVia:
+        """
+        Avança para a próxima página de vencimentos (Proxima1), se houver.
+        :returns
+            A próxima página ou None.
+        """
+        if 'Proxima1' not in pagina.leitor.ids:
+            return None
+        resposta = self.__acionar(pagina, 'Proxima1')
+        return PaginaSegundaVia(resposta.url, resposta.text)
@@ -0,0 +1,131 @@
+from threading import Thread
+from typing import Callable
+
+from lib.log import logger
+
+
+class SupervisorNavegador(object):
+    def __init__(
+        self,
+        fabrica: Callable,
+        reciclar_a_cada: int = 50,
+        limite_resposta: float = 15.0
+    ) -> None:
+        """
+        Supervisiona a sessão do navegador: detecta sessões encerradas ou travadas e reinicia
+        o Chrome de forma transparente. Também recicla o navegador a cada N matrículas,
+        limitando o crescimento de memória em execuções longas.
+        :args
+            {fabrica} [Callable] - Função sem argumentos que cria o WebDriver.
+            {reciclar_a_cada} [int] - Quantidade de matrículas por sessão; 0 desativa (padrão: 50).
+            {limite_resposta} [float] - Tempo máximo, em segundos, para o navegador responder (padrão: 15).
+        :methods
+            preparar()
+            saudavel()
+            reiniciar()
+            encerrar()
+        """
+        self.__fabrica: Callable = fabrica
+        self.__reciclar_a_cada: int = max(0, reciclar_a_cada)
+        self.__limite_resposta: float = limite_resposta
+        self.__driver = None
+        self.__contas_sessao: int = 0
+        self.__reinicios: int = 0
+
+    @property
+    def driver(self):
+        """ WebDriver da sessão corrente, iniciado na primeira utilização. """
+        if self.__driver is None:
+            self.__driver = self.__fabrica()
+            self.__contas_sessao = 0
+        return self.__driver
+
+    @property
+    def ativo(self):
+        return self.__driver is not None
+
+    @property
+    def reinicios(self):
+        return self.__reinicios
+
+    def preparar(self) -> None:
+        """
+        Prepara a sessão para a próxima matrícula: recicla o navegador ao atingir o limite
+        de matrículas por sessão e reinicia a sessão que não estiver respondendo.
+        """
+        if self.__driver is not None:
+            if self.__reciclar_a_cada and self.__contas_sessao >= self.__reciclar_a_cada:
+                logger.info(
+                    f'Reciclando o navegador após {self.__contas_sessao} matrícula(s)...')
+                self.reiniciar(contar=False)
+            elif not self.saudavel():
+                self.reiniciar()
+        self.driver
+        self.__contas_sessao += 1
+
+    def saudavel(self) -> bool:
+        """
+        Verifica se a sessão do navegador está viva e respondendo dentro do tempo limite.
+        :returns
+            True/False. Sem sessão iniciada, retorna True.
+        """
+        if self.__driver is None:
+            return True
+        concluida, retorno = SupervisorNavegador.__chamar_com_limite(
+            lambda: self.__driver.execute_script('return document.readyState'),
+            self.__limite_resposta)
+        if not concluida:
+            logger.warning(f'Sessão do navegador não responde: {retorno}')
+        return concluida
+
+    def reiniciar(self, contar: bool = True) -> None:
+        """
+        Encerra a sessão atual (à força, se necessário) e inicia um novo navegador.
+        :args
+            {contar} [bool] - Se conta como reinício por falha (padrão: True).
+        """
+        if contar:
+            self.__reinicios += 1
+            logger.warning(
+                f'Reiniciando o navegador (reinício {self.__reinicios})...')
+        self.encerrar()
+        self.driver
+
+    def encerrar(self) -> None:
+        """ Fecha o navegador; se ele não responder, encerra o processo do chromedriver. """
+        if self.__driver is None:
+            return
+        driver, self.__driver = self.__driver, None
+        concluida, retorno = SupervisorNavegador.__chamar_com_limite(
+            driver.quit, self.__limite_resposta)
+        if concluida:
+            return
+        logger.warning(f'Falha ao fechar o navegador ({retorno}). Encerrando o processo...')
+        try:
+            driver.service.stop()
+        except Exception as e:
+            logger.error(f'Não foi possível encerrar o processo do navegador: {e}')
+
+    @staticmethod
+    def __chamar_com_limite(funcao: Callable, limite: float):
+        """
+        Executa a função em uma thread auxiliar, aguardando no máximo o tempo limite.
+        :returns
+            Tupla (concluída [bool], retorno ou exceção).
+        """
+        resultado = [False, None]
+
+        def alvo():
+            try:
+                resultado[1] = funcao()
+            except Exception as e:
+                resultado[1] = e
+            else:
+                resultado[0] = True
+
+        thread = Thread(target=alvo, daemon=True)
+        thread.start()
+        thread.join(limite)
+        if thread.is_alive():
+            return False, TimeoutError(f'sem resposta em {limite:g}s')
+        return resultado[0], resultado[1]
@@ -1,50 +1,93 @@
+import hashlib
 from pathlib import Path
-from typing import Dict
+from threading import Lock
+from time import monotonic
+from typing import Dict, Tuple
 
 import requests
 import yaml
 
 from lib.log import logger
+from lib.metricas import METRICAS
+
+# Verificação de disponibilidade do portal: timeout estrito e validade do resultado em cache
+TIMEOUT_VERIFICACAO = 5.0
+TTL_VERIFICACAO = 60.0
 
 
 class SiteOn:
-    def __init__(self, url) -> bool:
+    # Resultado da última verificação de cada URL (instante, online) e validadores HTTP
+    # (ETag/Last-Modified) da resposta, compartilhados entre as instâncias e os workers
+    __cache: Dict[str, Tuple[float, bool]] = dict()
+    __validadores: Dict[str, Dict[str, str]] = dict()
+    __trava = Lock()
+
+    def __init__(self, url, timeout: float = TIMEOUT_VERIFICACAO, ttl: float = TTL_VERIFICACAO) -> bool:
         """
         Classe que verifica a resposta de acesso a um site.
+        A verificação usa HEAD (ou GET condicional, se o servidor não aceitar HEAD), com timeout,
+        e o resultado vale por {ttl} segundos para todas as instâncias da mesma URL.
         :args
             {url} [str] - URL de acesso.
+            {timeout} [float] - Tempo máximo, em segundos, da conexão e da resposta (padrão: 5).
+            {ttl} [float] - Validade, em segundos, do resultado em cache (padrão: 60).
         :returns
             True/False.
         :methods
             verificar()
         """
         self.__url = url
+        self.__timeout: float = timeout
+        self.__ttl: float = ttl
 
     @property
     def url(self):
         return self.__url
 
-    def verificar(self) -> bool:
+    def verificar(self, forcar: bool = False) -> bool:
         """
         Verifica se a página está com seus recursos disponíveis.
         :args
-            {url} - String com a URL a carregar.
+            {forcar} [bool] - Ignora o resultado em cache (padrão: False).
         :returns
             True/False.
         """
+        if not forcar:
+            with SiteOn.__trava:
+                instante, online = SiteOn.__cache.get(self.url, (None, False))
+            if instante is not None and monotonic() - instante < self.__ttl:
+                return online
+        online = self.__consultar()
+        with SiteOn.__trava:
+            SiteOn.__cache[self.url] = (monotonic(), online)
+        return online
+
+    @METRICAS.medido('verificacao_site', contar_falhas=True)
+    def __consultar(self) -> bool:
+        """ Consulta o site sem baixar a página: HEAD ou, se recusado, GET condicional sem ler o corpo. """
         # https://developer.mozilla.org/pt-BR/docs/Web/HTTP/Status
         try:
-            site_online = requests.get(self.url)
-            logger.info(f'{self.url} <=> {site_online}')
-        except Exception as e:
+            resposta = requests.head(self.url, timeout=self.__timeout, allow_redirects=True)
+            if resposta.status_code in (405, 501):
+                with SiteOn.__trava:
+                    validadores = dict(SiteOn.__validadores.get(self.url, dict()))
+                with requests.get(self.url, headers=validadores, timeout=self.__timeout, stream=True) as resposta:
+                    pass
+            logger.info(f'{self.url} <=> {resposta}')
+        except requests.RequestException as e:
             logger.critical(f'''URL indisponível!
-            Retorno: {site_online}
             Erro: {e}''')
-        finally:
-            if site_online.status_code > 199 and site_online.status_code < 299:
-                return True
-            else:
-                return False
+            return False
+        cabecalhos = {
+            cabecalho: resposta.headers[origem]
+            for origem, cabecalho in (('ETag', 'If-None-Match'), ('Last-Modified', 'If-Modified-Since'))
+            if origem in resposta.headers
+        }
+        if cabecalhos:
+            with SiteOn.__trava:
+                SiteOn.__validadores[self.url] = cabecalhos
+        # 304: página não modificada desde a última verificação
+        return 199 < resposta.status_code < 299 or resposta.status_code == 304
 
 
 class ArquivoConfig(object):
@@ -166,3 +209,23 @@ class Arquivo(object):
             logger.critical(
                 f'Falha ao acessar o arquivo: {self.arquivo}. Erro: FileNotFoundError.')
             return False
+
+
+def hash_arquivo(arquivo: str, bloco: int = 65536) -> str:
+    """
+    Calcula o hash SHA-256 de um arquivo, lendo-o em blocos.
+    :args
+        {arquivo} [str] - Caminho do arquivo.
+        {bloco} [int] - Tamanho do bloco de leitura em bytes (padrão: 64 KiB).
+    :returns
+        Hash hexadecimal ou vazio em caso de erro.
+    """
+    sha256 = hashlib.sha256()
+    try:
+        with open(arquivo, 'rb') as arq:
+            for parte in iter(lambda: arq.read(bloco), b''):
+                sha256.update(parte)
+    except OSError as e:
+        logger.error(f'Falha ao calcular o hash do arquivo {arquivo}. Erro: {e}')
+        return ''
+    return sha256.hexdigest()
@@ -0,0 +1,111 @@
+from datetime import date, datetime
+from typing import List, NamedTuple, Tuple
+
+# Extrai, em uma única chamada ao navegador, todas as linhas da tabela de vencimentos da página:
+# texto da coluna colVenc, índice da linha (deslocado pela linha 'Continuação...'),
+# nome do select DRLMOTIVO{n}, ids dos links EPortalLinkImp{n}/LinkBar{n} e se há a página seguinte.
+SCRIPT_TABELA = """
+var vencimentos = document.getElementsByClassName('colVenc');
+var deslocamento = document.getElementById('linha_continuacao') ? 1 : 0;
+var existe = function (id) { return document.getElementById(id) ? id : ''; };
+var linhas = [];
+for (var i = 0; i < vencimentos.length; i++) {
+    var n = i + deslocamento;
+    var motivo = document.getElementsByName('DRLMOTIVO' + n);
+    linhas.push([
+        (vencimentos[i].innerText || vencimentos[i].textContent || '').trim(),
+        n,
+        motivo.length ? motivo[0].name : '',
+        existe('EPortalLinkImp' + n),
+        existe('LinkBar' + n)
+    ]);
+}
+return [linhas, !!document.getElementById('Proxima1')];
+"""
+
+
+class Vencimento(NamedTuple):
+    """ Linha da tabela de vencimentos do portal. """
+    pagina: int
+    linha: int
+    texto: str
+    data: date
+    motivo: str = ''
+    link_imp: str = ''
+    link_bar: str = ''
+
+
+class JanelaVencimento(object):
+    def __init__(self, meses: int = 1, vencidas: bool = False, hoje: date = None) -> None:
+        """
+        Janela de emissão das contas, em meses a partir do mês corrente.
+        O padrão (1 mês, sem vencidas) reproduz a emissão apenas das contas do mês corrente.
+        :args
+            {meses} [int] - Quantidade de meses, contando o corrente (padrão: 1).
+            {vencidas} [bool] - Se inclui as contas com vencimento em meses anteriores (padrão: False).
+            {hoje} [date] - Data de referência (padrão: data atual).
+        :methods
+            contem()
+        """
+        self.__meses: int = max(1, meses)
+        self.__vencidas: bool = vencidas
+        self.__hoje: date = hoje or datetime.today().date()
+
+    @property
+    def meses(self):
+        return self.__meses
+
+    @property
+    def vencidas(self):
+        return self.__vencidas
+
+    def contem(self, data: date) -> bool:
+        """
+        Verifica se a data de vencimento está dentro da janela de emissão.
+        :args
+            {data} [date] - Data de vencimento da conta.
+        :returns
+            True/False.
+        """
+        deslocamento = (data.year * 12 + data.month) - \
+            (self.__hoje.year * 12 + self.__hoje.month)
+        if deslocamento < 0:
+            return self.vencidas
+        return deslocamento < self.meses
+
+    def __str__(self) -> str:
+        descricao = 'mês corrente' if self.meses == 1 else f'próximos {self.meses} meses'
+        return descricao + (' e vencidas' if self.vencidas else '')
+
+
+def converter_vencimento(texto: str) -> date:
+    """
+    Converte o texto da coluna de vencimento (dd/mm/aa) em data.
+    :args
+        {texto} [str] - Texto extraído da coluna colVenc.
+    :returns
+        Data ou None se o texto não for uma data (ex.: título da coluna).
+    """
+    try:
+        return datetime.strptime(texto.strip(), '%d/%m/%y').date()
+    except ValueError:
+        return None
+
+
+def extrair_tabela(driver, pagina: int) -> Tuple[List[Vencimento], bool]:
+    """
+    Fotografa a tabela de vencimentos da página atual com um único execute_script.
+    :args
+        {driver} - WebDriver (Navegador Chrome).
+        {pagina} [int] - Número da página de vencimentos.
+    :returns
+        Tupla (lista de Vencimento, se existe a próxima página).
+    """
+    linhas, proxima = driver.execute_script(SCRIPT_TABELA)
+    tabela: List[Vencimento] = list()
+    for texto, linha, motivo, link_imp, link_bar in linhas:
+        data = converter_vencimento(texto)
+        if data is not None:
+            tabela.append(
+                Vencimento(pagina, linha, texto, data, motivo, link_imp, link_bar))
+    return tabela, proxima
@@ -0,0 +1,460 @@
+import contextlib
+import csv
+import io
+import json
+import logging
+import os
+import resource
+import shutil
+import smtplib
+import sys
+import tempfile
+import tracemalloc
+from argparse import ArgumentParser
+from datetime import datetime
+from email import encoders
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from functools import partial, wraps
+from pathlib import Path
+from platform import python_version, system
+from threading import Event, Lock, Thread
+from time import monotonic
+from typing import Callable, Dict, List, Tuple
+
+import agua
+from agua import (BotAguaSegundaVia, PipelineSegundaVia,
+                  criar_caixa_saida)
+from controle.diario_execucao import fechar_conexao as fechar_diario
+from controle.diario_execucao import iniciar_execucao
+from controle.matricula_processada import \
+    fechar_conexao as fechar_controle
+from lib.caixa_saida import CaixaSaida
+from lib.configuracao import ConfigSmtp, Configuracao, carregar_corpo_html
+from lib.elemento_web import ArquivoDownload
+from lib.envio_email import ConexaoSmtp, Email, MensagemEmail
+from lib.espera import Disjuntor, Ritmo
+from lib.mineracao import pegar_cadastro_prestadora
+from lib.perfil_navegador import arvore_processos
+from lib.pool_navegador import PoolNavegadores
+from lib.segunda_via_http import SegundaViaHttp
+from lib.vencimento import JanelaVencimento
+from simulador.portal import ServidorPortal
+from simulador.servidor_smtp import ServidorSmtp
+
+DIR_APLICACAO = Path(__file__).resolve().parent.parent
+# Arquivos da aplicação usados pelo robô a partir do diretório de trabalho
+ARQUIVOS_APLICACAO = ('chromedriver_linux', 'chromedriver_win.exe', 'config/corpo_email.html')
+
+
+class Cronometro(object):
+    def __init__(self) -> None:
+        """
+        Mede a duração de cada etapa do pipeline envolvendo os métodos que a executam.
+        :methods
+            envolver()
+            restaurar()
+            resumo()
+        """
+        self.__amostras: Dict[str, List[float]] = dict()
+        self.__originais: list = list()
+        self.__trava = Lock()
+
+    def registrar(self, etapa: str, duracao: float) -> None:
+        with self.__trava:
+            self.__amostras.setdefault(etapa, list()).append(duracao)
+
+    def envolver(self, alvo, nome: str, etapa: str) -> None:
+        """ Substitui alvo.nome por uma versão cronometrada, registrada na etapa. """
+        original: Callable = getattr(alvo, nome)
+
+        @wraps(original)
+        def cronometrado(*args, **kwargs):
+            inicio = monotonic()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.registrar(etapa, monotonic() - inicio)
+
+        setattr(alvo, nome, cronometrado)
+        self.__originais.append((alvo, nome, original))
+
+    def restaurar(self) -> None:
+        for alvo, nome, original in reversed(self.__originais):
+            setattr(alvo, nome, original)
+        self.__originais = list()
+
+    def resumo(self) -> Dict[str, Dict[str, float]]:
+        """ Quantidade de amostras e latências p50/p95/máxima (em segundos) de cada etapa. """
+        resumo: Dict[str, Dict[str, float]] = dict()
+        with self.__trava:
+            amostras = {etapa: sorted(valores) for etapa, valores in self.__amostras.items()}
+        for etapa, valores in amostras.items():
+            resumo[etapa] = {
+                'amostras': len(valores),
+                'p50': round(percentil(valores, 0.50), 4),
+                'p95': round(percentil(valores, 0.95), 4),
+                'max': round(valores[-1], 4),
+            }
+        return resumo
+
+
+class Monitor(Thread):
+    def __init__(self, intervalo: float = 0.5) -> None:
+        """
+        Amostra, em segundo plano, a memória (RSS) do processo e dos descendentes
+        (chromedriver e Chrome) e a quantidade de navegadores abertos.
+        """
+        super().__init__(daemon=True)
+        self.__intervalo: float = intervalo
+        self.__parar = Event()
+        self.pico_rss: int = 0
+        self.pico_navegadores: int = 0
+
+    def run(self) -> None:
+        while not self.__parar.is_set():
+            self.amostrar()
+            self.__parar.wait(self.__intervalo)
+
+    def amostrar(self) -> None:
+        processos = arvore_processos(os.getpid())
+        self.pico_rss = max(self.pico_rss, sum(memoria for _, _, memoria in processos))
+        self.pico_navegadores = max(self.pico_navegadores, sum(
+            1 for _, nome, _ in processos if nome.startswith('chromedriver')))
+
+    def parar(self) -> None:
+        self.__parar.set()
+        self.join()
+        self.amostrar()
+
+
+def percentil(valores: List[float], fracao: float) -> float:
+    """ Percentil por posição mais próxima de uma lista já ordenada. """
+    if not valores:
+        return 0.0
+    return valores[min(len(valores) - 1, round(fracao * (len(valores) - 1)))]
+
+
+def __preparar_diretorio(diretorio: Path) -> None:
+    """ Cria a estrutura de trabalho do robô (controle/, config/) e liga os arquivos da aplicação. """
+    (diretorio / 'controle').mkdir()
+    (diretorio / 'config').mkdir()
+    (diretorio / 'downloads').mkdir()
+    for nome in ARQUIVOS_APLICACAO:
+        origem = DIR_APLICACAO / nome
+        if origem.is_file():
+            os.symlink(origem, diretorio / nome)
+
+
+def __gerar_cadastro(arquivo: Path, tamanho: int, clientes: int = 0) -> List[Tuple[str, str]]:
+    """
+    Gera o cadastro CSV com matrículas fictícias, distribuídas entre N destinatários (0: um por matrícula).
+    Retorna as tuplas (matrícula, documento) geradas.
+    """
+    cadastro: List[Tuple[str, str]] = list()
+    with open(arquivo, 'w', newline='', encoding='utf-8') as arq:
+        escritor = csv.writer(arq, delimiter=';')
+        escritor.writerow(['Cliente', 'Matrícula', 'Documento', 'E-mail'])
+        for i in range(1, tamanho + 1):
+            cadastro.append((f'{100000 + i}-{i % 10}', f'{i:011d}'))
+            escritor.writerow([
+                f'Cliente {i:05d}',
+                *cadastro[-1],
+                f'cliente{i % clientes if clientes else i}@exemplo.com.br'
+            ])
+    return cadastro
+
+
+def __fechar_controle() -> None:
+    """
+    Fecha as conexões da thread principal com os bancos de controle: os caminhos são relativos ao
+    diretório de trabalho, que muda a cada rodada (as threads dos workers são recriadas a cada uma).
+    """
+    fechar_controle()
+    fechar_diario()
+
+
+def __instrumentar(cronometro: Cronometro) -> None:
+    """ Cronometra as etapas dos motores selenium e http e do envio dos e-mails. """
+    cronometro.envolver(SegundaViaHttp, 'consultar', 'consulta')
+    cronometro.envolver(SegundaViaHttp, 'proxima_pagina', 'pagina')
+    cronometro.envolver(SegundaViaHttp, 'baixar', 'download')
+    cronometro.envolver(BotAguaSegundaVia, 'verificar_conteudo_pagina', 'consulta')
+    cronometro.envolver(agua, 'extrair_tabela', 'tabela')
+    cronometro.envolver(ArquivoDownload, 'arquivo', 'download')
+    cronometro.envolver(CaixaSaida, 'adicionar', 'enfileiramento')
+    cronometro.envolver(Email, 'enviar', 'envio')
+
+
+def executar_rodada(tamanho: int, args) -> Dict:
+    """
+    Executa o pipeline completo (cadastro, portal, download, e-mail e controle) para N matrículas
+    contra o portal e o SMTP simulados, em um diretório de trabalho temporário.
+    :args
+        {tamanho} [int] - Quantidade de matrículas.
+        {args} - Parâmetros da linha de comando.
+    :returns
+        Dicionário com as medições da rodada.
+    """
+    diretorio = Path(tempfile.mkdtemp(prefix=f'benchmark_{tamanho}_'))
+    __preparar_diretorio(diretorio)
+    portal = ServidorPortal(
+        ('127.0.0.1', 0),
+        latencia=args.latencia,
+        variacao=args.variacao,
+        taxa_erro=args.taxa_erro,
+        taxa_queda=args.taxa_queda,
+        taxa_alerta=args.taxa_alerta,
+        semente=args.semente
+    )
+    smtp = ServidorSmtp(('127.0.0.1', 0))
+    portal.iniciar()
+    smtp.iniciar()
+    cronometro = Cronometro()
+    monitor = Monitor()
+    dir_anterior = os.getcwd()
+    nivel_log = logging.getLogger().level
+    try:
+        os.chdir(diretorio)
+        __fechar_controle()
+        cadastro = __gerar_cadastro(diretorio / 'cadastro.csv', tamanho, args.clientes)
+        __instrumentar(cronometro)
+        logging.getLogger().setLevel(logging.WARNING)
+        monitor.start()
+        inicio = monotonic()
+        with contextlib.redirect_stdout(io.StringIO()):
+            config = Configuracao(
+                smtp=ConfigSmtp(
+                    '127.0.0.1', smtp.server_address[1], '', '', ssl=False, agrupar=args.agrupar),
+                remetente='robo@exemplo.com.br',
+                corpo_html=carregar_corpo_html()
+            )
+            disjuntor = Disjuntor()
+            if args.pipeline:
+                resultados = PipelineSegundaVia(
+                    url=portal.url(),
+                    dir_download=str(diretorio / 'downloads') + os.sep,
+                    janela=JanelaVencimento(vencidas=True),
+                    ritmo=Ritmo(taxa=args.ritmo, capacidade=args.workers),
+                    execucao=iniciar_execucao(),
+                    config=config,
+                    buscas=args.workers,
+                    envios=args.envios,
+                    servidor=True,
+                    disjuntor=disjuntor,
+                    processos=args.processos_pdf,
+                    motor=args.motor
+                ).executar('cadastro.csv')
+            else:
+                caixa_saida = criar_caixa_saida(config, workers=max(2, args.workers))
+                caixa_saida.iniciar()
+                fabrica = partial(
+                    BotAguaSegundaVia,
+                    motor=args.motor,
+                    caixa_saida=caixa_saida,
+                    planilha='cadastro.csv',
+                    janela=JanelaVencimento(vencidas=True),
+                    ritmo=Ritmo(taxa=args.ritmo, capacidade=args.workers),
+                    servidor=True,
+                    config=config,
+                    disjuntor=disjuntor
+                )
+                if args.workers > 1:
+                    PoolNavegadores(
+                        fabrica=fabrica,
+                        workers=args.workers,
+                        dir_base=str(diretorio) + os.sep
+                    ).executar(portal.url(), pegar_cadastro_prestadora('cadastro.csv', usar_cache=True))
+                else:
+                    fabrica(dir_download=str(diretorio / 'downloads') + os.sep).baixar_segunda_via(portal.url())
+                resultados = caixa_saida.aguardar()
+        duracao = monotonic() - inicio
+    finally:
+        monitor.parar()
+        logging.getLogger().setLevel(nivel_log)
+        cronometro.restaurar()
+        __fechar_controle()
+        os.chdir(dir_anterior)
+        portal.shutdown()
+        smtp.shutdown()
+        if not args.manter:
+            shutil.rmtree(diretorio, ignore_errors=True)
+    contas = sum(1 for resultado in resultados if resultado['status'] == 'Concluída com sucesso!')
+    # Todas as contas do portal estão na janela (mês corrente e vencidas), exceto as dos documentos inválidos
+    geradas = sum(
+        len(portal.contas(matricula)) for matricula, documento in cadastro
+        if not portal.documento_invalido(matricula, documento))
+    return {
+        'matriculas': tamanho,
+        'contas_geradas': geradas,
+        'contas_enviadas': contas,
+        'mensagens': len(smtp.mensagens),
+        'duracao_s': round(duracao, 3),
+        'contas_por_minuto': round(contas / duracao * 60, 2) if duracao else 0.0,
+        'matriculas_por_minuto': round(tamanho / duracao * 60, 2) if duracao else 0.0,
+        'etapas': cronometro.resumo(),
+        'pico_rss_mb': round(monitor.pico_rss / 2 ** 20, 1),
+        'pico_rss_python_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'pico_navegadores': monitor.pico_navegadores,
+        'portal': dict(portal.contadores),
+        'conexoes_smtp': smtp.conexoes,
+        'diretorio': str(diretorio) if args.manter else '',
+    }
+
+
+def __enviar_legado(conexao: smtplib.SMTP, anexos: List[str], corpo_html: str) -> None:
+    """ Envio anterior à transmissão em blocos: anexos inteiros em memória e cópia via as_string(). """
+    mensagem = MIMEMultipart()
+    mensagem['From'] = 'robo@exemplo.com.br'
+    mensagem['To'] = 'cliente@exemplo.com.br'
+    mensagem['Subject'] = 'Segundas vias CEDAE'
+    mensagem.attach(MIMEText(_text=corpo_html, _subtype='html', _charset='utf-8'))
+    for anexo in anexos:
+        with open(anexo, 'rb') as arquivo:
+            parte = MIMEBase('application', 'octet-stream')
+            parte.set_payload(arquivo.read())
+            encoders.encode_base64(parte)
+            parte.add_header('Content-Disposition', f'attachment; filename= {os.path.basename(anexo)}')
+            mensagem.attach(parte)
+    conexao.sendmail('robo@exemplo.com.br', ['cliente@exemplo.com.br'], mensagem.as_string())
+
+
+def __enviar_em_blocos(conexao: ConexaoSmtp, anexos: List[str], corpo_html: str) -> None:
+    """ Envio atual: MensagemEmail escrita em blocos direto no socket. """
+    conexao.enviar('robo@exemplo.com.br', ['cliente@exemplo.com.br'], MensagemEmail(
+        de='robo@exemplo.com.br',
+        para=['cliente@exemplo.com.br'],
+        assunto='Segundas vias CEDAE',
+        corpo_html=corpo_html,
+        anexos=anexos
+    ))
+
+
+def comparar_memoria_email(anexos: int, tamanho_kb: int) -> Dict[str, Dict[str, float]]:
+    """
+    Compara o pico de memória (alocações do Python, via tracemalloc) do envio de uma mensagem
+    com N anexos ao SMTP simulado: montagem em memória (legado) x transmissão em blocos.
+    :args
+        {anexos} [int] - Quantidade de anexos da mensagem.
+        {tamanho_kb} [int] - Tamanho de cada anexo, em KB.
+    :returns
+        Dicionário com o pico de memória e a duração de cada modo.
+    """
+    diretorio = Path(tempfile.mkdtemp(prefix='benchmark_email_'))
+    arquivos = list()
+    for i in range(anexos):
+        arquivo = diretorio / f'conta_{i:03d}.pdf'
+        arquivo.write_bytes(os.urandom(tamanho_kb * 1024))
+        arquivos.append(str(arquivo))
+    smtp = ServidorSmtp(('127.0.0.1', 0))
+    smtp.iniciar()
+    corpo_html = (DIR_APLICACAO / 'config' / 'corpo_email.html').read_text(encoding='utf-8')
+    medicoes: Dict[str, Dict[str, float]] = dict()
+    try:
+        modos = (
+            ('legado', partial(smtplib.SMTP, '127.0.0.1', smtp.server_address[1]), __enviar_legado),
+            ('blocos', partial(ConexaoSmtp, '127.0.0.1', smtp.server_address[1], ssl=False),
+             __enviar_em_blocos),
+        )
+        for modo, fabrica, enviar in modos:
+            conexao = fabrica()
+            tracemalloc.start()
+            inicio = monotonic()
+            enviar(conexao, arquivos, corpo_html)
+            duracao = monotonic() - inicio
+            pico = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if isinstance(conexao, smtplib.SMTP):
+                conexao.quit()
+            else:
+                conexao.fechar()
+            medicoes[modo] = {'pico_mb': round(pico / 2 ** 20, 2), 'duracao_s': round(duracao, 3)}
+    finally:
+        smtp.shutdown()
+        shutil.rmtree(diretorio, ignore_errors=True)
+    medicoes['anexos'] = {'quantidade': anexos, 'total_mb': round(anexos * tamanho_kb / 1024, 2)}
+    return medicoes
+
+
+def exibir_memoria_email(medicoes: Dict[str, Dict[str, float]]) -> None:
+    legado, blocos = medicoes['legado'], medicoes['blocos']
+    print(f'\nE-mail com {medicoes["anexos"]["quantidade"]} anexo(s), {medicoes["anexos"]["total_mb"]:.1f} MB: '
+          f'pico de memória {legado["pico_mb"]:.1f} MB (legado) x {blocos["pico_mb"]:.1f} MB (em blocos) | '
+          f'{legado["duracao_s"]:.2f}s x {blocos["duracao_s"]:.2f}s')
+
+
+def exibir_rodada(rodada: Dict) -> None:
+    print(f'\n{rodada["matriculas"]} matrícula(s): {rodada["contas_enviadas"]} de '
+          f'{rodada["contas_geradas"]} conta(s) '
+          f'em {rodada["mensagens"]} mensagem(ns) e '
+          f'{rodada["duracao_s"]:.1f}s => {rodada["contas_por_minuto"]:.1f} contas/min | '
+          f'RSS máx. {rodada["pico_rss_mb"]:.0f} MB | navegadores {rodada["pico_navegadores"]}')
+    for etapa, medidas in sorted(rodada['etapas'].items()):
+        print(f'    {etapa:<15} n={medidas["amostras"]:<6} p50={medidas["p50"] * 1000:8.1f}ms '
+              f'p95={medidas["p95"] * 1000:8.1f}ms')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(usage='python -m simulador.benchmark [args]')
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[10, 100, 1000],
+                        help='Quantidades de matrículas de cada rodada (padrão: 10 100 1000).')
+    parser.add_argument('--motor', choices=('selenium', 'http'), default='selenium')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--ritmo', type=float, default=1000.0,
+                        help='Requisições por segundo ao portal simulado (padrão: 1000).')
+    parser.add_argument('--latencia', type=float, default=0.0)
+    parser.add_argument('--variacao', type=float, default=0.0)
+    parser.add_argument('--taxa_erro', type=float, default=0.0)
+    parser.add_argument('--taxa_queda', type=float, default=0.0)
+    parser.add_argument('--taxa_alerta', type=float, default=0.0)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--agrupar', action='store_true',
+                        help='Uma mensagem por destinatário com todas as suas contas.')
+    parser.add_argument('--clientes', type=int, default=0,
+                        help='Quantidade de destinatários distintos do cadastro (padrão: um por matrícula).')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Executa a emissão em pipeline (busca, renomeação e envio pela caixa de saída em paralelo).')
+    parser.add_argument('--envios', type=int, default=2,
+                        help='Envios de e-mail simultâneos no modo --pipeline (padrão: 2).')
+    parser.add_argument('--processos_pdf', type=int, default=0,
+                        help='Processos que validam os PDFs no modo --pipeline (padrão: 0).')
+    parser.add_argument('--memoria_email', action='store_true',
+                        help='Compara também o pico de memória do envio de uma mensagem com vários anexos.')
+    parser.add_argument('--anexos', type=int, default=30,
+                        help='Anexos da mensagem de --memoria_email (padrão: 30).')
+    parser.add_argument('--tamanho_anexo', type=int, default=300,
+                        help='Tamanho, em KB, de cada anexo de --memoria_email (padrão: 300).')
+    parser.add_argument('--manter', action='store_true',
+                        help='Mantém os diretórios de trabalho das rodadas.')
+    parser.add_argument('--saida', default='',
+                        help='Arquivo JSON dos resultados (padrão: benchmark_<data>.json).')
+    args = parser.parse_args()
+    resultado = {
+        'data': datetime.today().isoformat(sep=' ', timespec='seconds'),
+        'sistema': system(),
+        'python': python_version(),
+        'parametros': vars(args),
+        'rodadas': list(),
+    }
+    # Sem falhas injetadas no portal, todas as contas geradas devem ser enviadas
+    sem_falhas = not (args.taxa_erro or args.taxa_queda)
+    divergentes: List[Dict] = list()
+    for tamanho in args.tamanhos:
+        rodada = executar_rodada(tamanho, args)
+        resultado['rodadas'].append(rodada)
+        exibir_rodada(rodada)
+        if sem_falhas and rodada['contas_enviadas'] != rodada['contas_geradas']:
+            divergentes.append(rodada)
+    if args.memoria_email:
+        resultado['memoria_email'] = comparar_memoria_email(args.anexos, args.tamanho_anexo)
+        exibir_memoria_email(resultado['memoria_email'])
+    saida = args.saida or f'benchmark_{datetime.today().strftime("%Y%m%d_%H%M%S")}.json'
+    with open(saida, 'w', encoding='utf-8') as arq:
+        json.dump(resultado, arq, ensure_ascii=False, indent=2)
+    print(f'\nResultados gravados em {saida}')
+    for rodada in divergentes:
+        print(f'ERRO: {rodada["contas_enviadas"]} conta(s) enviada(s) de {rodada["contas_geradas"]} '
+              f'gerada(s) na rodada de {rodada["matriculas"]} matrícula(s).')
+    if divergentes:
+        sys.exit(1)
@@ -0,0 +1,395 @@
+import base64
+import json
+import socket
+from argparse import ArgumentParser
+from datetime import date
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from threading import Lock, Thread
+from time import sleep
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+CAMINHO_ENTRADA = '/segunda_via_web/pages/SegundaVia/ENTRADA.aspx'
+
+# Função padrão do ASP.NET que submete o formulário com o alvo do evento
+SCRIPT_POSTBACK = '''
+<script type="text/javascript">
+function __doPostBack(alvo, argumento) {
+    var form = document.forms['form1'];
+    form.__EVENTTARGET.value = alvo;
+    form.__EVENTARGUMENT.value = argumento;
+    form.submit();
+}
+function exibirLinks(n) {
+    ['EPortalLinkImp' + n, 'LinkBar' + n].forEach(function (id) {
+        document.getElementById(id).style.display = 'inline';
+    });
+}
+</script>
+'''
+
+
+def modulo10(numero: str) -> int:
+    """ Dígito verificador módulo 10 (FEBRABAN) dos boletos de arrecadação. """
+    soma = 0
+    for i, digito in enumerate(reversed(numero)):
+        produto = int(digito) * (2 if i % 2 == 0 else 1)
+        soma += produto // 10 + produto % 10
+    return (10 - soma % 10) % 10
+
+
+def linha_digitavel(valor: float, sorteio: Random) -> str:
+    """
+    Gera a linha digitável de um boleto de arrecadação (saneamento) com o valor informado.
+    :returns
+        Quatro blocos de 11 dígitos, cada um seguido do seu DV: 'NNNNNNNNNNN-D ...'.
+    """
+    livre = ''.join(str(sorteio.randint(0, 9)) for _ in range(25))
+    sem_dv = '826' + f'{round(valor * 100):011d}' + '0043' + livre
+    barras = sem_dv[:3] + str(modulo10(sem_dv)) + sem_dv[3:]
+    blocos = [barras[i:i + 11] for i in range(0, 44, 11)]
+    return ' '.join(f'{bloco}-{modulo10(bloco)}' for bloco in blocos)
+
+
+def gerar_pdf(linhas: List[str]) -> bytes:
+    """ Gera um PDF mínimo, de uma página, com as linhas de texto informadas. """
+    def literal(texto: str) -> str:
+        return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    conteudo = 'BT /F1 11 Tf 50 780 Td 16 TL ' + \
+        ' '.join(f'({literal(linha)}) Tj T*' for linha in linhas) + ' ET'
+    objetos = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+        '/Resources << /Font << /F1 5 0 R >> >> /Contents 4 0 R >>',
+        f'<< /Length {len(conteudo.encode("latin-1", "replace"))} >>\nstream\n{conteudo}\nendstream',
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+    ]
+    pdf = bytearray(b'%PDF-1.4\n')
+    posicoes: List[int] = list()
+    for i, objeto in enumerate(objetos, start=1):
+        posicoes.append(len(pdf))
+        pdf += f'{i} 0 obj\n{objeto}\nendobj\n'.encode('latin-1', 'replace')
+    inicio_xref = len(pdf)
+    pdf += f'xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n'.encode()
+    for posicao in posicoes:
+        pdf += f'{posicao:010d} 00000 n \n'.encode()
+    pdf += f'trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n'.encode()
+    return bytes(pdf)
+
+
+class ManipuladorPortal(BaseHTTPRequestHandler):
+    """
+    Reproduz o formulário ENTRADA.aspx do portal de segunda via: consulta por matrícula/documento,
+    alerta de documento inválido, tabela de vencimentos paginada e download do PDF por __doPostBack.
+    O estado da consulta (matrícula, documento e página) trafega no __VIEWSTATE, como no ASP.NET.
+    """
+    protocol_version = 'HTTP/1.1'
+    # Cabeçalho e corpo saem em escritas separadas: sem o Nagle, evita o atraso do ACK retardado
+    disable_nagle_algorithm = True
+
+    def log_message(self, formato: str, *args) -> None:
+        if self.server.verboso:
+            super().log_message(formato, *args)
+
+    def __responder(self, conteudo: bytes, tipo: str = 'text/html; charset=utf-8', extras: dict = None) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(conteudo)))
+        for chave, valor in (extras or dict()).items():
+            self.send_header(chave, valor)
+        self.end_headers()
+        self.wfile.write(conteudo)
+
+    def __injetar_falha(self) -> bool:
+        """ Aplica a latência configurada e, se sorteada, uma falha. Retorna True se falhou. """
+        servidor: ServidorPortal = self.server
+        sleep(servidor.sortear_latencia())
+        falha = servidor.sortear_falha()
+        if falha == 'erro':
+            self.send_error(500, 'Erro simulado')
+            return True
+        if falha == 'queda':
+            # Simula a queda da conexão sem resposta
+            self.close_connection = True
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return True
+        return False
+
+    def do_GET(self) -> None:
+        self.server.registrar('requisicoes')
+        if self.__injetar_falha():
+            return
+        if urlsplit(self.path).path != CAMINHO_ENTRADA:
+            self.send_error(404)
+            return
+        self.__responder(self.server.pagina_entrada())
+
+    def do_HEAD(self) -> None:
+        """ Verificação de disponibilidade: os cabeçalhos do GET, sem o corpo. """
+        self.server.registrar('requisicoes')
+        if self.__injetar_falha():
+            return
+        if urlsplit(self.path).path != CAMINHO_ENTRADA:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(self.server.pagina_entrada())))
+        self.end_headers()
+
+    def do_POST(self) -> None:
+        servidor: ServidorPortal = self.server
+        servidor.registrar('requisicoes')
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        campos = {chave: valores[0] for chave, valores in parse_qs(
+            self.rfile.read(tamanho).decode('utf-8'), keep_blank_values=True).items()}
+        if self.__injetar_falha():
+            return
+        evento = campos.get('__EVENTTARGET', '')
+        if 'btncpfvalida' in campos or not evento:
+            matricula = campos.get('MATRICULA', '').strip()
+            documento = campos.get('FC01_CPF', '').strip()
+            if not matricula or servidor.documento_invalido(matricula, documento):
+                servidor.registrar('alertas')
+                self.__responder(servidor.pagina_entrada(
+                    alerta='Documento inválido! Verifique os dados informados.'))
+                return
+            self.__responder(servidor.pagina_resultado(matricula, documento, 1))
+            return
+        try:
+            estado = json.loads(base64.b64decode(campos.get('__VIEWSTATE', '')))
+        except ValueError:
+            self.__responder(servidor.pagina_entrada())
+            return
+        matricula, documento, pagina = estado['m'], estado['d'], estado['p']
+        if evento == 'Proxima1':
+            self.__responder(servidor.pagina_resultado(matricula, documento, pagina + 1))
+            return
+        for prefixo in ('EPortalLinkImp', 'LinkBar'):
+            if evento.startswith(prefixo) and evento[len(prefixo):].isdigit():
+                linha = int(evento[len(prefixo):])
+                if campos.get(f'DRLMOTIVO{linha}', '0') == '0':
+                    self.__responder(servidor.pagina_resultado(
+                        matricula, documento, pagina, alerta='Selecione o motivo da emissão.'))
+                    return
+                pdf = servidor.pdf_conta(matricula, pagina, linha)
+                if pdf is None:
+                    self.send_error(404, 'Conta não encontrada')
+                    return
+                servidor.registrar('pdfs')
+                self.__responder(pdf, tipo='application/pdf', extras={
+                    'Content-Disposition': f'attachment; filename="segunda_via_{linha}.pdf"'})
+                return
+        self.__responder(servidor.pagina_resultado(matricula, documento, pagina))
+
+
+class ServidorPortal(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        endereco: Tuple[str, int],
+        latencia: float = 0.0,
+        variacao: float = 0.0,
+        taxa_erro: float = 0.0,
+        taxa_queda: float = 0.0,
+        taxa_alerta: float = 0.0,
+        max_contas: int = 3,
+        por_pagina: int = 2,
+        semente: int = 0,
+        verboso: bool = False
+    ) -> None:
+        """
+        Portal de segunda via simulado, para testes de ponta a ponta e benchmarks sem o site real.
+        As contas de cada matrícula são geradas de forma determinística a partir da semente.
+        O documento 'INVALIDO' sempre gera o alerta de documento inválido.
+        :args
+            {endereco} [tuple] - (host, porta). Porta 0 escolhe uma porta livre.
+            {latencia} [float] - Latência média de cada resposta em segundos (padrão: 0).
+            {variacao} [float] - Variação máxima, para mais ou para menos, da latência (padrão: 0).
+            {taxa_erro} [float] - Fração das requisições respondidas com HTTP 500 (padrão: 0).
+            {taxa_queda} [float] - Fração das requisições com a conexão derrubada (padrão: 0).
+            {taxa_alerta} [float] - Fração das matrículas com documento inválido (padrão: 0).
+            {max_contas} [int] - Quantidade máxima de contas por matrícula (padrão: 3).
+            {por_pagina} [int] - Contas por página da tabela de vencimentos (padrão: 2).
+            {semente} [int] - Semente da geração das contas e do sorteio das falhas (padrão: 0).
+            {verboso} [bool] - Se exibe o log das requisições (padrão: False).
+        :methods
+            iniciar()
+            url()
+        """
+        super().__init__(endereco, ManipuladorPortal)
+        self.latencia: float = latencia
+        self.variacao: float = variacao
+        self.taxa_erro: float = taxa_erro
+        self.taxa_queda: float = taxa_queda
+        self.taxa_alerta: float = taxa_alerta
+        self.max_contas: int = max(0, max_contas)
+        self.por_pagina: int = max(1, por_pagina)
+        self.semente: int = semente
+        self.verboso: bool = verboso
+        self.contadores: Dict[str, int] = {
+            'requisicoes': 0, 'alertas': 0, 'pdfs': 0, 'erros': 0, 'quedas': 0}
+        self.__sorteio = Random(semente)
+        self.__trava = Lock()
+
+    def url(self) -> str:
+        """ Endereço da página ENTRADA.aspx do simulador. """
+        host, porta = self.server_address[:2]
+        return f'http://{host}:{porta}{CAMINHO_ENTRADA}'
+
+    def registrar(self, contador: str) -> None:
+        with self.__trava:
+            self.contadores[contador] += 1
+
+    def sortear_latencia(self) -> float:
+        with self.__trava:
+            return max(0.0, self.latencia + self.__sorteio.uniform(-self.variacao, self.variacao))
+
+    def sortear_falha(self) -> str:
+        """ Sorteia a falha da requisição: 'erro', 'queda' ou '' (sem falha). """
+        with self.__trava:
+            sorteado = self.__sorteio.random()
+        if sorteado < self.taxa_erro:
+            self.registrar('erros')
+            return 'erro'
+        if sorteado < self.taxa_erro + self.taxa_queda:
+            self.registrar('quedas')
+            return 'queda'
+        return ''
+
+    def documento_invalido(self, matricula: str, documento: str) -> bool:
+        if documento.upper() == 'INVALIDO':
+            return True
+        return Random(f'{self.semente}:alerta:{matricula}').random() < self.taxa_alerta
+
+    def contas(self, matricula: str) -> List[Tuple[date, float, str]]:
+        """
+        Contas da matrícula, da mais recente para a mais antiga, a partir do mês corrente.
+        :returns
+            Lista de tuplas (vencimento, valor, linha digitável).
+        """
+        sorteio = Random(f'{self.semente}:{matricula}')
+        hoje = date.today()
+        dia = sorteio.randint(5, 25)
+        contas: List[Tuple[date, float, str]] = list()
+        for i in range(sorteio.randint(0, self.max_contas)):
+            meses = hoje.year * 12 + hoje.month - 1 - i
+            valor = round(sorteio.uniform(40, 600), 2)
+            contas.append((date(meses // 12, meses % 12 + 1, dia), valor,
+                           linha_digitavel(valor, sorteio)))
+        return contas
+
+    def pdf_conta(self, matricula: str, pagina: int, linha: int) -> bytes:
+        """ PDF da conta exibida na linha da página da tabela de vencimentos, ou None. """
+        deslocamento = 1 if pagina > 1 else 0
+        indice = (pagina - 1) * self.por_pagina + linha - 1 - deslocamento
+        contas = self.contas(matricula)
+        if not 0 <= linha - 1 - deslocamento < self.por_pagina or not 0 <= indice < len(contas):
+            return None
+        vencimento, valor, linha_boleto = contas[indice]
+        return gerar_pdf([
+            'CEDAE - Companhia Estadual de Águas e Esgotos',
+            'Segunda via de conta',
+            f'Matrícula: {matricula}',
+            f'Vencimento: {vencimento.strftime("%d/%m/%Y")}',
+            'Valor a pagar: R$ ' + f'{valor:,.2f}'.translate(str.maketrans(',.', '.,')),
+            f'Linha digitável: {linha_boleto}',
+        ])
+
+    def __formulario(self, corpo: str, estado: dict = None, alerta: str = '') -> bytes:
+        viewstate = base64.b64encode(json.dumps(estado or dict()).encode()).decode()
+        script_alerta = '<script type="text/javascript">alert(\'' + alerta.replace("'", "\\'") + \
+            '\');</script>' if alerta else ''
+        return f'''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Segunda Via</title>{SCRIPT_POSTBACK}</head>
+<body>
+<form name="form1" id="form1" method="post" action="ENTRADA.aspx">
+<input type="hidden" name="__EVENTTARGET" id="__EVENTTARGET" value="">
+<input type="hidden" name="__EVENTARGUMENT" id="__EVENTARGUMENT" value="">
+<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{viewstate}">
+{corpo}
+</form>
+{script_alerta}
+</body></html>'''.encode('utf-8')
+
+    def pagina_entrada(self, alerta: str = '') -> bytes:
+        return self.__formulario('''
+<label>Matrícula <input type="text" name="MATRICULA" id="MATRICULA"></label>
+<label>CPF/CNPJ <input type="text" name="FC01_CPF" id="FC01_CPF"></label>
+<input type="submit" name="btncpfvalida" id="btncpfvalida" value="Solicitar">
+''', alerta=alerta)
+
+    def pagina_resultado(self, matricula: str, documento: str, pagina: int, alerta: str = '') -> bytes:
+        contas = self.contas(matricula)
+        inicio = (pagina - 1) * self.por_pagina
+        deslocamento = 1 if pagina > 1 else 0
+        linhas: List[str] = ['<tr><th class="colVenc">Vencimento</th><th>Motivo</th><th>Documento</th></tr>']
+        if deslocamento:
+            linhas.append('<tr id="linha_continuacao"><td colspan="3">Continuação...</td></tr>')
+        for i, (vencimento, valor, _) in enumerate(contas[inicio:inicio + self.por_pagina], start=1):
+            n = i + deslocamento
+            linhas.append(f'''<tr>
+<td class="colVenc">{vencimento.strftime("%d/%m/%y")}</td>
+<td><select name="DRLMOTIVO{n}" id="DRLMOTIVO{n}" onchange="exibirLinks({n})">
+<option value="0">Selecione</option><option value="1">Perda da conta</option><option value="2">Não recebimento</option>
+</select></td>
+<td><a id="EPortalLinkImp{n}" href="javascript:__doPostBack('EPortalLinkImp{n}','')" style="display:none">Imprimir</a>
+<a id="LinkBar{n}" href="javascript:__doPostBack('LinkBar{n}','')" style="display:none">Código de barras</a></td>
+</tr>''')
+        proxima = '<a id="Proxima1" href="javascript:__doPostBack(\'Proxima1\',\'\')">Próxima</a>' \
+            if inicio + self.por_pagina < len(contas) else ''
+        corpo = f'<p>Matrícula {escape(matricula)}</p><table>{"".join(linhas)}</table>{proxima}'
+        return self.__formulario(
+            corpo, estado={'m': matricula, 'd': documento, 'p': pagina}, alerta=alerta)
+
+    def iniciar(self) -> Thread:
+        """ Inicia o servidor em uma thread de segundo plano e a retorna. """
+        thread = Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(usage='python -m simulador.portal [args]')
+    parser.add_argument('--porta', type=int, default=8080)
+    parser.add_argument('--latencia', type=float, default=0.0,
+                        help='Latência média de cada resposta em segundos.')
+    parser.add_argument('--variacao', type=float, default=0.0,
+                        help='Variação máxima da latência em segundos.')
+    parser.add_argument('--taxa_erro', type=float, default=0.0,
+                        help='Fração das requisições respondidas com HTTP 500.')
+    parser.add_argument('--taxa_queda', type=float, default=0.0,
+                        help='Fração das requisições com a conexão derrubada.')
+    parser.add_argument('--taxa_alerta', type=float, default=0.0,
+                        help='Fração das matrículas com documento inválido.')
+    parser.add_argument('--max_contas', type=int, default=3)
+    parser.add_argument('--por_pagina', type=int, default=2)
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--verboso', action='store_true')
+    args = parser.parse_args()
+    servidor = ServidorPortal(
+        ('127.0.0.1', args.porta),
+        latencia=args.latencia,
+        variacao=args.variacao,
+        taxa_erro=args.taxa_erro,
+        taxa_queda=args.taxa_queda,
+        taxa_alerta=args.taxa_alerta,
+        max_contas=args.max_contas,
+        por_pagina=args.por_pagina,
+        semente=args.semente,
+        verboso=args.verboso
+    )
+    print(f'Portal simulado em {servidor.url()} (CTRL + C para sair)')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(', '.join(f'{chave}: {valor}' for chave, valor in servidor.contadores.items()))
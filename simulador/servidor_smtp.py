@@ -0,0 +1,120 @@
+import socketserver
+from argparse import ArgumentParser
+from threading import Lock, Thread
+from typing import List, Tuple
+
+
+class ManipuladorSmtp(socketserver.StreamRequestHandler):
+    """
+    Atende uma conexão SMTP com o mínimo do protocolo (EHLO, AUTH, MAIL, RCPT, DATA, QUIT).
+    As mensagens recebidas ficam em memória no servidor (ServidorSmtp.mensagens).
+    """
+
+    def responder(self, linha: str) -> None:
+        self.wfile.write((linha + '\r\n').encode('utf-8'))
+
+    def handle(self) -> None:
+        servidor: ServidorSmtp = self.server
+        remetente: str = ''
+        destinatarios: List[str] = list()
+        recebidas: int = 0
+        servidor.registrar_conexao()
+        self.responder('220 simulador SMTP pronto')
+        while True:
+            linha = self.rfile.readline()
+            if not linha:
+                return
+            comando = linha.decode('utf-8', 'replace').strip()
+            verbo = comando.split(' ')[0].upper()
+            if verbo in ('EHLO', 'HELO'):
+                self.wfile.write(
+                    b'250-simulador\r\n250-AUTH PLAIN LOGIN\r\n250 SIZE 52428800\r\n')
+            elif verbo == 'AUTH':
+                if comando.upper().startswith('AUTH LOGIN'):
+                    self.responder('334 VXNlcm5hbWU6')
+                    self.rfile.readline()
+                    self.responder('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                servidor.registrar_login()
+                self.responder('235 autenticado')
+            elif verbo == 'MAIL':
+                remetente = comando[10:].strip('<> ')
+                destinatarios = list()
+                self.responder('250 OK')
+            elif verbo == 'RCPT':
+                destinatarios.append(comando[8:].strip('<> '))
+                self.responder('250 OK')
+            elif verbo == 'DATA':
+                self.responder('354 fim com <CRLF>.<CRLF>')
+                tamanho = 0
+                while True:
+                    dado = self.rfile.readline()
+                    if not dado or dado == b'.\r\n':
+                        break
+                    tamanho += len(dado)
+                servidor.registrar_mensagem(remetente, destinatarios, tamanho)
+                recebidas += 1
+                self.responder('250 mensagem aceita')
+                if servidor.queda_a_cada and recebidas >= servidor.queda_a_cada:
+                    # Simula o servidor derrubando a conexão
+                    return
+            elif verbo in ('RSET', 'NOOP'):
+                self.responder('250 OK')
+            elif verbo == 'QUIT':
+                self.responder('221 tchau')
+                return
+            else:
+                self.responder('502 comando não implementado')
+
+
+class ServidorSmtp(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, endereco: Tuple[str, int], queda_a_cada: int = 0) -> None:
+        """
+        Servidor SMTP local (sem SSL) para testes e benchmarks do envio de e-mails.
+        :args
+            {endereco} [tuple] - (host, porta). Porta 0 escolhe uma porta livre.
+            {queda_a_cada} [int] - Derruba a conexão após N mensagens (0 = nunca).
+        :methods
+            iniciar()
+        """
+        super().__init__(endereco, ManipuladorSmtp)
+        self.queda_a_cada: int = queda_a_cada
+        self.mensagens: List[Tuple[str, List[str], int]] = list()
+        self.conexoes: int = 0
+        self.logins: int = 0
+        self.__trava = Lock()
+
+    def registrar_conexao(self) -> None:
+        with self.__trava:
+            self.conexoes += 1
+
+    def registrar_login(self) -> None:
+        with self.__trava:
+            self.logins += 1
+
+    def registrar_mensagem(self, remetente: str, destinatarios: List[str], tamanho: int) -> None:
+        with self.__trava:
+            self.mensagens.append((remetente, destinatarios, tamanho))
+
+    def iniciar(self) -> Thread:
+        """ Inicia o servidor em uma thread de segundo plano e a retorna. """
+        thread = Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(usage='python -m simulador.servidor_smtp [args]')
+    parser.add_argument('--porta', type=int, default=8025)
+    parser.add_argument('--queda_a_cada', type=int, default=0,
+                        help='Derruba a conexão após N mensagens (0 = nunca).')
+    args = parser.parse_args()
+    servidor = ServidorSmtp(('127.0.0.1', args.porta), args.queda_a_cada)
+    print(f'Servidor SMTP simulado em 127.0.0.1:{args.porta} (CTRL + C para sair)')
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        print(f'{len(servidor.mensagens)} mensagem(ns) em {servidor.conexoes} conexão(ões).')
@@ -0,0 +1,31 @@
+import pytest
+
+from lib.log import configurar_log, encerrar_log
+from simulador.portal import ServidorPortal
+
+
+@pytest.fixture(scope='session', autouse=True)
+def log_temporario(tmp_path_factory):
+    """ Grava o log dos testes em um diretório temporário, e não em log/ do projeto. """
+    configurar_log(diretorio=str(tmp_path_factory.mktemp('log')))
+    yield
+    encerrar_log()
+
+
+@pytest.fixture(scope='module')
+def portal():
+    """ Portal simulado, sem latência nem falhas, com até 5 contas por matrícula (2 por página). """
+    servidor = ServidorPortal(('127.0.0.1', 0), max_contas=5, por_pagina=2)
+    servidor.iniciar()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def matricula_com_contas(portal: ServidorPortal, minimo: int) -> str:
+    """ Primeira matrícula fictícia com ao menos {minimo} contas no portal simulado. """
+    for i in range(1, 1000):
+        matricula = f'{100000 + i}-{i % 10}'
+        if len(portal.contas(matricula)) >= minimo:
+            return matricula
+    raise LookupError(f'Nenhuma matrícula com {minimo} contas.')
@@ -0,0 +1,17 @@
+from lib.elemento_web import ArquivoDownload
+
+
+def test_temporario_anterior_ao_clique_nao_bloqueia_o_download(tmp_path):
+    (tmp_path / 'antigo.pdf.crdownload').write_bytes(b'resto')
+    download = ArquivoDownload(str(tmp_path), timeout=2, intervalo=0.01)
+    download.marcar()
+    (tmp_path / 'conta.pdf').write_bytes(b'%PDF-1.4')
+    assert download.arquivo() == str(tmp_path / 'conta.pdf')
+
+
+def test_temporario_novo_aguarda_o_fim_do_download(tmp_path):
+    download = ArquivoDownload(str(tmp_path), timeout=0.3, intervalo=0.01)
+    download.marcar()
+    (tmp_path / 'conta.pdf').write_bytes(b'%PDF-1.4')
+    (tmp_path / 'outra.pdf.crdownload').write_bytes(b'%PDF')
+    assert download.arquivo() == ''
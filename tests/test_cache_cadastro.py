@@ -0,0 +1,33 @@
+import os
+import pickle
+
+from lib.cache_cadastro import CacheCadastro
+from lib.mineracao import Cadastro
+
+CADASTRO = '''Cliente;Matrícula;Documento;E-mail
+Fulano;100001-1;123.456.789-00;fulano@teste.com
+Beltrano;100002-2;987.654.321-00;beltrano@teste.com
+Incompleto;100003-3;;
+'''
+
+
+def test_snapshot_do_arquivo_inalterado_e_alterado(tmp_path):
+    arquivo = tmp_path / 'cadastro.csv'
+    arquivo.write_text(CADASTRO, encoding='utf-8')
+    cache = CacheCadastro(str(arquivo), tmp_path)
+    esperado = [
+        Cadastro('Fulano', '100001-1', '123.456.789-00', 'fulano@teste.com'),
+        Cadastro('Beltrano', '100002-2', '987.654.321-00', 'beltrano@teste.com'),
+    ]
+    assert cache.carregar() == esperado
+
+    # O snapshot guarda apenas o cadastro convertido, sem as linhas brutas
+    estado = arquivo.stat()
+    with open(cache.snapshot, 'rb') as arq:
+        conteudo = pickle.load(arq)
+    assert set(conteudo) == {'versao', 'mtime', 'tamanho', 'hash', 'cadastro'}
+    assert CacheCadastro(str(arquivo), tmp_path).carregar() == esperado
+
+    arquivo.write_text(CADASTRO.replace('Beltrano;', 'Sicrano;'), encoding='utf-8')
+    os.utime(arquivo, (estado.st_atime, estado.st_mtime + 10))
+    assert [registro.cliente for registro in cache.carregar()] == ['Fulano', 'Sicrano']
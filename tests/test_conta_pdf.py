@@ -0,0 +1,80 @@
+from random import Random
+
+import pytest
+
+from lib.conta_pdf import ContaInvalida, validar_conta
+from simulador.portal import gerar_pdf, linha_digitavel
+
+MATRICULA = '100001-1'
+VENCIMENTO = '15/10/26'
+
+
+def linhas_conta(linha: str = None, valor: str = '1.234,56') -> list:
+    return [
+        'CEDAE - Companhia Estadual de Águas e Esgotos',
+        f'Matrícula: {MATRICULA}',
+        'Vencimento: 15/10/2026',
+        f'Valor a pagar: R$ {valor}',
+        f'Linha digitável: {linha or linha_digitavel(1234.56, Random(1))}',
+    ]
+
+
+@pytest.fixture
+def conta(tmp_path):
+    arquivo = tmp_path / 'conta.pdf'
+    arquivo.write_bytes(gerar_pdf(linhas_conta()))
+    return arquivo
+
+
+def test_aceita_pdf_valido(conta):
+    dados = validar_conta(str(conta), MATRICULA, VENCIMENTO)
+    assert dados.matricula == MATRICULA
+    assert dados.vencimento.strftime('%d/%m/%y') == VENCIMENTO
+    assert str(dados.valor) == '1234.56'
+    assert len(dados.linha_digitavel) == 48
+
+
+def test_rejeita_pdf_truncado(conta):
+    conteudo = conta.read_bytes()
+    conta.write_bytes(conteudo[:len(conteudo) // 2])
+    with pytest.raises(ContaInvalida, match='incompleto'):
+        validar_conta(str(conta), MATRICULA, VENCIMENTO)
+
+
+def test_rejeita_arquivo_que_nao_e_pdf(tmp_path):
+    arquivo = tmp_path / 'conta.pdf'
+    arquivo.write_bytes(b'<html>Erro</html>')
+    with pytest.raises(ContaInvalida, match='não é um PDF'):
+        validar_conta(str(arquivo), MATRICULA, VENCIMENTO)
+
+
+def test_rejeita_outra_matricula(conta):
+    with pytest.raises(ContaInvalida, match='matrícula'):
+        validar_conta(str(conta), '100002-2', VENCIMENTO)
+
+
+def test_rejeita_outro_vencimento(conta):
+    with pytest.raises(ContaInvalida, match='vence'):
+        validar_conta(str(conta), MATRICULA, '15/11/26')
+
+
+def test_rejeita_digito_verificador_invalido(tmp_path):
+    linha = linha_digitavel(1234.56, Random(1))
+    adulterada = linha[:5] + str((int(linha[5]) + 1) % 10) + linha[6:]
+    arquivo = tmp_path / 'conta.pdf'
+    arquivo.write_bytes(gerar_pdf(linhas_conta(linha=adulterada)))
+    with pytest.raises(ContaInvalida, match='Dígito verificador'):
+        validar_conta(str(arquivo), MATRICULA, VENCIMENTO)
+
+
+def test_rejeita_valor_diferente_da_linha_digitavel(tmp_path):
+    arquivo = tmp_path / 'conta.pdf'
+    arquivo.write_bytes(gerar_pdf(linhas_conta(valor='1.234,57')))
+    with pytest.raises(ContaInvalida, match='Valor'):
+        validar_conta(str(arquivo), MATRICULA, VENCIMENTO)
+
+
+def test_pdf_sem_texto_nao_impede_envio(tmp_path):
+    arquivo = tmp_path / 'conta.pdf'
+    arquivo.write_bytes(gerar_pdf([]))
+    assert validar_conta(str(arquivo), MATRICULA, VENCIMENTO) == (None, None, None, None)
@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+
+import controle.diario_execucao as diario_execucao
+from controle.diario_execucao import (ETAPA_BAIXADA, ETAPA_CONCLUIDA,
+                                      ETAPA_ENFILEIRADA, ETAPA_RENOMEADA)
+from lib.emissao import ContaBaixada, ControleEmissao, assunto_conta
+from lib.espera import Disjuntor, Ritmo
+from lib.mineracao import Cadastro
+from lib.segunda_via_http import SegundaViaHttp
+from lib.vencimento import JanelaVencimento
+from simulador.portal import gerar_pdf, linha_digitavel
+from tests.conftest import matricula_com_contas
+
+CADASTRO = Cadastro('Fulano', '100001-1', '123.456.789-00', 'fulano@exemplo.com.br')
+VENCIMENTO = '15/10/26'
+
+
+class CaixaMemoria:
+    """ Caixa de saída que só guarda as tarefas recebidas. """
+
+    def __init__(self):
+        self.tarefas = list()
+
+    def adicionar(self, **tarefa):
+        self.tarefas.append(tarefa)
+        return True
+
+
+def baixar(diretorio, nome='segunda_via.pdf') -> ContaBaixada:
+    arquivo = diretorio / nome
+    arquivo.write_bytes(gerar_pdf([
+        f'Matrícula: {CADASTRO.matricula}',
+        'Vencimento: 15/10/2026',
+        'Valor a pagar: R$ 1.234,56',
+        f'Linha digitável: {linha_digitavel(1234.56, Random(1))}',
+    ]))
+    return ContaBaixada(CADASTRO, VENCIMENTO, str(arquivo))
+
+
+def controle(diretorio, execucao: str = None) -> ControleEmissao:
+    # Sem execução, nada é gravado no diário
+    return ControleEmissao(
+        str(diretorio) + '/', JanelaVencimento(vencidas=True), 'robo@exemplo.com.br', execucao)
+
+
+def test_entregar_renomeia_valida_e_enfileira(tmp_path):
+    emissao, caixa = controle(tmp_path), CaixaMemoria()
+    assert emissao.entregar(baixar(tmp_path), caixa)
+    tarefa, = caixa.tarefas
+    assert tarefa['assunto'] == assunto_conta(CADASTRO)
+    assert tarefa['anexo'] == str(tmp_path / 'Fulano-1000011-15-10-26.pdf')
+    assert tarefa['valor'] == '1234.56'
+    assert emissao.processada(CADASTRO.matricula, VENCIMENTO)
+
+
+def test_pdf_identico_a_um_ja_enfileirado_e_descartado(tmp_path):
+    emissao, caixa = controle(tmp_path), CaixaMemoria()
+    assert emissao.entregar(baixar(tmp_path), caixa)
+    assert not emissao.entregar(baixar(tmp_path, 'outra.pdf'), caixa)
+    assert len(caixa.tarefas) == 1
+    assert emissao.resultados[-1]['status'] == 'Conta já enviada anteriormente.'
+
+
+def test_falha_na_caixa_de_saida_nao_e_falha_do_pdf(tmp_path):
+    emissao, caixa = controle(tmp_path), CaixaMemoria()
+    caixa.adicionar = lambda **tarefa: False
+    assert not emissao.entregar(baixar(tmp_path), caixa)
+    assert emissao.resultados[-1]['status'] == 'FALHA! Conta não enfileirada.'
+    assert not emissao.processada(CADASTRO.matricula, VENCIMENTO)
+
+
+def test_download_nao_concluido_registra_falha(tmp_path):
+    emissao = controle(tmp_path)
+    assert emissao.preparar(ContaBaixada(CADASTRO, VENCIMENTO, '')) is None
+    assert emissao.resultados[-1]['status'] == 'FALHA! Arquivo PDF não gerado.'
+
+
+def test_retomar_reaproveita_pdf_baixado_e_nao_o_baixa_de_novo(tmp_path):
+    emissao = controle(tmp_path)
+    conta = baixar(tmp_path)
+    etapas = {
+        VENCIMENTO: (ETAPA_RENOMEADA, conta.arquivo),
+        '15/11/26': (ETAPA_ENFILEIRADA, ''),
+        '15/12/26': (ETAPA_RENOMEADA, str(tmp_path / 'apagado.pdf')),
+    }
+    assert emissao.retomar(CADASTRO, etapas) == [conta]
+    assert emissao.processada(CADASTRO.matricula, VENCIMENTO)
+    assert emissao.processada(CADASTRO.matricula, '15/11/26')
+    assert not emissao.processada(CADASTRO.matricula, '15/12/26')
+
+
+def test_retomada_apos_queda_entre_o_download_e_a_renomeacao(portal, tmp_path, monkeypatch):
+    monkeypatch.setattr(diario_execucao, 'ARQUIVO_DB', tmp_path / 'diario.db')
+    cadastro = CADASTRO._replace(matricula=matricula_com_contas(portal, 3), documento='12345678900')
+
+    def baixar_e_cair():
+        # Como no pipeline: as contas seguem para a fila e a execução cai antes de renomeá-las
+        execucao = diario_execucao.iniciar_execucao()
+        baixadas = list()
+        controle(tmp_path, execucao).buscar_http(
+            SegundaViaHttp(portal.url()), cadastro, Ritmo(taxa=1000), Disjuntor(),
+            ao_baixar=baixadas.append, concluir=False)
+        etapas = diario_execucao.retornar_etapas(execucao)[cadastro.matricula]
+        diario_execucao.fechar_conexao()
+        return baixadas, etapas
+
+    with ThreadPoolExecutor(1) as executor:
+        baixadas, etapas = executor.submit(baixar_e_cair).result()
+    assert len(baixadas) == len(portal.contas(cadastro.matricula))
+    assert etapas[''][0] != ETAPA_CONCLUIDA
+    assert all(etapas[conta.vencimento] == (ETAPA_BAIXADA, conta.arquivo) for conta in baixadas)
+    emissao, caixa = controle(tmp_path), CaixaMemoria()
+    assert set(emissao.retomar(cadastro, etapas)) == set(baixadas)
+    assert all(emissao.entregar(conta, caixa) for conta in baixadas)
+    assert len(caixa.tarefas) == len(baixadas)
@@ -0,0 +1,62 @@
+import re
+from email import message_from_bytes
+from email.policy import default
+
+import pytest
+
+from lib.envio_email import ConexaoSmtp, MensagemEmail
+from simulador.servidor_smtp import ServidorSmtp
+
+
+@pytest.fixture
+def anexos(tmp_path):
+    caminhos = list()
+    for i, tamanho in enumerate((0, 57, 1000, 200 * 1024 + 13)):
+        caminho = tmp_path / f'conta {i}.pdf'
+        caminho.write_bytes(bytes(range(256)) * (tamanho // 256) + b'.' * (tamanho % 256))
+        caminhos.append(str(caminho))
+    return caminhos
+
+
+def ler_mensagem(dados: bytes):
+    """ Desfaz a transparência do DATA e interpreta a mensagem MIME. """
+    return message_from_bytes(re.sub(rb'(?m)^\.\.', b'.', dados), policy=default)
+
+
+@pytest.mark.parametrize('bloco', [57, 1000, 57 * 1024])
+def test_anexos_transmitidos_em_blocos_sao_identicos(anexos, bloco):
+    mensagem = MensagemEmail(
+        'bot@teste.com', ['a@teste.com', 'b@teste.com'], 'Conta água', '<p>Olá</p>', anexos, bloco)
+    recebida = ler_mensagem(mensagem.como_bytes())
+    assert recebida['Subject'] == 'Conta água'
+    assert recebida['To'] == 'a@teste.com, b@teste.com'
+    assert recebida.get_body(('html',)).get_content().strip() == '<p>Olá</p>'
+    partes = list(recebida.iter_attachments())
+    assert [parte.get_filename() for parte in partes] == [f'conta_{i}.pdf' for i in range(4)]
+    for parte, anexo in zip(partes, anexos):
+        with open(anexo, 'rb') as arquivo:
+            assert parte.get_content() == arquivo.read()
+
+
+def test_mensagem_nao_encerra_o_data_antes_do_fim():
+    mensagem = MensagemEmail('bot@teste.com', ['a@teste.com'], 'Conta', '.\n.linha\nfim')
+    dados = mensagem.como_bytes()
+    assert b'\r\n.\r\n' not in dados
+    assert re.search(rb'(?<!\r)\n', dados) is None
+
+
+def test_conexao_envia_mensagem_em_blocos_e_reconecta(anexos):
+    servidor = ServidorSmtp(('127.0.0.1', 0), queda_a_cada=1)
+    servidor.iniciar()
+    try:
+        conexao = ConexaoSmtp('127.0.0.1', servidor.server_address[1], ssl=False, timeout=5)
+        mensagem = MensagemEmail('bot@teste.com', ['a@teste.com'], 'Conta', '<p>Olá</p>', anexos)
+        assert conexao.enviar('bot@teste.com', ['a@teste.com'], mensagem)
+        assert conexao.enviar('bot@teste.com', ['a@teste.com'], mensagem)
+        conexao.fechar()
+        assert servidor.conexoes == 2
+        assert [(de, para) for de, para, _ in servidor.mensagens] == [('bot@teste.com', ['a@teste.com'])] * 2
+        assert servidor.mensagens[0][2] > sum(len(open(anexo, 'rb').read()) for anexo in anexos)
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
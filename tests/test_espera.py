@@ -0,0 +1,47 @@
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+import lib.espera as espera
+from lib.espera import EstatisticaEspera
+
+
+@pytest.fixture
+def estatistica(tmp_path):
+    estatistica = EstatisticaEspera(arquivo=tmp_path / 'latencias.json', minimo=0.1, maximo=20)
+    for _ in range(20):
+        estatistica.registrar('colVenc', 0.5)
+    return estatistica
+
+
+def test_timeout_aprendido_das_latencias(estatistica):
+    assert estatistica.timeout('colVenc') == 1.0
+    assert estatistica.timeout('outro') == 20
+
+
+def test_timeouts_seguidos_aumentam_a_espera_ate_o_maximo(estatistica):
+    tempos = list()
+    for _ in range(6):
+        estatistica.registrar_timeout('colVenc', estatistica.timeout('colVenc'))
+        tempos.append(estatistica.timeout('colVenc'))
+    assert tempos == sorted(tempos)
+    assert tempos[0] > 1.0
+    assert tempos[-1] == 20
+
+
+def test_timeouts_persistem_como_amostras(estatistica, tmp_path):
+    for _ in range(5):
+        estatistica.registrar_timeout('colVenc', 8.0)
+    estatistica.registrar('colVenc', 0.5)
+    # O sucesso zera as expirações seguidas, mas as amostras expiradas mantêm o percentil alto
+    assert estatistica.timeout('colVenc') == 16.0
+    estatistica.salvar()
+    assert EstatisticaEspera(arquivo=tmp_path / 'latencias.json', minimo=0.1).timeout('colVenc') == 16.0
+
+
+def test_esperar_registra_a_expiracao(estatistica, monkeypatch):
+    monkeypatch.setattr(espera, 'ESTATISTICA_ESPERA', estatistica)
+    with pytest.raises(TimeoutException):
+        espera.esperar(object(), lambda driver: False, chave='colVenc', timeout=0.2)
+    assert estatistica.timeout('colVenc') == 2.0
+    assert espera.esperar(object(), lambda driver: 'ok', chave='colVenc') == 'ok'
+    assert estatistica.timeout('colVenc') == 1.0
@@ -0,0 +1,52 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import controle.matricula_processada as matricula_processada
+
+CONTROLE = '''processada:
+- matricula: 100001-1
+  cliente: Fulano
+  documento: 123.456.789-00
+  execucao: 2026-09-10 08:00:00
+- matricula: 100002-2
+  cliente: Beltrano
+  documento: 987.654.321-00
+  execucao: 2026-09-10 08:05:00
+'''
+
+
+def em_nova_thread(funcao, *args):
+    """ Executa em outra thread, com uma conexão nova ao banco (as conexões são por thread). """
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(funcao, *args).result()
+
+
+def test_importar_yaml_duas_vezes_nao_duplica(tmp_path, monkeypatch):
+    monkeypatch.setattr(matricula_processada, 'ARQUIVO_DB', tmp_path / 'controle.db')
+    arquivo = tmp_path / 'controle.yaml'
+    arquivo.write_text(CONTROLE)
+
+    def importar_duas_vezes():
+        return matricula_processada.importar_yaml(arquivo), matricula_processada.importar_yaml(arquivo)
+
+    assert em_nova_thread(importar_duas_vezes) == (2, 0)
+    with sqlite3.connect(tmp_path / 'controle.db') as conexao:
+        assert conexao.execute('SELECT COUNT(*) FROM processada').fetchone() == (2,)
+
+
+def test_duplicatas_de_importacoes_anteriores_sao_removidas(tmp_path, monkeypatch):
+    banco = tmp_path / 'controle.db'
+    monkeypatch.setattr(matricula_processada, 'ARQUIVO_DB', banco)
+    with sqlite3.connect(banco) as conexao:
+        conexao.execute(
+            '''CREATE TABLE processada (id INTEGER PRIMARY KEY, matricula TEXT NOT NULL,
+            competencia TEXT NOT NULL, cliente TEXT, documento TEXT, execucao TEXT NOT NULL)''')
+        conexao.executemany(
+            'INSERT INTO processada (matricula, competencia, execucao) VALUES (?, ?, ?)',
+            [('100001-1', '2026-09', '2026-09-10 08:00:00')] * 3 + [('100002-2', '2026-09', '2026-09-10 08:05:00')])
+    arquivo = tmp_path / 'controle.yaml'
+    arquivo.write_text(CONTROLE)
+
+    assert em_nova_thread(matricula_processada.importar_yaml, arquivo) == 0
+    with sqlite3.connect(banco) as conexao:
+        assert conexao.execute('SELECT COUNT(*) FROM processada').fetchone() == (2,)
@@ -0,0 +1,59 @@
+from lib.conta_pdf import validar_conta
+from lib.segunda_via_http import SegundaViaHttp
+from tests.conftest import matricula_com_contas
+
+
+def test_consultar_documento_invalido_emite_alerta(portal):
+    pagina = SegundaViaHttp(portal.url()).consultar('100001-1', 'INVALIDO')
+    assert 'Documento inválido' in pagina.alerta
+    assert SegundaViaHttp.vencimentos(pagina) == []
+
+
+def test_consultar_lista_vencimentos_da_primeira_pagina(portal):
+    matricula = matricula_com_contas(portal, 3)
+    pagina = SegundaViaHttp(portal.url()).consultar(matricula, '12345678900')
+    assert not pagina.alerta
+    vencimentos = SegundaViaHttp.vencimentos(pagina)
+    contas = portal.contas(matricula)
+    assert [v.data for v in vencimentos] == [conta[0] for conta in contas[:2]]
+    assert [v.linha for v in vencimentos] == [1, 2]
+    assert all(v.pagina == 1 for v in vencimentos)
+
+
+def test_proxima_pagina_desloca_linhas_pela_continuacao(portal):
+    matricula = matricula_com_contas(portal, 3)
+    motor = SegundaViaHttp(portal.url())
+    pagina = motor.proxima_pagina(motor.consultar(matricula, '12345678900'))
+    assert pagina is not None
+    vencimentos = SegundaViaHttp.vencimentos(pagina, 2)
+    contas = portal.contas(matricula)
+    assert [v.data for v in vencimentos] == [conta[0] for conta in contas[2:4]]
+    # A linha 'Continuação...' ocupa o índice 1 das páginas seguintes
+    assert vencimentos[0].linha == 2
+    assert all(v.pagina == 2 for v in vencimentos)
+
+
+def test_proxima_pagina_ausente_na_ultima(portal):
+    matricula = matricula_com_contas(portal, 1)
+    motor = SegundaViaHttp(portal.url())
+    pagina = motor.consultar(matricula, '12345678900')
+    paginas = 1
+    while True:
+        pagina = motor.proxima_pagina(pagina)
+        if pagina is None:
+            break
+        paginas += 1
+    assert paginas == (len(portal.contas(matricula)) + 1) // 2
+
+
+def test_baixar_grava_o_pdf_da_linha(portal, tmp_path):
+    matricula = matricula_com_contas(portal, 3)
+    motor = SegundaViaHttp(portal.url())
+    pagina = motor.proxima_pagina(motor.consultar(matricula, '12345678900'))
+    vencimento = SegundaViaHttp.vencimentos(pagina, 2)[0]
+    destino = str(tmp_path / 'conta.pdf')
+    for com_documento in (True, False):
+        assert motor.baixar(pagina, vencimento.linha, com_documento=com_documento, destino=destino) == destino
+        dados = validar_conta(destino, matricula, vencimento.texto)
+        assert dados.vencimento == vencimento.data
+        assert dados.matricula == matricula